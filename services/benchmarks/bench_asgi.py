@@ -0,0 +1,142 @@
+"""Load test the ASGI serving mode against the threaded WSGI serving mode.
+
+Seeds the database, then starts each server in a subprocess, and drives it
+with an asyncio HTTP/1.1 load generator holding --concurrency connections
+open at once, reporting the throughput and the p50 / p99 latencies. The
+difference shows with a networked PostgreSQL database, where each request
+waits on database round trips; an SQLite file is mostly CPU bound.
+
+Usage: python -m benchmarks.bench_asgi --rows 10000 --concurrency 200
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+from datastore.app import app_reset_db, create_app
+from datastore.bulk import bulk_insert
+
+
+# each path is requested in turn, a single entry, a page, and an aggregate
+PATHS = ["/datastore/1", "/datastore?limit=50", "/aggregate?group_by=bool"]
+
+
+def seed(rows: int):
+    """Reset the database, and insert rows Datastore entries."""
+    app = create_app()
+    with app.app_context():
+        app_reset_db()
+        entries = ({"email": f"user.{index}@gmail.com"} for index in range(rows))
+        for _ in bulk_insert(entries, app.config["DATASTORE_BULK_CHUNK_SIZE"]):
+            pass
+
+
+def serve(mode: str, port: int):
+    """Run the WSGI app on the threaded Werkzeug server, or the ASGI app on uvicorn."""
+    if mode == "wsgi":
+        # https://werkzeug.palletsprojects.com/en/3.0.x/serving/#werkzeug.serving.run_simple
+        from werkzeug.serving import run_simple
+
+        run_simple("127.0.0.1", port, create_app(), threaded=True)
+    else:
+        # https://www.uvicorn.org/deployment/#running-programmatically
+        import uvicorn
+
+        uvicorn.run(
+            "datastore.asgi:create_asgi_app",
+            factory=True,
+            port=port,
+            log_level="warning",
+        )
+
+
+async def fetch(port: int, path: str):
+    """Send one GET request on a new connection, and return the status code."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(port: int, concurrency: int, duration: float):
+    """Request PATHS from concurrency clients for duration seconds."""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset: int):
+        nonlocal errors
+        index = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, PATHS[index % len(PATHS)])
+            except OSError:
+                status = 0
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+            index += 1
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return latencies, errors
+
+
+async def wait_for_server(port: int, timeout: float = 30):
+    """Wait until the server accepts connections."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await fetch(port, "/")
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main():
+    """Seed the database, then load test each serving mode in turn."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--serve", choices=["wsgi", "asgi"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    seed(args.rows)
+    for mode in ("wsgi", "asgi"):
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_asgi"]
+            + ["--serve", mode, "--port", str(args.port)],
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_for_server(args.port))
+            latencies, errors = asyncio.run(
+                load(args.port, args.concurrency, args.duration)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+        print(
+            f"[INFO] {mode}: {len(latencies) / args.duration:8.1f} req/sec, "
+            f"p50 {statistics.median(latencies or [0]) * 1000:7.1f} ms, "
+            f"p99 {p99 * 1000:7.1f} ms, {errors} errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
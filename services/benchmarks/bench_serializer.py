@@ -0,0 +1,85 @@
+"""Benchmark the fast-path serializer against DatastoreSchema and jsonify().
+
+Verifies that both produce byte-identical JSON responses, in the compact and
+the debug (indented) formats, then times each of them.
+
+Usage: python -m benchmarks.bench_serializer --rows 10000
+"""
+import argparse
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from datastore.models.datastore_model import DatastoreModel
+from datastore.schemas import datastore_schemas
+from datastore.serializers import FastJSONProvider, dump_rows
+
+
+def make_entries(count: int):
+    """Build transient DatastoreModel entries, including non-ASCII and null values."""
+    start = datetime(2023, 7, 25, 16, 57, 36, 908339)
+    entries = []
+    for index in range(count):
+        entry = DatastoreModel(
+            email=f"user.{index}@gmail.com",
+            uuid=str(uuid.uuid4()),
+            bool="true" if index % 2 else "false",
+        )
+        entry.datastore_id = index + 1
+        entry.datetime = start + timedelta(seconds=index)
+        entries.append(entry)
+    # edge cases, a whole second with no microseconds, a null and Unicode
+    entries[0].datetime = datetime(2023, 7, 25, 16, 57, 36)
+    entries[-1].datetime = None
+    entries[-1].email = "jörg.müller@gmail.com"
+    return entries
+
+
+def main():
+    """Compare and time the Marshmallow and the fast-path serializers."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    entries = make_entries(args.rows)
+    baseline = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    for debug in (False, True):
+        app.debug = debug
+        with app.app_context():
+            expected = baseline.response(datastore_schemas.dump(entries)).get_data()
+            actual = fast.response(dump_rows(entries)).get_data()
+            # the Unicode row falls back to json, so check an ASCII-only page too
+            expected_ascii = baseline.response(
+                datastore_schemas.dump(entries[:-1])
+            ).get_data()
+            actual_ascii = fast.response(dump_rows(entries[:-1])).get_data()
+        assert actual == expected, "output differs from DatastoreSchema"
+        assert actual_ascii == expected_ascii, "output differs from DatastoreSchema"
+        print(f"[INFO] debug={debug}: output is byte-identical ({len(actual)} bytes)")
+
+    app.debug = False
+    entries = entries[:-1]
+    with app.app_context():
+        timings = {
+            "marshmallow+json": lambda: baseline.response(
+                datastore_schemas.dump(entries)
+            ),
+            "fast-path": lambda: fast.response(dump_rows(entries)),
+        }
+        for name, function in timings.items():
+            seconds = min(timeit.repeat(function, number=1, repeat=args.repeat))
+            print(
+                f"[INFO] {name:>16}: {seconds * 1000:8.2f} ms, "
+                f"{args.rows / seconds:12.0f} rows/sec"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Benchmark suite of the Datastore endpoints and hot functions, with regression checks.
+
+For each --rows size, the database is reset and loaded with synthetic rows,
+then every endpoint is requested --requests times in-process, with the Flask
+test client, reporting its throughput and p50 / p99 latencies. The test
+client skips the network and the WSGI server, so the numbers are the cost of
+the app and the database, and are comparable between runs on one machine.
+POST /datastore is also sent by --clients concurrent threads, with a commit
+per request, and with DATASTORE_GROUP_COMMIT, for the throughput of both.
+The micro-benchmarks time DatastoreSchema.dump(), the fast-path dump_row(),
+strtobool() and DatastoreModel construction, in nanoseconds per call.
+
+Runs against the DATABASE_URL database, e.g. an SQLite file, or a local
+PostgreSQL server without docker. The results are written as JSON with
+--output, and compared with a previous results file with --compare, which
+exits with status 1 if a throughput dropped, or a p99 latency or a
+micro-benchmark slowed down, by more than --threshold.
+
+Usage:
+    export DATABASE_URL=sqlite:////tmp/bench.db
+    python -m benchmarks.suite --rows 1000,100000,1000000 --output results.json
+    python -m benchmarks.suite --results results.json --compare baseline.json
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import timeit
+from datetime import datetime, timezone
+
+from datastore.app import app_reset_db, create_app
+from datastore.load import load_rows, synthetic_rows
+from datastore.models.datastore_model import DatastoreModel
+from datastore.schemas import datastore_schema
+from datastore.serializers import dump_row
+from datastore.utility import strtobool
+
+
+# the metrics compared by --compare, and whether a higher value is better
+REGRESSION_METRICS = {"throughput": True, "p99_ms": False, "ns_per_op": False}
+
+
+def seed(app, rows: int):
+    """Reset the database, and load rows synthetic Datastore entries."""
+    with app.app_context():
+        app_reset_db()
+        for _ in load_rows(
+            synthetic_rows(rows), app.config["DATASTORE_LOAD_CHUNK_SIZE"]
+        ):
+            pass
+
+
+def latency_stats(latencies: list) -> dict:
+    """Summarize request latencies, in seconds, as throughput and percentiles."""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / sum(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+    }
+
+
+def timed(client, method: str, path: str, status: int, **kwargs):
+    """Send one request, check its status code, and return it and its latency."""
+    start = time.perf_counter()
+    response = client.open(path, method=method, **kwargs)
+    elapsed = time.perf_counter() - start
+    if response.status_code != status:
+        raise RuntimeError(
+            f"{method} {path} returned {response.status_code}, expected {status}"
+        )
+    return response, elapsed
+
+
+def endpoint_benchmarks(app, rows: int, requests: int) -> dict:
+    """Time each endpoint requests times, against rows Datastore entries."""
+    seed(app, rows)
+    client = app.test_client()
+    ids = random.Random(0)
+    inputs = synthetic_rows(requests * 2)
+    latencies = {name: [] for name in ("get_one", "get_all", "post", "put", "delete")}
+    latencies["aggregate"] = []
+    created = []
+
+    for _ in range(requests):
+        path = f"/datastore/{ids.randint(1, rows)}"
+        latencies["get_one"].append(timed(client, "GET", path, 200)[1])
+        path = f"/datastore?after={ids.randint(0, rows - 1)}&limit=100"
+        latencies["get_all"].append(timed(client, "GET", path, 200)[1])
+        response, elapsed = timed(client, "POST", "/datastore", 201, json=next(inputs))
+        latencies["post"].append(elapsed)
+        created.append(response.json["datastore_id"])
+        path = f"/datastore/{ids.randint(1, rows)}"
+        latencies["put"].append(timed(client, "PUT", path, 200, json=next(inputs))[1])
+        path = "/aggregate?group_by=bool"
+        latencies["aggregate"].append(timed(client, "GET", path, 200)[1])
+    # delete the created entries, leaving rows entries
+    for datastore_id in created:
+        path = f"/datastore/{datastore_id}"
+        latencies["delete"].append(timed(client, "DELETE", path, 200)[1])
+
+    return {
+        f"endpoint.{name}.rows={rows}": latency_stats(values)
+        for name, values in latencies.items()
+    }
+
+
+def commit_benchmarks(rows: int, requests: int, clients: int) -> dict:
+    """Time requests POST /datastore from concurrent clients, per commit mode.
+
+    Each of the clients threads sends its share of the requests, and the
+    throughput is the requests over the time all of them took, once with a
+    commit per request, and once with the group commit writer.
+    """
+    results = {}
+    for mode, group_commit in (("per_request", False), ("group_commit", True)):
+        app = create_app({"DATASTORE_GROUP_COMMIT": group_commit})
+        seed(app, rows)
+        inputs = list(synthetic_rows(requests))
+        latencies, errors = [], []
+
+        def send(entries):
+            client = app.test_client()
+            try:
+                for entry in entries:
+                    path = "/datastore"
+                    latencies.append(timed(client, "POST", path, 201, json=entry)[1])
+            except Exception as error:
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=send, args=(inputs[index::clients],))
+            for index in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if group_commit:
+            app.extensions["datastore_group_commit"].close()
+        if errors:
+            raise errors[0]
+
+        stats = latency_stats(latencies)
+        stats.update(throughput=len(latencies) / elapsed, clients=clients)
+        results[f"endpoint.post_concurrent.{mode}.rows={rows}"] = stats
+    return results
+
+
+def micro_benchmarks(number: int, repeat: int = 5) -> dict:
+    """Time the serializers, strtobool() and model construction, per call."""
+    fields = next(synthetic_rows(1))
+    entry = DatastoreModel(**fields)
+    entry.datastore_id = 1
+    functions = {
+        "schema_dump": lambda: datastore_schema.dump(entry),
+        "dump_row": lambda: dump_row(entry),
+        "strtobool": lambda: strtobool("False"),
+        "model_construct": lambda: DatastoreModel(**fields),
+    }
+    results = {}
+    for name, function in functions.items():
+        # https://docs.python.org/3/library/timeit.html#timeit.Timer.repeat
+        best = min(timeit.repeat(function, number=number, repeat=repeat))
+        results[f"micro.{name}"] = {"ns_per_op": best / number * 1e9}
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Return the (name, metric, baseline, current) metrics that regressed.
+
+    A metric regresses when it is worse than the baseline by more than the
+    threshold fraction. Benchmarks missing from either results are skipped.
+    """
+    regressions = []
+    for name, metrics in current.items():
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            if metric not in metrics or metric not in baseline.get(name, {}):
+                continue
+            before, after = baseline[name][metric], metrics[metric]
+            change = (after - before) / before if before else 0.0
+            if (change < -threshold) if higher_is_better else (change > threshold):
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+def print_results(results: dict):
+    """Print one line per benchmark."""
+    for name, metrics in results.items():
+        if "ns_per_op" in metrics:
+            print(f"[INFO] {name:<50} {metrics['ns_per_op']:10.0f} ns/op")
+        else:
+            print(
+                f"[INFO] {name:<50} {metrics['throughput']:8.1f} req/sec, "
+                f"p50 {metrics['p50_ms']:7.2f} ms, p99 {metrics['p99_ms']:7.2f} ms"
+            )
+
+
+def main():
+    """Run, or load, the benchmarks, then write and compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="1000", help="comma separated sizes")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--number", type=int, default=10000)
+    parser.add_argument("--only", choices=["endpoints", "micro"])
+    parser.add_argument("--results", help="load results, rather than running")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as file:
+            report = json.load(file)
+    else:
+        app = create_app()
+        report = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "database": app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0],
+            },
+            "results": {},
+        }
+        if args.only != "micro":
+            for rows in (int(size) for size in args.rows.split(",")):
+                report["results"].update(endpoint_benchmarks(app, rows, args.requests))
+                report["results"].update(
+                    commit_benchmarks(rows, args.requests, args.clients)
+                )
+        if args.only != "endpoints":
+            report["results"].update(micro_benchmarks(args.number))
+    print_results(report["results"])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(baseline, report["results"], args.threshold)
+        for name, metric, before, after in regressions:
+            print(f"[ERROR] {name} {metric} regressed from {before:.2f} to {after:.2f}")
+        if regressions:
+            sys.exit(1)
+        print(f"[INFO] No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,21 @@
 """Utility script to provide a CLI for the Flask app."""
+import gzip
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
 from flask.cli import FlaskGroup
+from sqlalchemy.exc import IntegrityError
 
+from datastore.aggregate import rebuild_summary
 from datastore.app import app_reset_db, app_seed_db, create_app, db
+from datastore.changes import prune_changes
+from datastore.export import csv_header, export_chunks, format_rows
+from datastore.load import load_rows, read_csv, read_ndjson, synthetic_rows
 from datastore.models.datastore_model import DatastoreModel
 
 
@@ -28,5 +42,224 @@ def reinit_db():
     app_seed_db()
 
 
+@cli.command("rebuild_summary")
+def rebuild_summary_command():
+    """Recompute the aggregate summary table from the datastore table."""
+    rebuild_summary()
+
+
+@cli.command("prune_changes")
+@click.option(
+    "--days", type=float, default=7, help="Keep the changes of the last N days."
+)
+def prune_changes_command(days):
+    """Delete the old changes of the change feed, keeping the latest one."""
+    click.echo(f"[INFO] Pruned {prune_changes(days)} changes.")
+
+
+def read_files(paths, input_format: str = None):
+    """Read the input rows of CSV / NDJSON files, "-" for stdin, gzip if ".gz"."""
+    for path in paths:
+        name = path.removesuffix(".gz")
+        file_format = input_format or ("csv" if name.endswith(".csv") else "ndjson")
+        # https://click.palletsprojects.com/en/8.1.x/api/#click.open_file
+        if path.endswith(".gz"):
+            file = gzip.open(path, "rt", encoding="utf-8", newline="")
+        else:
+            file = click.open_file(path, encoding="utf-8")
+        with file:
+            yield from (read_csv if file_format == "csv" else read_ndjson)(file)
+
+
+def run_load(rows, chunk_size: int = None, keep_ids: bool = False):
+    """Load input rows, printing the progress, and the rows/sec of the load."""
+    chunk_size = chunk_size or current_app.config["DATASTORE_LOAD_CHUNK_SIZE"]
+    loaded, invalid = 0, 0
+    start = time.perf_counter()
+    try:
+        for chunk_loaded, chunk_invalid in load_rows(rows, chunk_size, keep_ids):
+            loaded += chunk_loaded
+            invalid += chunk_invalid
+            seconds = max(time.perf_counter() - start, 1e-9)
+            click.echo(f"[INFO] {loaded} rows, {loaded / seconds:.0f} rows/sec")
+    except IntegrityError:
+        db.session.rollback()
+        raise click.ClickException(
+            f"The email and UUID need to be unique, {loaded} rows were loaded."
+        )
+    seconds = max(time.perf_counter() - start, 1e-9)
+    click.echo(
+        f"[INFO] Loaded {loaded} rows in {seconds:.1f} seconds, "
+        f"{loaded / seconds:.0f} rows/sec, {invalid} invalid rows skipped."
+    )
+
+
+# https://click.palletsprojects.com/en/8.1.x/arguments/#file-arguments
+@cli.command("load_db")
+@click.argument("files", nargs=-1, type=click.Path(allow_dash=True))
+@click.option("--rows", type=int, default=0, help="Generate N synthetic rows.")
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="Input file format, by default from the file extension.",
+)
+@click.option("--chunk-size", type=int, help="Rows written per COPY or INSERT.")
+def load_db(files, rows, input_format, chunk_size):
+    """Load CSV / NDJSON files ("-" for stdin), or synthetic rows, into the database."""
+
+    def read_rows():
+        yield from read_files(files, input_format)
+        yield from synthetic_rows(rows)
+
+    run_load(read_rows(), chunk_size)
+
+
+@cli.command("restore_db")
+@click.argument("files", nargs=-1, required=True, type=click.Path(allow_dash=True))
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="Input file format, by default from the file extension.",
+)
+@click.option("--chunk-size", type=int, help="Rows written per COPY or INSERT.")
+def restore_db(files, input_format, chunk_size):
+    """Restore dump_db exports, keeping their datastore_id, into an empty database."""
+    run_load(read_files(files, input_format), chunk_size, keep_ids=True)
+
+
+@cli.command("dump_db")
+@click.argument("output", default="-", type=click.Path(allow_dash=True))
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="Output file format, by default from the file extension.",
+)
+@click.option("--after", type=int, help="Export the entries after a datastore_id.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(),
+    help="File recording the progress of the export, to resume it if interrupted.",
+)
+def dump_db(output, output_format, after, checkpoint):
+    """Export the datastore table to a CSV / NDJSON file, gzip if ".gz", or stdout.
+
+    Rows are written in datastore_id order, one chunk at a time. After each
+    chunk, the checkpoint file records the last datastore_id, and the size
+    of the output. Running the same command again resumes after it, and a
+    ".gz" output is written as one gzip member per chunk, so it stays valid.
+    """
+    name = output.removesuffix(".gz")
+    output_format = output_format or ("csv" if name.endswith(".csv") else "ndjson")
+    compress = output.endswith(".gz")
+    if checkpoint and output == "-":
+        raise click.UsageError("A checkpoint needs an output file.")
+
+    offset = 0
+    if checkpoint and os.path.exists(checkpoint) and os.path.exists(output):
+        with open(checkpoint) as file:
+            after, offset = (int(value) for value in file.read().split())
+        click.echo(f"[INFO] Resuming after datastore_id {after}.", err=output == "-")
+    # https://click.palletsprojects.com/en/8.1.x/api/#click.open_file
+    file = click.open_file(output, "r+b" if offset else "wb")
+
+    def write(text: str):
+        data = text.encode()
+        file.write(gzip.compress(data) if compress else data)
+
+    exported = 0
+    with file:
+        if offset:
+            # discard anything written after the last checkpoint
+            file.seek(offset)
+            file.truncate()
+        elif output_format == "csv":
+            write(csv_header())
+        chunk_size = current_app.config["DATASTORE_STREAM_CHUNK_SIZE"]
+        for rows in export_chunks(after, chunk_size):
+            write(format_rows(rows, output_format))
+            exported += len(rows)
+            if checkpoint:
+                file.flush()
+                with open(checkpoint, "w") as checkpoint_file:
+                    checkpoint_file.write(f"{rows[-1].datastore_id} {file.tell()}")
+    click.echo(f"[INFO] Exported {exported} rows.", err=output == "-")
+
+
+# a new process importing the app, creating it, and serving a first request
+COLD_START_SCRIPT = """
+import time
+start = time.perf_counter()
+from datastore.app import create_app
+create_app().test_client().get("/")
+print(time.perf_counter() - start)
+"""
+
+# milliseconds to a first response, on a warm disk cache, for "profile_startup"
+COLD_START_TARGET = 600
+
+
+def import_times(module: str) -> list:
+    """Return the (self, cumulative microseconds, name) imports of a new process."""
+    # https://docs.python.org/3/using/cmdline.html#cmdoption-X
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            imports.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return imports
+
+
+@cli.command("profile_startup")
+@click.option("--module", default="datastore.app", help="Module to profile the imports of.")
+@click.option("--top", type=int, default=15, help="Number of slowest imports listed.")
+@click.option("--runs", type=int, default=5, help="Number of cold starts timed.")
+@click.option(
+    "--target",
+    type=float,
+    default=COLD_START_TARGET,
+    help="Cold start target, in milliseconds, exit with 1 when over it.",
+)
+def profile_startup(module, top, runs, target):
+    """Report the slowest imports, and the median cold start time, of a worker.
+
+    Each measurement runs in a new Python process, as a new worker would.
+    """
+    imports = import_times(module)
+    click.echo(f"[INFO] Slowest imports of {module}, self / cumulative ms:")
+    for own, cumulative, name in sorted(imports, reverse=True)[:top]:
+        click.echo(f"  {own / 1000:7.1f} {cumulative / 1000:7.1f}  {name}")
+    total = next(cumulative for _, cumulative, name in imports if name == module)
+    click.echo(f"[INFO] Importing {module} took {total / 1000:.1f} ms.")
+
+    seconds = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", COLD_START_SCRIPT],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+    cold_start = statistics.median(seconds) * 1000
+    click.echo(
+        f"[INFO] Cold start to a first response, median of {runs}: "
+        f"{cold_start:.1f} ms, target {target:.0f} ms."
+    )
+    if cold_start > target:
+        raise click.ClickException("The cold start is over the target.")
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,275 @@
+"""Aggregate queries over the Datastore table, and its summary table.
+
+Counts, and min / max of the datastore_id and datetime columns, optionally
+filtered and grouped by bool, email domain, or an hour / day bucket of the
+datetime, are pushed down to the database as a single SELECT ... GROUP BY.
+
+When DATASTORE_AGGREGATE_SUMMARY is enabled, every write also updates the
+"datastore_summary" table of counts per day, bool and email domain, so counts
+can be served without scanning the "datastore" table.
+"""
+from collections import Counter
+from datetime import date as date_util
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import Date, DateTime, cast, event, func, literal_column, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from datastore.database import db, dialect_insert
+from datastore.filters import apply_filters, email_domain, parse_filters
+from datastore.models.datastore_model import DatastoreModel
+from datastore.models.summary_model import DatastoreSummaryModel
+
+
+GROUP_BY = ("bool", "domain", "hour", "day")
+
+
+# https://docs.sqlalchemy.org/en/20/core/compiler.html
+class datetime_bucket(FunctionElement):
+    """SQL expression truncating a datetime column to the start of its "unit"."""
+
+    type = DateTime()
+    inherit_cache = True
+    unit = None
+
+
+class hour_bucket(datetime_bucket):
+    """SQL expression truncating a datetime column to the start of its hour."""
+
+    inherit_cache = True
+    unit = "hour"
+
+
+class day_bucket(datetime_bucket):
+    """SQL expression truncating a datetime column to the start of its day."""
+
+    inherit_cache = True
+    unit = "day"
+
+
+class datetime_day(FunctionElement):
+    """SQL expression of the date of a datetime column."""
+
+    type = Date()
+    inherit_cache = True
+
+
+# https://www.sqlite.org/lang_datefunc.html
+SQLITE_BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+
+@compiles(datetime_bucket)
+def compile_datetime_bucket(element, compiler, **kw):
+    """Render a datetime bucket with strftime(), e.g. for SQLite."""
+    (column,) = element.clauses
+    format = literal_column(f"'{SQLITE_BUCKET_FORMATS[element.unit]}'")
+    return compiler.process(func.strftime(format, column), **kw)
+
+
+# https://www.postgresql.org/docs/current/functions-datetime.html#FUNCTIONS-DATETIME-TRUNC
+@compiles(datetime_bucket, "postgresql")
+def compile_datetime_bucket_postgresql(element, compiler, **kw):
+    """Render a datetime bucket with date_trunc() for PostgreSQL."""
+    (column,) = element.clauses
+    # the unit is rendered inline, so the GROUP BY matches the SELECT expression
+    unit = literal_column(f"'{element.unit}'")
+    return compiler.process(func.date_trunc(unit, column), **kw)
+
+
+@compiles(datetime_day)
+def compile_datetime_day(element, compiler, **kw):
+    """Render the date of a datetime with date(), e.g. for SQLite."""
+    (column,) = element.clauses
+    return compiler.process(func.date(column), **kw)
+
+
+@compiles(datetime_day, "postgresql")
+def compile_datetime_day_postgresql(element, compiler, **kw):
+    """Render the date of a datetime with a cast for PostgreSQL."""
+    (column,) = element.clauses
+    return compiler.process(cast(column, Date()), **kw)
+
+
+def json_ready(row) -> dict:
+    """Convert a result row to a dict, with dates and datetimes in ISO 8601 format."""
+    return {
+        name: value.isoformat() if isinstance(value, date_util) else value
+        for name, value in row._mapping.items()
+    }
+
+
+def table_query(group_by: str = None, filters: dict = None):
+    """Build the query to count, and min / max, the Datastore entries."""
+    keys = {
+        "bool": DatastoreModel.bool,
+        "domain": email_domain(DatastoreModel.email),
+        "hour": hour_bucket(DatastoreModel.datetime),
+        "day": day_bucket(DatastoreModel.datetime),
+    }
+    query = select(
+        func.count().label("count"),
+        func.min(DatastoreModel.datastore_id).label("min_datastore_id"),
+        func.max(DatastoreModel.datastore_id).label("max_datastore_id"),
+        func.min(DatastoreModel.datetime).label("min_datetime"),
+        func.max(DatastoreModel.datetime).label("max_datetime"),
+    )
+    query = apply_filters(query, filters or {})
+    if group_by is not None:
+        key = keys[group_by].label("key")
+        query = query.add_columns(key).group_by(key).order_by(key)
+    return query
+
+
+def summary_query(group_by: str = None, filters: dict = None):
+    """Build the query to count the Datastore entries from the summary table.
+
+    Only counts are available, filtered by bool, domain, and since / until
+    which apply to whole days, so "hour" grouping is not supported either.
+    """
+    if group_by == "hour":
+        raise ValueError("Invalid group_by, hour is not available from the summary.")
+    filters = filters or {}
+    for name in set(filters) - {"bool", "domain", "since", "until"}:
+        raise ValueError(f"Invalid {name}, it is not available from the summary.")
+    summary = DatastoreSummaryModel
+    query = select(func.coalesce(func.sum(summary.count), 0).label("count")).where(
+        summary.count > 0
+    )
+    if "bool" in filters:
+        query = query.where(summary.bool == filters["bool"])
+    if "domain" in filters:
+        query = query.where(summary.domain == filters["domain"])
+    if "since" in filters:
+        query = query.where(summary.day >= filters["since"].date())
+    if "until" in filters:
+        query = query.where(summary.day < filters["until"].date())
+    if group_by is not None:
+        key = {"bool": summary.bool, "domain": summary.domain, "day": summary.day}
+        key = key[group_by].label("key")
+        query = query.add_columns(key).group_by(key).order_by(key)
+    return query
+
+
+def aggregate_query(args, summary: bool = False):
+    """Build the aggregate query requested by the query string arguments.
+
+    The arguments are "group_by" (bool, domain, hour or day), the filters of
+    parse_filters(), and "source=summary" to read the counts from the summary
+    table, when it is maintained. Returns the query, the source and group_by,
+    or raises a ValueError.
+    """
+    group_by = args.get("group_by")
+    source = args.get("source", "table")
+    if group_by is not None and group_by not in GROUP_BY:
+        raise ValueError(f"Invalid group_by, it must be one of {', '.join(GROUP_BY)}.")
+    if source not in ("table", "summary"):
+        raise ValueError("Invalid source, it must be table or summary.")
+    if source == "summary" and not summary:
+        raise ValueError("Invalid source, the summary table is not enabled.")
+    filters = parse_filters(args)
+    if source == "summary":
+        return summary_query(group_by, filters), source, group_by
+    return table_query(group_by, filters), source, group_by
+
+
+def aggregate_result(rows, source: str, group_by: str = None) -> dict:
+    """Build the JSON-ready result of an aggregate query from its rows."""
+    groups = [json_ready(row) for row in rows]
+    if group_by is None:
+        return {"source": source, **groups[0]}
+    return {"source": source, "group_by": group_by, "groups": groups}
+
+
+def summary_key(email: str, bool, datetime):
+    """Return the (day, bool, domain) summary key of a Datastore entry, or None."""
+    if email is None or bool is None or datetime is None:
+        return None
+    return (datetime.date(), bool, email.partition("@")[2].lower())
+
+
+def update_summary(connection, added=(), removed=()):
+    """Add and remove rows, with email, bool and datetime, from the summary counts.
+
+    Uses an INSERT ... ON CONFLICT DO UPDATE per changed key, on the connection
+    of the current transaction, so the summary commits with the write itself.
+    """
+    counts = Counter()
+    for rows, sign in ((added, 1), (removed, -1)):
+        for row in rows:
+            key = summary_key(row.email, row.bool, row.datetime)
+            if key is not None:
+                counts[key] += sign
+    deltas = [
+        {"day": day, "bool": bool, "domain": domain, "count": count}
+        for (day, bool, domain), count in counts.items()
+        if count
+    ]
+    if not deltas:
+        return
+
+    insert = dialect_insert(connection.dialect.name)(DatastoreSummaryModel)
+    statement = insert.on_conflict_do_update(
+        index_elements=[
+            DatastoreSummaryModel.day,
+            DatastoreSummaryModel.bool,
+            DatastoreSummaryModel.domain,
+        ],
+        set_={"count": DatastoreSummaryModel.__table__.c.count + insert.excluded.count},
+    )
+    connection.execute(statement, deltas)
+
+
+def summary_enabled() -> bool:
+    """Check if the summary table is maintained by the current app."""
+    return current_app.config["DATASTORE_AGGREGATE_SUMMARY"]
+
+
+def rebuild_summary():
+    """Recompute the summary table from the "datastore" table, and commit it."""
+    day = datetime_day(DatastoreModel.datetime)
+    domain = email_domain(DatastoreModel.email)
+    query = (
+        select(day, DatastoreModel.bool, domain, func.count())
+        .where(DatastoreModel.datetime.is_not(None), DatastoreModel.bool.is_not(None))
+        .group_by(day, DatastoreModel.bool, domain)
+    )
+    db.session.execute(db.delete(DatastoreSummaryModel))
+    db.session.execute(
+        db.insert(DatastoreSummaryModel).from_select(
+            ["day", "bool", "domain", "count"], query
+        )
+    )
+    db.session.commit()
+
+
+# https://docs.sqlalchemy.org/en/20/orm/events.html#mapper-events
+# ORM writes from the DatastoreController update the summary in their flush
+@event.listens_for(DatastoreModel, "after_insert")
+def summary_after_insert(mapper, connection, target):
+    """Count a newly inserted Datastore entry in the summary."""
+    if summary_enabled():
+        update_summary(connection, added=[target])
+
+
+@event.listens_for(DatastoreModel, "after_update")
+def summary_after_update(mapper, connection, target):
+    """Move an updated Datastore entry from its previous summary key to its new one."""
+    if not summary_enabled():
+        return
+    previous = {}
+    for name in ("email", "bool", "datetime"):
+        # https://docs.sqlalchemy.org/en/20/orm/session_api.html#sqlalchemy.orm.attributes.get_history
+        history = db.inspect(target).attrs[name].history
+        previous[name] = (
+            history.deleted[0] if history.deleted else getattr(target, name)
+        )
+    update_summary(connection, added=[target], removed=[SimpleNamespace(**previous)])
+
+
+@event.listens_for(DatastoreModel, "after_delete")
+def summary_after_delete(mapper, connection, target):
+    """Remove a deleted Datastore entry from the summary."""
+    if summary_enabled():
+        update_summary(connection, removed=[target])
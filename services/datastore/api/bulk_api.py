@@ -0,0 +1,156 @@
+"""Flask REST API bulk create, upsert, delete and read endpoints for the Datastore."""
+import json
+
+from flask import current_app, jsonify, make_response, request
+from flask_restful import Resource
+from sqlalchemy import select
+
+from datastore.api.datastore_api import conditional_response, multi_get, parse_multi_get
+from datastore.bulk import bulk_insert, delete_ids, delete_matching
+from datastore.filters import apply_filters, parse_filters
+from datastore.models.datastore_model import DatastoreModel
+
+
+def iter_ndjson(stream):
+    """Yield one parsed JSON value per non-blank line, or None if a line is malformed."""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def request_rows():
+    """Return the rows of a JSON array, or NDJSON, request body.
+
+    Raises a ValueError if a JSON body is not an array.
+    """
+    if request.mimetype == "application/x-ndjson":
+        # read the request body line by line, rather than all at once
+        return iter_ndjson(request.stream)
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError("Invalid data, it must be a JSON array.")
+    return rows
+
+
+class DatastoreBulkController(Resource):
+    """flask-restful Controller for bulk writes to the Datastore."""
+
+    def post(self):
+        """Create many Datastore entries, from a JSON array or an NDJSON stream.
+
+        Rows are inserted in chunks of DATASTORE_BULK_CHUNK_SIZE, each with a
+        single INSERT ... ON CONFLICT statement, and "?mode=upsert" updates
+        entries with an existing uuid. A status is reported for every row, so
+        one conflicting or invalid row does not fail the whole batch.
+        """
+        mode = request.args.get("mode", "create")
+        if mode not in ("create", "upsert"):
+            return make_response(
+                jsonify(message="Invalid mode, it must be create or upsert."), 400
+            )
+        try:
+            rows = request_rows()
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+
+        results = sorted(
+            bulk_insert(
+                rows,
+                chunk_size=current_app.config["DATASTORE_BULK_CHUNK_SIZE"],
+                upsert=mode == "upsert",
+            ),
+            key=lambda result: result["index"],
+        )
+        counts = {"created": 0, "upserted": 0, "conflict": 0, "invalid": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        return jsonify(counts=counts, results=results)
+
+
+class DatastoreBulkDeleteController(Resource):
+    """flask-restful Controller for bulk deletes from the Datastore."""
+
+    def post(self):
+        """Delete many Datastore entries, by datastore_id, or matching filters.
+
+        The JSON body is {"ids": [1, 2, 3]}, or {"filters": {...}} with the
+        query string filters of GET /datastore, e.g. {"until": "2023-01-01"}
+        to delete the entries older than a datetime. Entries are deleted in
+        batches of DATASTORE_DELETE_BATCH_SIZE, each with one DELETE ...
+        RETURNING statement in its own transaction, to keep locks short.
+        """
+        try:
+            batches = delete_batches(
+                request.get_json(silent=True),
+                current_app.config["DATASTORE_DELETE_BATCH_SIZE"],
+            )
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        counts = list(batches)
+        return jsonify(deleted=sum(counts), batches=len(counts))
+
+
+def delete_batches(data, batch_size: int):
+    """Return the generator of the batch deletes of a bulk delete JSON body.
+
+    Raises a ValueError for an invalid body.
+    """
+    if not isinstance(data, dict) or ("ids" in data) == ("filters" in data):
+        raise ValueError("Invalid data, it must be a JSON object of ids or filters.")
+    if "ids" in data:
+        return delete_ids(parse_delete_ids(data["ids"]), batch_size)
+    filters = parse_delete_filters(data["filters"])
+    query = apply_filters(select(DatastoreModel.datastore_id), filters)
+    return delete_matching(query, batch_size)
+
+
+def parse_delete_ids(ids) -> list:
+    """Check the datastore_ids of a bulk delete, raising a ValueError if invalid."""
+    if not isinstance(ids, list) or not all(
+        type(datastore_id) is int for datastore_id in ids
+    ):
+        raise ValueError("Invalid ids, it must be an array of int numbers.")
+    return ids
+
+
+def parse_delete_filters(filters) -> dict:
+    """Parse the filters of a bulk delete, raising a ValueError if invalid."""
+    if not isinstance(filters, dict) or not all(
+        isinstance(value, str) for value in filters.values()
+    ):
+        raise ValueError("Invalid filters, it must be an object of strings.")
+    filters = parse_filters(filters)
+    # deleting every entry needs an explicit filter
+    if not filters:
+        raise ValueError("Invalid filters, at least one is required.")
+    return filters
+
+
+class DatastoreMultiGetController(Resource):
+    """flask-restful Controller for bulk reads from the Datastore."""
+
+    def post(self):
+        """Return many Datastore entries, by datastore_id, or uuid, in request order.
+
+        The JSON body is {"ids": [1, 2, 3]}, or {"uuids": [...]}, of up to
+        DATASTORE_MAX_PAGE_SIZE values. The entries are read with one query,
+        like GET /datastore?ids=1,2,3, and each missing entry is reported as
+        {"datastore_id": 2, "found": false}, or {"uuid": ..., "found": false}.
+        """
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return make_response(
+                jsonify(
+                    message="Invalid data, it must be a JSON object of ids or uuids."
+                ),
+                400,
+            )
+        try:
+            key, values = parse_multi_get(data.get("ids"), data.get("uuids"))
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        return conditional_response(multi_get(key, values))
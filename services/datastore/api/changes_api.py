@@ -0,0 +1,71 @@
+"""Flask REST API change feed endpoint for the Datastore."""
+from flask import current_app, jsonify, make_response, request, url_for
+from flask_restful import Resource
+
+from datastore.api.datastore_api import get_int_arg, get_page_size
+from datastore.changes import (
+    changes_enabled,
+    latest_change_id,
+    oldest_change_id,
+    poll_changes,
+)
+
+
+class DatastoreChangesController(Resource):
+    """flask-restful Controller for the change feed of the Datastore."""
+
+    def get(self):
+        """Return the Datastore entries changed since a cursor, oldest change first.
+
+        "?since=<change_id>" is the "last" change_id of the previous response,
+        0 for every change, or "now" for the latest change_id, e.g. before
+        copying the table with GET /datastore. Each change has the current
+        entry, or "deleted": true for a tombstone. "?wait=<seconds>" long-polls
+        for up to DATASTORE_CHANGES_MAX_WAIT seconds, while there is no change.
+        When more changes follow, "more" is true, and a "Link" header with
+        rel="next" points to the next page. An HTTP 410 means the changes after
+        the cursor were pruned, and the table has to be copied again.
+        """
+        if not changes_enabled():
+            return make_response(
+                jsonify(message="The change feed is not enabled."), 404
+            )
+        try:
+            since, page_size, wait = changes_args(request.args)
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+
+        oldest = oldest_change_id()
+        if oldest is not None and since < oldest - 1:
+            return make_response(
+                jsonify(message="The changes since the cursor were pruned."), 410
+            )
+        timeout = min(wait, current_app.config["DATASTORE_CHANGES_MAX_WAIT"])
+        changes, last, more = poll_changes(since, page_size, timeout)
+        return changes_response(changes, last, more, page_size)
+
+
+def changes_args(args) -> tuple:
+    """Parse the since cursor, the page size and the wait seconds of a request.
+
+    Raises a ValueError for an invalid argument.
+    """
+    if args.get("since") == "now":
+        since = latest_change_id()
+    else:
+        since = get_int_arg(args, "since", minimum=0) or 0
+    limit = get_int_arg(args, "limit", minimum=1)
+    wait = get_int_arg(args, "wait", minimum=0) or 0
+    return since, get_page_size(limit), wait
+
+
+def changes_response(changes: list, last: int, more: bool, page_size: int):
+    """Return the JSON response of a page of changes, with its next page Link."""
+    response = jsonify(changes=changes, last=last, more=more)
+    if more:
+        # https://datatracker.ietf.org/doc/html/rfc8288
+        args = request.args.to_dict()
+        args.update(since=last, limit=page_size)
+        next_url = url_for(request.endpoint, _external=True, **args)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
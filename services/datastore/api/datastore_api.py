@@ -4,67 +4,386 @@ This script does the setup and configuration for the Flask webapp, including
 retrieving the configuration class from config.py, setting up the Postgres
 connection for SQLAlchemy, the Datastore Model, and Datastore Controller.
 """
-import uuid
-from datetime import datetime
+import queue
+from functools import partial
 
-from flask import jsonify, make_response, request
+from flask import (
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+    url_for,
+)
 from flask_restful import Resource
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql import text
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.http import generate_etag
 
 # from database import db, ma
+from datastore.aggregate import aggregate_query, aggregate_result, summary_enabled
+from datastore.bulk import CONFLICT_MESSAGE, delete_batch, row_values
+from datastore.cache import cache
+from datastore.changes import record_changes
+from datastore.compression import coded_etag
 from datastore.database import db
-from datastore.models.datastore_model import (
-    DatastoreModel,
-    datastore_schema,
-    datastore_schemas,
+from datastore.filters import (
+    apply_filters,
+    apply_sort,
+    cursor_column,
+    encode_cursor,
+    parse_cursor,
+    parse_filters,
+    parse_sort,
+)
+from datastore.models.datastore_model import DatastoreModel
+from datastore.ratelimit import reject
+from datastore.representations import (
+    if_match_contains,
+    negotiate,
+    represent,
+    variant_etag,
 )
-from datastore.utility import strtobool
+from datastore.serializers import DATASTORE_COLUMNS, dump_row, dump_rows
+from datastore.validation import FIELD_PARSERS, ValidationError, parse_entry, parse_uuid
+
+
+# media types of the supported GET /datastore?stream=<format> values
+STREAM_MIMETYPES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+def get_int_arg(args, name: str, minimum: int = 0):
+    """Read an optional integer query string argument, or raise a ValueError."""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}, it must be an int number.")
+    if number < minimum:
+        raise ValueError(f"Invalid {name}, it must be at least {minimum}.")
+    return number
+
+
+def keyset_query(after: str = None, filters: dict = None, sort: str = None):
+    """Build a filtered and sorted SELECT of Datastore entries, after a cursor.
+
+    The cursor is an "?after=" argument, see encode_cursor(), which reads the
+    "sort_value" column of the last row. Raises a ValueError if the sort
+    order, or the cursor, is not valid.
+    """
+    column, descending = parse_sort(sort)
+    columns = DATASTORE_COLUMNS
+    if column is not DatastoreModel.datastore_id:
+        columns += (cursor_column(column).label("sort_value"),)
+    # https://docs.sqlalchemy.org/en/20/orm/queryguide/select.html
+    query = apply_filters(select(*columns), filters or {})
+    return apply_sort(query, column, descending, parse_cursor(after, column))
+
+
+def collection_args(args) -> tuple:
+    """Parse the limit, the filters and the keyset query of a page of entries.
+
+    Raises a ValueError for an invalid argument.
+    """
+    limit = get_int_arg(args, "limit", minimum=1)
+    filters = parse_filters(args)
+    query = keyset_query(args.get("after"), filters, args.get("sort"))
+    return limit, filters, query
+
+
+def get_page_size(limit: int = None) -> int:
+    """Return the size of a page of limit entries, or of the default size."""
+    config = current_app.config
+    return min(
+        limit or config["DATASTORE_PAGE_SIZE"], config["DATASTORE_MAX_PAGE_SIZE"]
+    )
+
+
+def page_response(results: list, page_size: int):
+    """Return a page of entries, with a Link to the next page if a result follows."""
+    response = conditional_response(data=dump_rows(results[:page_size]))
+    if len(results) > page_size:
+        # https://datatracker.ietf.org/doc/html/rfc8288
+        args = request.args.to_dict()
+        after = encode_cursor(results[page_size - 1], request.args.get("sort"))
+        args.update(after=after, limit=page_size)
+        next_url = url_for(request.endpoint, _external=True, **args)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+
+def update_statement(datastore_id: int, fields: dict):
+    """Build an UPDATE ... RETURNING of some fields of a Datastore entry.
+
+    The version is incremented, like the ORM does for a versioned update, and
+    returned with the columns, for the cache invalidation.
+    """
+    # https://docs.sqlalchemy.org/en/20/core/dml.html#sqlalchemy.sql.expression.update
+    table = DatastoreModel.__table__
+    return (
+        update(table)
+        .where(table.c.datastore_id == datastore_id)
+        .values(**fields, version=table.c.version + 1)
+        .returning(
+            *(table.c[column.key] for column in DATASTORE_COLUMNS), table.c.version
+        )
+    )
+
+
+def conditional_response(body: bytes = None, data=None):
+    """Return a response with a strong ETag, or a 304 if it matches If-None-Match.
+
+    The response is the JSON body, or its data in the representation the Accept
+    header prefers. Every representation of an entry has the ETag of its JSON
+    body with a suffix, see variant_etag(), and If-Match is checked against it,
+    whatever representation was read.
+    """
+    mediatype = negotiate()
+    if mediatype == "application/json":
+        if body is None:
+            body = jsonify(data).get_data()
+        response = current_app.response_class(body, mimetype=mediatype)
+    else:
+        if data is None:
+            data = current_app.json.loads(body)
+        response = represent(data, mediatype)
+    # https://werkzeug.palletsprojects.com/en/3.0.x/wrappers/#werkzeug.wrappers.Response.make_conditional
+    if body is None:
+        response.add_etag()
+    else:
+        response.set_etag(variant_etag(generate_etag(body), mediatype))
+    response.set_etag(coded_etag(response.get_etag()[0], request.if_none_match))
+    response.vary.add("Accept")
+    return response.make_conditional(request)
+
+
+def entry_body(row) -> bytes:
+    """Serialize a Datastore entry as the JSON body of GET /datastore/<id>, and cache it.
+
+    The row, or entity, has to have its version, which the cache checks.
+    """
+    body = jsonify(dump_row(row)).get_data()
+    cache.set(row.datastore_id, body, row.version)
+    return body
+
+
+def parse_multi_get(ids=None, uuids=None):
+    """Validate the ids, or the uuids, of a multi-get, or raise a ValidationError.
+
+    Returns the name of the key column, datastore_id or uuid, and the values.
+    """
+    if (ids is None) == (uuids is None):
+        raise ValidationError("Invalid data, it must have ids or uuids.")
+    name, values = ("ids", ids) if uuids is None else ("uuids", uuids)
+    maximum = current_app.config["DATASTORE_MAX_PAGE_SIZE"]
+    if not isinstance(values, list) or not 0 < len(values) <= maximum:
+        raise ValidationError(
+            f"Invalid {name}, it must be an array of 1 to {maximum} values."
+        )
+    if uuids is not None:
+        return "uuid", [parse_uuid(value) for value in uuids]
+    if not all(type(value) is int for value in ids):
+        raise ValidationError("Invalid ids, it must be an array of int numbers.")
+    return "datastore_id", ids
+
+
+def multi_get_args(args):
+    """Validate the "?ids=1,2,3", or "?uuids=...", query string of a multi-get.
+
+    Returns the name of the key column and the values, like parse_multi_get().
+    """
+    ids = args.get("ids")
+    if ids is not None:
+        try:
+            ids = [int(value) for value in ids.split(",")]
+        except ValueError:
+            raise ValidationError("Invalid ids, it must be a list of int numbers.")
+    uuids = args.get("uuids")
+    return parse_multi_get(ids, uuids.split(",") if uuids is not None else None)
+
+
+def multi_get(key: str, values: list, session=None) -> bytes:
+    """Return the JSON array of the Datastore entries of ids, or uuids, in order.
+
+    Entries are the cached bodies of GET /datastore/<id>, and the others are
+    read with a single SELECT ... WHERE <key> IN (...), and cached. An entry
+    which does not exist is a {"<key>": <value>, "found": false} marker. The
+    session is db.session by default, or e.g. the sync session of an
+    AsyncSession, in its run_sync().
+    """
+    session = session or db.session
+    bodies = {}
+    unique = dict.fromkeys(values)
+    if key == "datastore_id":
+        for value in unique:
+            body = cache.get(value)
+            if body is not None:
+                bodies[value] = body
+    missing = [value for value in unique if value not in bodies]
+    if missing:
+        # https://docs.sqlalchemy.org/en/20/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.in_
+        column = getattr(DatastoreModel, key)
+        query = select(*DATASTORE_COLUMNS, DatastoreModel.version).where(
+            column.in_(missing)
+        )
+        for row in session.execute(query):
+            bodies[getattr(row, key)] = entry_body(row)
+
+    # a response body ends with a newline, which is not part of its JSON value
+    items = (bodies.get(value) or not_found(key, value) for value in values)
+    return b"[" + b",".join(item.rstrip(b"\n") for item in items) + b"]"
+
+
+def not_found(key: str, value) -> bytes:
+    """Serialize the marker of an entry missing from a multi-get, like an entry."""
+    value = value if key == "datastore_id" else str(value)
+    return current_app.json.response({key: value, "found": False}).get_data()
+
+
+def stream_chunks(query, stream: str):
+    """Yield the rows of a query as a JSON array, or NDJSON, one chunk of rows at a time."""
+    dumps = partial(current_app.json.dumps, separators=(",", ":"))
+    partitions = db.session.execute(query).partitions()
+    if stream == "ndjson":
+        for rows in partitions:
+            yield "".join(dumps(dump_row(row)) + "\n" for row in rows)
+        return
+    separator = "["
+    for rows in partitions:
+        yield separator + ",".join(dumps(dump_row(row)) for row in rows)
+        separator = ","
+    yield "]" if separator == "," else "[]"
+
+
+def precondition_failed(entry: DatastoreModel) -> bool:
+    """Check if the If-Match header of the request does not match an entry's ETag."""
+    # https://datatracker.ietf.org/doc/html/rfc9110#name-if-match
+    if_match = request.if_match
+    if not if_match:
+        return False
+    etag = generate_etag(jsonify(dump_row(entry)).get_data())
+    return not if_match_contains(if_match, etag)
+
+
+def precondition_failed_response():
+    """Return the HTTP 412 response for a failed If-Match, or a concurrent update."""
+    return make_response(
+        jsonify(message="The datastore entry has been modified, reload it."), 412
+    )
 
 
 class DatastoreController(Resource):
     """flask-restful Controller for the Datastore."""
 
     def get(self, datastore_id: int = -1):
-        """Read a Datastore entry by it's ID, or return all Datastore entries, as JSON."""
-        data = {}
-        # if a datastore_id isn't supplied, return all entries
+        """Read a Datastore entry by it's ID, or return a page of Datastore entries.
+
+        Entries are JSON, or NDJSON, CSV or MessagePack, selected by the Accept header.
+        """
+        # if a datastore_id isn't supplied, return a page of entries
         if datastore_id == -1:
-            results = DatastoreModel.query.all()
-            # ensure we have results
-            if not results:
-                return make_response(
-                    jsonify(message="No datastore data has been created."), 404
-                )
-            data = datastore_schemas.dump(results)
-        else:
+            return self.get_collection()
+
+        # serve the cached JSON body, which put() and delete() invalidate
+        body = cache.get(datastore_id)
+        if body is None:
             # Attempt to retrieve the Datastore entry, or fail with an HTTP 404.
             # A generic 404 message is used to prevent enumeration attacks.
             # https://owasp.org/Top10/A07_2021-Identification_and_Authentication_Failures/
             # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/api/#flask_sqlalchemy.SQLAlchemy.get_or_404
-            results = db.get_or_404(DatastoreModel, datastore_id)
-            data = datastore_schema.dump(results)
-        return jsonify(data)
-
-    def get_json_data(self):
-        """Attempt to read the JSON data."""
-        # read the JSON data
-        email = request.json.get("email", "")
-        uuid = request.json.get("uuid", "")
-        bool = request.json.get("bool", "")
-        datetime = request.json.get("datetime", "")
-
-        return {
-            "email": email,
-            "uuid": uuid,
-            "bool": bool,
-            "datetime": datetime,
-        }
+            body = entry_body(db.get_or_404(DatastoreModel, datastore_id))
+        return conditional_response(body)
+
+    def get_collection(self):
+        """Return a page of Datastore entries, in the representation of the Accept header.
+
+        Entries are filtered by the arguments of parse_filters(), and ordered by
+        "?sort=<column>", or "-<column>" for descending, then datastore_id.
+        Pages use a keyset cursor, "?after=<cursor>&limit=<n>", rather than an
+        OFFSET, so every page is an index range scan. The cursor is the
+        datastore_id of the last entry, or an opaque token of its sort column
+        value for other sort orders. When more entries exist, a "Link" header
+        with rel="next" points to the next page.
+        """
+        if "ids" in request.args or "uuids" in request.args:
+            return self.get_many()
+        try:
+            limit, filters, query = collection_args(request.args)
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+
+        if "stream" in request.args:
+            return self.stream_collection(request.args["stream"], query, limit)
+
+        page_size = get_page_size(limit)
+        # read one extra row to know if there is a next page
+        results = db.session.execute(query.limit(page_size + 1)).all()
+        # ensure we have results
+        if not results and "after" not in request.args and not filters:
+            return make_response(
+                jsonify(message="No datastore data has been created."), 404
+            )
+        return page_response(results, page_size)
+
+    def get_many(self):
+        """Return the Datastore entries of "?ids=1,2,3", or "?uuids=...", in order.
+
+        See multi_get(), and POST /datastore/_mget for longer lists.
+        """
+        try:
+            key, values = multi_get_args(request.args)
+        except ValidationError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        return conditional_response(multi_get(key, values))
+
+    def stream_collection(self, stream: str, query, limit: int = None):
+        """Stream Datastore entries as a JSON array or NDJSON, with flat memory use.
+
+        Rows are read from a server-side cursor in chunks of
+        DATASTORE_STREAM_CHUNK_SIZE, and each chunk is written to the client
+        before the next one is fetched.
+        """
+        if stream not in STREAM_MIMETYPES:
+            return make_response(
+                jsonify(message="Invalid stream, it must be json or ndjson."), 400
+            )
+
+        # https://docs.sqlalchemy.org/en/20/orm/queryguide/api.html#fetching-large-result-sets-with-yield-per
+        query = query.execution_options(
+            yield_per=current_app.config["DATASTORE_STREAM_CHUNK_SIZE"]
+        )
+        if limit is not None:
+            query = query.limit(limit)
+
+        # https://flask.palletsprojects.com/en/2.3.x/patterns/streaming/
+        return Response(
+            stream_with_context(stream_chunks(query, stream)),
+            mimetype=STREAM_MIMETYPES[stream],
+        )
+
+    def get_json_data(self, required=("email",)):
+        """Read and validate the JSON data, or raise a ValidationError."""
+        return parse_entry(request.get_json(silent=True), required)
 
     def post(self):
-        """Create a new Datastore entry."""
+        """Create a new Datastore entry.
+
+        With DATASTORE_GROUP_COMMIT, the entry is inserted by the group commit
+        writer, in a transaction shared with the concurrent requests.
+        """
+        writer = current_app.extensions.get("datastore_group_commit")
+        if writer is not None:
+            return self.post_group_commit(writer)
         # read the JSON data, and pass it to the init function using kwargs
-        datastore_entry = DatastoreModel(**self.get_json_data())
+        try:
+            datastore_entry = DatastoreModel(**self.get_json_data())
+        except ValidationError as error:
+            return make_response(jsonify(message=str(error)), 400)
         # datastore_entry = datastore_schema.load(self.get_json_data())
         db.session.add(datastore_entry)
         try:
@@ -76,7 +395,24 @@ class DatastoreController(Resource):
             )
 
         # return as JSON
-        return make_response(jsonify(datastore_schema.dump(datastore_entry)), 201)
+        return make_response(jsonify(dump_row(datastore_entry)), 201)
+
+    def post_group_commit(self, writer):
+        """Create a new Datastore entry, with the group commit writer."""
+        try:
+            values = row_values(request.get_json(silent=True))
+        except ValidationError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        try:
+            future = writer.submit(values)
+        except queue.Full:
+            return reject(
+                "The service is overloaded, retry later.", 503, 1, "write_queue"
+            )
+        row = future.result()
+        if row is None:
+            return make_response(jsonify(message=CONFLICT_MESSAGE), 404)
+        return make_response(jsonify(dump_row(row)), 201)
 
     def put(self, datastore_id: int = -1):
         """Update an existing Datastore entry."""
@@ -86,17 +422,70 @@ class DatastoreController(Resource):
                 jsonify(message="Invalid datastore_id, it must be an int number."), 404
             )
 
+        # read the JSON data, a PUT replaces every field
+        try:
+            fields = self.get_json_data(required=FIELD_PARSERS)
+        except ValidationError as error:
+            return make_response(jsonify(message=str(error)), 400)
+
+        return self.update_entry(datastore_id, fields)
+
+    def patch(self, datastore_id: int = -1):
+        """Update the given fields of an existing Datastore entry.
+
+        The entry is updated, and returned, by a single UPDATE ... RETURNING
+        statement, without reading it first. Only an If-Match header, or the
+        summary table, which need the current values, read it with the ORM.
+        """
+        # ensure we have a valid datastore_id
+        if datastore_id == -1:
+            return make_response(
+                jsonify(message="Invalid datastore_id, it must be an int number."), 404
+            )
+
+        # read the JSON data, a PATCH sets any of the fields
+        try:
+            fields = self.get_json_data(required=())
+        except ValidationError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        if not fields:
+            return make_response(
+                jsonify(message="Invalid data, it must set at least one field."), 400
+            )
+        if request.if_match or summary_enabled():
+            return self.update_entry(datastore_id, fields)
+        return self.patch_entry(datastore_id, fields)
+
+    def patch_entry(self, datastore_id: int, fields: dict):
+        """Update the given fields of a Datastore entry with one UPDATE ... RETURNING."""
+        try:
+            # https://docs.sqlalchemy.org/en/20/tutorial/data_update.html#update-delete-returning
+            row = db.session.execute(update_statement(datastore_id, fields)).first()
+            if row is not None:
+                record_changes(db.session, [row.datastore_id])
+            db.session.commit()
+        except IntegrityError:
+            # https://docs-sqlalchemy.readthedocs.io/ko/latest/core/exceptions.html
+            return make_response(
+                jsonify(message="The email and UUID need to be unique."), 404
+            )
+        if row is None:
+            # the same generic 404 as db.get_or_404()
+            abort(404)
+        cache.delete(datastore_id, row.version)
+        response = jsonify(dump_row(row))
+        response.add_etag()
+        return response
+
+    def update_entry(self, datastore_id: int, fields: dict):
+        """Read a Datastore entry, check If-Match, and overwrite the given fields."""
         # attempt to get the existing Datastore entry, or return an HTTP 404
         datastore_entry = db.get_or_404(DatastoreModel, datastore_id)
+        if precondition_failed(datastore_entry):
+            return precondition_failed_response()
 
-        # read the JSON data, update the DatastoreModel
-        json = self.get_json_data()
-        datastore_entry.email = json["email"]
-        datastore_entry.uuid = uuid.UUID(json["uuid"])
-        datastore_entry.bool = strtobool(json["bool"])
-        datastore_entry.datetime = datetime.strptime(
-            json["datetime"], "%Y-%m-%dT%H:%M:%S.%f"
-        )
+        # update the DatastoreModel
+        datastore_entry.update(**fields)
 
         try:
             # https://docs.sqlalchemy.org/en/20/tutorial/orm_data_manipulation.html#updating-orm-objects-using-the-unit-of-work-pattern
@@ -106,19 +495,48 @@ class DatastoreController(Resource):
             return make_response(
                 jsonify(message="The email and UUID need to be unique."), 404
             )
-        return datastore_schema.jsonify(datastore_entry)
+        except StaleDataError:
+            # the entry was updated or deleted since it was read
+            db.session.rollback()
+            return precondition_failed_response()
+        cache.delete(datastore_id, datastore_entry.version)
+        response = jsonify(dump_row(datastore_entry))
+        response.add_etag()
+        return response
 
     def delete(self, datastore_id: int = -1):
-        """Delete a Datastore entry."""
+        """Delete a Datastore entry.
+
+        The entry is deleted with a single DELETE ... RETURNING statement, unless
+        an If-Match header is sent, which needs the entry to be read first.
+        """
         # ensure we have a valid datastore_id
         if datastore_id == -1:
             return make_response(
                 jsonify(message="Invalid datastore_id, it must be an int number."), 404
             )
+        if not request.if_match:
+            # no row returned means there was no entry, the same 404 as get_or_404()
+            if not delete_batch(DatastoreModel.datastore_id == datastore_id):
+                abort(404)
+            return jsonify({})
+        return self.delete_entry(datastore_id)
+
+    def delete_entry(self, datastore_id: int):
+        """Read a Datastore entry, check If-Match, and delete it."""
         # attempt to retrieve a Datastore entry by it's datastore_id, or return a 404
         data = db.get_or_404(DatastoreModel, datastore_id)
+        if precondition_failed(data):
+            return precondition_failed_response()
+        version = data.version
         db.session.delete(data)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return precondition_failed_response()
+        # no version of a deleted entry is newer than its last one
+        cache.delete(datastore_id, version + 1)
         # jsonify(datastore_schema.dump(data))
         return jsonify({})
 
@@ -126,13 +544,25 @@ class DatastoreController(Resource):
 # https://flask.palletsprojects.com/en/2.3.x/api/#flask.Flask.add_url_rule
 # @app.route("/aggregate")
 def aggregate():
-    """Call an ad-hoc text SQL query."""
-    # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/quickstart/#query-the-data
+    """Count, and min / max, the Datastore entries, optionally filtered and grouped.
+
+    Query string arguments are "group_by" (bool, domain, hour or day), the
+    filters of the collection, and "source=summary" to read the counts from
+    the summary table, when DATASTORE_AGGREGATE_SUMMARY is set.
+    """
+    try:
+        query, source, group_by = aggregate_query(request.args, summary_enabled())
+    except ValueError as error:
+        return make_response(jsonify(message=str(error)), 400)
     # https://docs.sqlalchemy.org/en/20/orm/session_api.html#sqlalchemy.orm.Session.execute
-    results = db.session.execute(
-        text("SELECT COUNT(*) AS total FROM datastore;")
-    ).fetchall()
-    return jsonify(message=str(results))
+    return jsonify(aggregate_result(db.session.execute(query), source, group_by))
+
+
+# https://flask.palletsprojects.com/en/2.3.x/api/#flask.Flask.add_url_rule
+# @app.route("/cache")
+def cache_stats():
+    """Return the hit, miss and eviction counters of the Datastore entry cache."""
+    return jsonify(cache.stats())
 
 
 # https://flask.palletsprojects.com/en/2.3.x/api/#flask.Flask.add_url_rule
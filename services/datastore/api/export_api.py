@@ -0,0 +1,70 @@
+"""Flask REST API streaming export endpoint for the Datastore."""
+import zlib
+
+from flask import (
+    Response,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+)
+from flask_restful import Resource
+
+from datastore.api.datastore_api import get_int_arg
+from datastore.export import EXPORT_MIMETYPES, csv_header, export_chunks, format_rows
+
+
+def gzip_stream(chunks):
+    """Compress an iterable of Strings into a gzip stream, one chunk at a time."""
+    # https://docs.python.org/3/library/zlib.html#zlib.compressobj
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(export_format: str, after: int = None, chunk_size: int = 1000):
+    """Yield the Datastore entries after a datastore_id as NDJSON, or CSV, by chunk."""
+    if export_format == "csv" and after is None:
+        yield csv_header()
+    for rows in export_chunks(after, chunk_size):
+        yield format_rows(rows, export_format)
+
+
+class DatastoreExportController(Resource):
+    """flask-restful Controller for exporting the Datastore."""
+
+    def get(self):
+        """Stream every Datastore entry as NDJSON, or CSV, in datastore_id order.
+
+        "?format=csv" selects CSV, with a header line unless resuming. An
+        interrupted export is resumed with "?after=<datastore_id>" of the last
+        row received. The stream is gzip compressed on the fly when the
+        client accepts it.
+        """
+        export_format = request.args.get("format", "ndjson")
+        if export_format not in EXPORT_MIMETYPES:
+            return make_response(
+                jsonify(message="Invalid format, it must be ndjson or csv."), 400
+            )
+        try:
+            after = get_int_arg(request.args, "after", minimum=0)
+        except ValueError as error:
+            return make_response(jsonify(message=str(error)), 400)
+        chunks = stream_with_context(
+            export_stream(
+                export_format, after, current_app.config["DATASTORE_STREAM_CHUNK_SIZE"]
+            )
+        )
+        headers = {"Vary": "Accept-Encoding"}
+        # https://werkzeug.palletsprojects.com/en/3.0.x/wrappers/#werkzeug.wrappers.Request.accept_encodings
+        if request.accept_encodings["gzip"]:
+            chunks = gzip_stream(chunks)
+            headers["Content-Encoding"] = "gzip"
+        return Response(
+            chunks, mimetype=EXPORT_MIMETYPES[export_format], headers=headers
+        )
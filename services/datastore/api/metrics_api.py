@@ -0,0 +1,56 @@
+"""Flask REST API metrics endpoint, in the Prometheus text format."""
+from flask import current_app
+from sqlalchemy.pool import QueuePool
+
+from datastore.database import db
+from datastore.metrics import Gauge, registry
+
+
+def pool_status(method: str):
+    """Return a callback reading a status method of the app's QueuePool."""
+
+    def callback():
+        pool = db.engine.pool
+        if not isinstance(pool, QueuePool):
+            return None
+        return getattr(pool, method)()
+
+    return callback
+
+
+def cache_status(name: str):
+    """Return a callback reading a counter of the app's Datastore entry cache."""
+
+    def callback():
+        stats = current_app.extensions["datastore_cache"].stats()
+        return {(("backend", stats["backend"]),): stats[name] or 0}
+
+    return callback
+
+
+# https://docs.sqlalchemy.org/en/20/core/pooling.html#sqlalchemy.pool.QueuePool
+for method, help in (
+    ("size", "Configured number of connections kept in the pool."),
+    ("checkedout", "Connections currently checked out of the pool."),
+    ("checkedin", "Idle connections currently in the pool."),
+    ("overflow", "Connections currently open beyond the pool size."),
+):
+    registry.register(Gauge(f"datastore_db_pool_{method}", help, pool_status(method)))
+
+for name, help in (
+    ("hits", "Datastore entry cache hits."),
+    ("misses", "Datastore entry cache misses."),
+    ("evictions", "Datastore entry cache evictions."),
+    ("size", "Datastore entries currently cached."),
+):
+    registry.register(Gauge(f"datastore_cache_{name}", help, cache_status(name)))
+
+
+# https://flask.palletsprojects.com/en/2.3.x/api/#flask.Flask.add_url_rule
+# @app.route("/metrics")
+def metrics():
+    """Return the process metrics, in the Prometheus text format."""
+    # https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+    return current_app.response_class(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,34 +1,90 @@
 """Flask Application Factory function definition for create_app()."""
 from flask import Flask
 from flask_restful import Api
+from sqlalchemy.orm import configure_mappers
 
-from datastore.api.datastore_api import DatastoreController, aggregate, hello_world
-from datastore.database import db, ma
+from datastore.api.bulk_api import (
+    DatastoreBulkController,
+    DatastoreBulkDeleteController,
+    DatastoreMultiGetController,
+)
+from datastore.api.changes_api import DatastoreChangesController
+from datastore.api.datastore_api import (
+    DatastoreController,
+    aggregate,
+    cache_stats,
+    hello_world,
+)
+from datastore.api.export_api import DatastoreExportController
+from datastore.api.metrics_api import metrics
+from datastore.cache import cache
+from datastore.compression import compression
+from datastore.database import db
+from datastore.group_commit import group_commit
+from datastore.instrumentation import instrumentation
 from datastore.models.datastore_model import DatastoreModel
+from datastore.ratelimit import rate_limit
+from datastore.replicas import replicas
+from datastore.representations import REPRESENTATIONS
+from datastore.serializers import FastJSONProvider
 
 
 # https://flask.palletsprojects.com/en/2.3.x/tutorial/factory/
 # https://gitlab.com/patkennedy79/flask_user_management_example/-/blob/main/project/__init__.py
-def create_app():
-    """Flask Application Factory function to initialize the app."""
+def create_app(test_config: dict = None):
+    """Flask Application Factory function to initialize the app.
+
+    The settings of test_config, if given, override the Config class.
+    """
     # configure and initialize Flask
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     app.config.from_object("datastore.config.Config")
+    if test_config is not None:
+        app.config.update(test_config)
     app.url_map.strict_slashes = False
     app.add_url_rule("/", view_func=hello_world)
     app.add_url_rule("/aggregate", view_func=aggregate)
+    app.add_url_rule("/cache", view_func=cache_stats)
+    app.add_url_rule("/metrics", view_func=metrics)
+
+    init_extensions(app)
+    init_api(app)
+    return app
 
-    # initialize SQLAlchemy and Marshmallow
+
+def init_extensions(app):
+    """Initialize the extensions of the app, in the order their hooks run."""
+    # initialize SQLAlchemy, the read replica routing, the Datastore entry cache,
+    # the group commit writer, metrics, rate limiting, and compression, after
+    # metrics so that the rejected requests, and the compressed size, are recorded
     db.init_app(app)
-    ma.init_app(app)
+    replicas.init_app(app)
+    # https://docs.sqlalchemy.org/en/20/orm/mapping_api.html#sqlalchemy.orm.configure_mappers
+    # configure the mappers once, when the worker starts, not on its first query
+    configure_mappers()
+    cache.init_app(app)
+    group_commit.init_app(app)
+    instrumentation.init_app(app)
+    rate_limit.init_app(app)
+    compression.init_app(app)
+
 
-    # initialize and configure flask-restful
+def init_api(app):
+    """Initialize flask-restful, with its representations, and the Datastore resources."""
+    # https://flask-restful.readthedocs.io/en/latest/extending.html#content-negotiation
     api = Api(app)
+    for mediatype, output in REPRESENTATIONS.items():
+        api.representation(mediatype)(output)
     api.add_resource(DatastoreController, "/datastore")
     api.add_resource(
         DatastoreController, "/datastore/<int:datastore_id>", endpoint="datastore"
     )
-    return app
+    api.add_resource(DatastoreBulkController, "/datastore/_bulk")
+    api.add_resource(DatastoreBulkDeleteController, "/datastore/_delete")
+    api.add_resource(DatastoreMultiGetController, "/datastore/_mget")
+    api.add_resource(DatastoreChangesController, "/datastore/_changes")
+    api.add_resource(DatastoreExportController, "/datastore/_export")
 
 
 def app_reset_db():
@@ -39,6 +95,7 @@ def app_reset_db():
     db.create_all()
     # https://docs.sqlalchemy.org/en/20/orm/session_api.html#sqlalchemy.orm.Session.commit
     db.session.commit()
+    cache.clear()
 
 
 def app_seed_db():
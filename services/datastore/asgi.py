@@ -0,0 +1,506 @@
+"""ASGI application serving the Datastore API, with an async database driver.
+
+Serves the "/", "/aggregate", "/datastore" and "/datastore/<id>" routes of the
+Flask app, with identical responses, but awaits each database round trip on
+an event loop rather than holding a thread for it, so one process can serve
+thousands of concurrent slow clients. The Flask app still provides the
+configuration, JSON provider, Datastore entry cache, and a request context
+to the helpers shared with its controllers, and serves the other routes, in
+a thread.
+
+Usage: uvicorn --factory datastore.asgi:create_asgi_app --port 5000
+"""
+import asyncio
+import io
+import re
+
+from flask_restful.representations.json import output_json
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import (
+    HTTPException,
+    InternalServerError,
+    MethodNotAllowed,
+    NotFound,
+)
+from werkzeug.wrappers import Request
+
+from datastore.aggregate import aggregate_query, aggregate_result, summary_enabled
+from datastore.api.datastore_api import (
+    STREAM_MIMETYPES,
+    collection_args,
+    conditional_response,
+    get_page_size,
+    multi_get,
+    multi_get_args,
+    page_response,
+    precondition_failed,
+    precondition_failed_response,
+    update_statement,
+)
+from datastore.app import create_app
+from datastore.bulk import delete_batch
+from datastore.cache import cache
+from datastore.changes import record_changes
+from datastore.models.datastore_model import DatastoreModel
+from datastore.serializers import dump_row
+from datastore.validation import FIELD_PARSERS, ValidationError, parse_entry
+
+
+# https://docs.sqlalchemy.org/en/20/dialects/postgresql.html#module-sqlalchemy.dialects.postgresql.asyncpg
+# https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#module-sqlalchemy.dialects.sqlite.aiosqlite
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_uri(database_uri: str) -> str:
+    """Replace the driver of a database URI with its asyncio driver."""
+    url = make_url(database_uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(
+        hide_password=False
+    )
+
+
+def async_engine_options(options: dict) -> dict:
+    """Adapt the Flask-SQLAlchemy engine options to an async engine.
+
+    The async engine wraps the pool in an AsyncAdaptedQueuePool, and asyncpg
+    takes PostgreSQL settings as "server_settings" rather than "options".
+    """
+    options = dict(options)
+    options.pop("poolclass", None)
+    connect_args = options.pop("connect_args", {})
+    if "options" in connect_args:
+        # "-c statement_timeout=<ms>"
+        name, value = connect_args["options"].removeprefix("-c ").split("=", 1)
+        options["connect_args"] = {"server_settings": {name: value}}
+    return options
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """Build a WSGI environ from an ASGI HTTP scope, to parse it with Werkzeug."""
+    # https://asgi.readthedocs.io/en/latest/specs/www.html#http-connection-scope
+    # https://peps.python.org/pep-3333/#environ-variables
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    # the body has been read in full, which may have been sent chunked
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def asgi_headers(headers: list) -> list:
+    """Encode the (name, value) headers of a WSGI response for an ASGI response."""
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+def run_wsgi(app, environ: dict, send_message):
+    """Run a WSGI app, passing each ASGI message of its response to send_message."""
+
+    def start_response(status: str, headers: list, exc_info=None):
+        # https://peps.python.org/pep-3333/#the-start-response-callable
+        status = int(status.split(" ", 1)[0])
+        send_message(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": asgi_headers(headers),
+            }
+        )
+
+    app_iter = app(environ, start_response)
+    try:
+        for chunk in app_iter:
+            if chunk:
+                send_message(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+    finally:
+        if hasattr(app_iter, "close"):
+            app_iter.close()
+    send_message({"type": "http.response.body", "body": b""})
+
+
+class StreamingResponse(object):
+    """A response whose body is written by an async generator of Strings."""
+
+    def __init__(self, chunks, mimetype: str):
+        """Initialize the StreamingResponse."""
+        self.chunks = chunks
+        self.mimetype = mimetype
+
+
+class DatastoreASGI(object):
+    """ASGI application for the Datastore API, using an async SQLAlchemy session."""
+
+    # (path pattern, {HTTP method: handler name}, flask-restful resource), the
+    # path groups are handler arguments, and resources format errors as JSON
+    routes = [
+        (re.compile(r"/?"), {"GET": "hello_world"}, False),
+        (re.compile(r"/aggregate/?"), {"GET": "aggregate"}, False),
+        (
+            re.compile(r"/datastore/?"),
+            {
+                "GET": "get_collection",
+                "POST": "post",
+                "PUT": "put",
+                "PATCH": "patch",
+                "DELETE": "delete",
+            },
+            True,
+        ),
+        (
+            re.compile(r"/datastore/(\d+)/?"),
+            {"GET": "get", "PUT": "put", "PATCH": "patch", "DELETE": "delete"},
+            True,
+        ),
+    ]
+
+    def __init__(self, flask_app=None):
+        """Initialize the app, and the async engine, from the Flask app config."""
+        self.flask_app = flask_app or create_app()
+        config = self.flask_app.config
+        # https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html
+        self.engine = create_async_engine(
+            async_database_uri(config["SQLALCHEMY_DATABASE_URI"]),
+            **async_engine_options(config["SQLALCHEMY_ENGINE_OPTIONS"]),
+        )
+        # keep attributes loaded after a commit, as they can't be lazy loaded
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        """Handle an ASGI lifespan or HTTP connection."""
+        # https://asgi.readthedocs.io/en/latest/specs/main.html#applications
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        environ = wsgi_environ(scope, body)
+        if not any(pattern.fullmatch(scope["path"]) for pattern, _, _ in self.routes):
+            return await self.send_wsgi(send, environ)
+
+        # the request context provides current_app and request to the helpers
+        # shared with the Flask controllers, and is local to the asyncio task
+        # serving this request
+        # https://flask.palletsprojects.com/en/3.0.x/api/#flask.Flask.request_context
+        with self.flask_app.request_context(environ) as context:
+            async with self.sessionmaker() as session:
+                response = await self.dispatch(context.request, session)
+                if isinstance(response, StreamingResponse):
+                    return await self.send_stream(send, response)
+            await self.send_response(send, response, environ)
+
+    async def lifespan(self, receive, send):
+        """Dispose of the database connections on shutdown."""
+        # https://asgi.readthedocs.io/en/latest/specs/lifespan.html
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def dispatch(self, request: Request, session):
+        """Route a request to its handler, like the Flask URL map."""
+        method = "GET" if request.method == "HEAD" else request.method
+        for pattern, handlers, restful in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            try:
+                if method not in handlers:
+                    raise MethodNotAllowed(valid_methods=list(handlers))
+                arguments = [int(group) for group in match.groups()]
+                return await getattr(self, handlers[method])(
+                    request, session, *arguments
+                )
+            except HTTPException as error:
+                return self.http_error(error) if restful else error.get_response()
+            except Exception:
+                # https://flask.palletsprojects.com/en/2.3.x/api/#flask.Flask.log_exception
+                self.flask_app.logger.exception(
+                    f"Exception on {request.path} [{request.method}]"
+                )
+                await session.rollback()
+                error = InternalServerError()
+                return self.http_error(error) if restful else error.get_response()
+        return NotFound().get_response()
+
+    async def send_response(self, send, response, environ: dict):
+        """Send a Werkzeug response, with the headers Werkzeug would send."""
+        # https://asgi.readthedocs.io/en/latest/specs/www.html#response-start-send-event
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": asgi_headers(headers),
+            }
+        )
+        await send({"type": "http.response.body", "body": b"".join(app_iter)})
+
+    async def send_wsgi(self, send, environ: dict):
+        """Serve a request with the Flask WSGI app, in a thread, sending each chunk."""
+        loop = asyncio.get_running_loop()
+
+        def send_message(message: dict):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        # https://docs.python.org/3/library/asyncio-task.html#asyncio.to_thread
+        await asyncio.to_thread(run_wsgi, self.flask_app, environ, send_message)
+
+    async def send_stream(self, send, response: StreamingResponse):
+        """Send a chunked response, writing each chunk before the next is read."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", response.mimetype.encode("latin-1"))],
+            }
+        )
+        async for chunk in response.chunks:
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk.encode(),
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b""})
+
+    def json_response(self, data, status: int = 200):
+        """Return a JSON response, serialized like jsonify()."""
+        response = self.flask_app.json.response(data)
+        response.status_code = status
+        return response
+
+    def error(self, status: int, message: str):
+        """Return an error response, like make_response(jsonify(message=...))."""
+        return self.json_response({"message": message}, status)
+
+    def http_error(self, error: HTTPException):
+        """Return an HTTP exception response, like the flask-restful error handler."""
+        # https://github.com/flask-restful/flask-restful/blob/master/flask_restful/__init__.py
+        return output_json(
+            {"message": error.description}, error.code, error.get_headers()
+        )
+
+    async def hello_world(self, request: Request, session):
+        """Verify that the ASGI app is running."""
+        return self.json_response({"hello": "world"})
+
+    async def aggregate(self, request: Request, session):
+        """Count, and min / max, the Datastore entries, like the Flask view."""
+        try:
+            query, source, group_by = aggregate_query(request.args, summary_enabled())
+        except ValueError as error:
+            return self.error(400, str(error))
+        rows = await session.execute(query)
+        return self.json_response(aggregate_result(rows, source, group_by))
+
+    async def get(self, request: Request, session, datastore_id: int):
+        """Read a Datastore entry by it's ID, from the cache or the database."""
+        body = cache.get(datastore_id)
+        if body is None:
+            # https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html#sqlalchemy.ext.asyncio.AsyncSession.get
+            entry = await session.get(DatastoreModel, datastore_id)
+            if entry is None:
+                return self.http_error(NotFound())
+            body = self.json_response(dump_row(entry)).get_data()
+            cache.set(datastore_id, body, entry.version)
+        return conditional_response(body)
+
+    async def get_collection(self, request: Request, session):
+        """Return a page of Datastore entries, as JSON, like the Flask controller."""
+        if "ids" in request.args or "uuids" in request.args:
+            return await self.get_many(request, session)
+        try:
+            limit, filters, query = collection_args(request.args)
+        except ValueError as error:
+            return self.error(400, str(error))
+        if "stream" in request.args:
+            stream = request.args["stream"]
+            return await self.stream_collection(session, stream, query, limit)
+
+        page_size = get_page_size(limit)
+        # read one extra row to know if there is a next page
+        results = (await session.execute(query.limit(page_size + 1))).all()
+        if not results and "after" not in request.args and not filters:
+            return self.error(404, "No datastore data has been created.")
+        return page_response(results, page_size)
+
+    async def get_many(self, request: Request, session):
+        """Return the Datastore entries of "?ids=1,2,3", or "?uuids=...", in order."""
+        try:
+            key, values = multi_get_args(request.args)
+        except ValidationError as error:
+            return self.error(400, str(error))
+        # https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html#sqlalchemy.ext.asyncio.AsyncSession.run_sync
+        body = await session.run_sync(lambda sync: multi_get(key, values, sync))
+        return conditional_response(body)
+
+    async def stream_collection(self, session, stream: str, query, limit: int = None):
+        """Stream Datastore entries as a JSON array or NDJSON, from a server-side cursor."""
+        if stream not in STREAM_MIMETYPES:
+            return self.error(400, "Invalid stream, it must be json or ndjson.")
+        query = query.execution_options(
+            yield_per=self.flask_app.config["DATASTORE_STREAM_CHUNK_SIZE"]
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        json = self.flask_app.json
+
+        def dumps(row):
+            return json.dumps(dump_row(row), separators=(",", ":"))
+
+        async def generate():
+            # https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html#sqlalchemy.ext.asyncio.AsyncSession.stream
+            result = await session.stream(query)
+            if stream == "ndjson":
+                async for rows in result.partitions():
+                    yield "".join(dumps(row) + "\n" for row in rows)
+                return
+            separator = "["
+            async for rows in result.partitions():
+                yield separator + ",".join(dumps(row) for row in rows)
+                separator = ","
+            yield "]" if separator == "," else "[]"
+
+        return StreamingResponse(generate(), STREAM_MIMETYPES[stream])
+
+    async def post(self, request: Request, session):
+        """Create a new Datastore entry."""
+        try:
+            entry = DatastoreModel(**parse_entry(request.get_json(silent=True)))
+        except ValidationError as error:
+            return self.error(400, str(error))
+        session.add(entry)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return self.error(404, "The email and UUID need to be unique.")
+        return self.json_response(dump_row(entry), 201)
+
+    async def put(self, request: Request, session, datastore_id: int = None):
+        """Update an existing Datastore entry."""
+        if datastore_id is None:
+            return self.error(404, "Invalid datastore_id, it must be an int number.")
+        try:
+            fields = parse_entry(request.get_json(silent=True), FIELD_PARSERS)
+        except ValidationError as error:
+            return self.error(400, str(error))
+        return await self.update_entry(request, session, datastore_id, fields)
+
+    async def patch(self, request: Request, session, datastore_id: int = None):
+        """Update the given fields of a Datastore entry, with one UPDATE ... RETURNING."""
+        if datastore_id is None:
+            return self.error(404, "Invalid datastore_id, it must be an int number.")
+        try:
+            fields = parse_entry(request.get_json(silent=True), required=())
+        except ValidationError as error:
+            return self.error(400, str(error))
+        if not fields:
+            return self.error(400, "Invalid data, it must set at least one field.")
+        if request.if_match or summary_enabled():
+            return await self.update_entry(request, session, datastore_id, fields)
+
+        try:
+            result = await session.execute(update_statement(datastore_id, fields))
+            row = result.first()
+            if row is not None:
+                # https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html#sqlalchemy.ext.asyncio.AsyncSession.run_sync
+                await session.run_sync(record_changes, [row.datastore_id])
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return self.error(404, "The email and UUID need to be unique.")
+        if row is None:
+            return self.http_error(NotFound())
+        cache.delete(datastore_id, row.version)
+        response = self.json_response(dump_row(row))
+        response.add_etag()
+        return response
+
+    async def update_entry(self, request: Request, session, datastore_id: int, fields):
+        """Read a Datastore entry, check If-Match, and overwrite the given fields."""
+        entry = await session.get(DatastoreModel, datastore_id)
+        if entry is None:
+            return self.http_error(NotFound())
+        if precondition_failed(entry):
+            return precondition_failed_response()
+
+        entry.update(**fields)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return self.error(404, "The email and UUID need to be unique.")
+        except StaleDataError:
+            await session.rollback()
+            return precondition_failed_response()
+        cache.delete(datastore_id, entry.version)
+        response = self.json_response(dump_row(entry))
+        response.add_etag()
+        return response
+
+    async def delete(self, request: Request, session, datastore_id: int = None):
+        """Delete a Datastore entry, with one DELETE ... RETURNING unless If-Match is sent."""
+        if datastore_id is None:
+            return self.error(404, "Invalid datastore_id, it must be an int number.")
+        if not request.if_match:
+            # the summary, change log and cache are updated like the bulk deletes
+            condition = DatastoreModel.datastore_id == datastore_id
+            deleted = await session.run_sync(lambda sync: delete_batch(condition, sync))
+            if not deleted:
+                return self.http_error(NotFound())
+            return self.json_response({})
+
+        entry = await session.get(DatastoreModel, datastore_id)
+        if entry is None:
+            return self.http_error(NotFound())
+        if precondition_failed(entry):
+            return precondition_failed_response()
+        version = entry.version
+        await session.delete(entry)
+        try:
+            await session.commit()
+        except StaleDataError:
+            await session.rollback()
+            return precondition_failed_response()
+        cache.delete(datastore_id, version + 1)
+        return self.json_response({})
+
+
+def create_asgi_app():
+    """ASGI Application Factory function, for "uvicorn --factory"."""
+    return DatastoreASGI()
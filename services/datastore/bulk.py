@@ -0,0 +1,222 @@
+"""Bulk insert, upsert and delete of Datastore entries, with multi-row statements."""
+import uuid as uuid_util
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from datastore.aggregate import summary_enabled, update_summary
+from datastore.cache import cache
+from datastore.changes import record_changes
+from datastore.database import db, dialect_insert
+from datastore.models.datastore_model import DatastoreModel
+from datastore.validation import parse_entry
+
+
+CONFLICT_MESSAGE = "The email and UUID need to be unique."
+
+
+def row_values(row: dict):
+    """Validate one input row, and convert it to the column values to insert.
+
+    Raises a ValidationError, a ValueError, if the row is not valid.
+    """
+    fields = parse_entry(row)
+    return {
+        "email": fields["email"],
+        "uuid": fields.get("uuid") or uuid_util.uuid4(),
+        "bool": fields.get("bool", False),
+        # the now() SQL expression is only built for the rows that need it
+        "datetime": fields["datetime"] if "datetime" in fields else db.func.now(),
+    }
+
+
+def insert_statement(upsert: bool = False):
+    """Build an INSERT ... ON CONFLICT statement for the current database dialect.
+
+    Conflicting rows are skipped, or when upsert is True, rows with an existing
+    uuid are updated in place. The inserted rows are returned.
+    """
+    insert = dialect_insert(db.engine.dialect.name)(DatastoreModel)
+    if upsert:
+        statement = insert.on_conflict_do_update(
+            index_elements=[DatastoreModel.uuid],
+            set_={
+                "email": insert.excluded.email,
+                "bool": insert.excluded.bool,
+                "datetime": insert.excluded.datetime,
+                "version": DatastoreModel.__table__.c.version + 1,
+            },
+        )
+    else:
+        statement = insert.on_conflict_do_nothing()
+    return statement.returning(
+        DatastoreModel.datastore_id,
+        DatastoreModel.uuid,
+        DatastoreModel.email,
+        DatastoreModel.bool,
+        DatastoreModel.datetime,
+        DatastoreModel.version,
+    )
+
+
+def execute_insert(statement, values: list, upsert: bool = False):
+    """Execute an INSERT statement for a list of rows, in a savepoint.
+
+    The aggregate summary, and the change log, are updated in the same
+    savepoint, including removing the previous values of the rows an upsert
+    overwrites from the summary.
+    """
+    with db.session.begin_nested():
+        previous = []
+        if upsert and summary_enabled():
+            query = select(
+                DatastoreModel.email, DatastoreModel.bool, DatastoreModel.datetime
+            ).where(DatastoreModel.uuid.in_([row["uuid"] for row in values]))
+            previous = db.session.execute(query).all()
+        returned = db.session.execute(statement.values(values)).all()
+        if summary_enabled():
+            update_summary(db.session.connection(), added=returned, removed=previous)
+        record_changes(db.session, [row.datastore_id for row in returned])
+    return returned
+
+
+def insert_rows(values: list, upsert: bool = False) -> dict:
+    """Insert rows of column values, and commit them as one transaction.
+
+    A single multi-row INSERT is used for all the rows. If it fails on a
+    unique constraint that ON CONFLICT does not cover (e.g. upserting a uuid
+    with another entry's email), each row is retried in its own savepoint.
+    Returns the inserted rows by uuid, without the rows that conflicted.
+    """
+    statement = insert_statement(upsert)
+    try:
+        returned = execute_insert(statement, values, upsert)
+    except IntegrityError:
+        returned = []
+        for row in values:
+            try:
+                returned.extend(execute_insert(statement, [row], upsert))
+            except IntegrityError:
+                pass
+    db.session.commit()
+    if upsert:
+        for row in returned:
+            cache.delete(row.datastore_id, row.version)
+    return {row.uuid: row for row in returned}
+
+
+def insert_chunk(chunk: list, upsert: bool = False):
+    """Insert a chunk of (index, values) pairs, with insert_rows().
+
+    Returns a result dict per row, in input order.
+    """
+    rows = insert_rows([values for _, values in chunk], upsert)
+    status = "upserted" if upsert else "created"
+    results = []
+    for index, values in chunk:
+        row = rows.get(values["uuid"])
+        if row is not None:
+            result = {"datastore_id": row.datastore_id, "status": status}
+        else:
+            result = {"status": "conflict", "message": CONFLICT_MESSAGE}
+        results.append({"index": index, **result})
+    return results
+
+
+def bulk_insert(rows, chunk_size: int = 500, upsert: bool = False):
+    """Validate and insert an iterable of input rows, in chunks.
+
+    Yields a result dict per row, with its index, and a status of "created"
+    (or "upserted"), "conflict" or "invalid". Rows sharing a uuid never go
+    into the same chunk, so every row gets its own result.
+    """
+    chunk, uuids = [], set()
+    for index, row in enumerate(rows):
+        try:
+            values = row_values(row)
+        except ValueError as error:
+            yield {"index": index, "status": "invalid", "message": str(error)}
+            continue
+        if len(chunk) >= chunk_size or values["uuid"] in uuids:
+            yield from insert_chunk(chunk, upsert)
+            chunk, uuids = [], set()
+        chunk.append((index, values))
+        uuids.add(values["uuid"])
+    if chunk:
+        yield from insert_chunk(chunk, upsert)
+
+
+def delete_statement(condition):
+    """Build a DELETE ... RETURNING of the Datastore entries matching a condition.
+
+    The returned columns are the ones the summary, and the cache, need.
+    """
+    # https://docs.sqlalchemy.org/en/20/tutorial/data_update.html#update-delete-returning
+    table = DatastoreModel.__table__
+    return (
+        delete(table)
+        .where(condition)
+        .returning(
+            table.c.datastore_id,
+            table.c.email,
+            table.c.bool,
+            table.c.datetime,
+            table.c.version,
+        )
+    )
+
+
+def delete_entries(condition, session=None):
+    """Delete the Datastore entries matching a condition, with one statement.
+
+    The summary, and the change log, are updated in the same transaction of
+    the session, db.session by default, and the deleted rows are returned.
+    The caller commits, and then invalidates their cache entries.
+    """
+    session = session or db.session
+    returned = session.execute(delete_statement(condition)).all()
+    if returned and summary_enabled():
+        update_summary(session.connection(), removed=returned)
+    record_changes(session, [row.datastore_id for row in returned])
+    return returned
+
+
+def delete_batch(condition, session=None) -> int:
+    """Delete and commit one batch of Datastore entries, returning its size.
+
+    The session is db.session by default, or e.g. the sync session of an
+    AsyncSession, in its run_sync().
+    """
+    session = session or db.session
+    returned = delete_entries(condition, session)
+    session.commit()
+    for row in returned:
+        # no version of a deleted entry is newer than its last one
+        cache.delete(row.datastore_id, row.version + 1)
+    return len(returned)
+
+
+def delete_ids(ids: list, batch_size: int = 1000):
+    """Delete Datastore entries by datastore_id, committing each batch of ids.
+
+    Yields the number of entries deleted per batch.
+    """
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        yield delete_batch(DatastoreModel.datastore_id.in_(ids[start:end]))
+
+
+def delete_matching(query, batch_size: int = 1000):
+    """Delete the Datastore entries a SELECT of datastore_ids matches, in batches.
+
+    Each batch deletes the batch_size lowest datastore_ids still matching, and
+    commits, so no transaction holds its locks for long, and VACUUM can reclaim
+    the rows of the finished batches. Yields the number of entries deleted per
+    batch.
+    """
+    batch = query.order_by(DatastoreModel.datastore_id).limit(batch_size)
+    while True:
+        count = delete_batch(DatastoreModel.datastore_id.in_(batch.scalar_subquery()))
+        yield count
+        if count < batch_size:
+            return
@@ -0,0 +1,238 @@
+"""Read-through cache of serialized Datastore entries, keyed by datastore_id.
+
+The backend is selected by the DATASTORE_CACHE_BACKEND setting, an in-process
+LRU cache ("lru"), a Redis compatible server ("redis"), or no cache ("none").
+
+Every entry is cached with the version of the row it was read from, and a
+writer invalidates a key by caching a tombstone with the version it wrote.
+A value is only cached when no newer version is, so a reader which read a
+row before a write, but caches it after the writer's invalidation, cannot
+put the stale body back.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUCache(object):
+    """In-process least recently used cache, bounded by size and entry age."""
+
+    name = "lru"
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60, clock=time.monotonic):
+        """Initialize an empty cache, holding up to max_size entries for ttl seconds."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            if entry[2] is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, version: int):
+        """Cache a value of a version, unless a newer version is cached.
+
+        A value of None is a tombstone. The least recently used entries are
+        evicted when the cache is full.
+        """
+        with self.lock:
+            now = self.clock()
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] > version:
+                return
+            self.entries[key] = (now + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key, version: int):
+        """Invalidate a key, so that no version older than version is cached."""
+        self.set(key, None, version)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """Return the hit, miss and eviction counters, and the current size."""
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
+
+
+# https://redis.io/docs/interact/programmability/eval-intro/
+# the version check of LRUCache.set(), done atomically by the server, with an
+# empty value as the tombstone
+SET_VERSION_SCRIPT = """
+local current = tonumber(redis.call("HGET", KEYS[1], "version"))
+if current and current > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call("HSET", KEYS[1], "version", ARGV[1], "value", ARGV[2])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RedisCache(object):
+    """Cache shared between processes, stored in a Redis compatible server.
+
+    Each entry is a hash of its version and value. The client only needs the
+    hget(), eval(), delete() and scan_iter() methods of redis.Redis, so a local
+    fake can stand in for it. Entries expire after ttl seconds, and evictions
+    are done by the server, so they are not counted.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "datastore:"):
+        """Initialize the cache with a Redis client, and a key prefix."""
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing or expired."""
+        value = self.client.hget(f"{self.prefix}{key}", "value") or None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, version: int):
+        """Cache a value of a version, unless a newer version is cached.
+
+        A value of None is a tombstone. Entries expire after ttl seconds.
+        """
+        # https://redis-py.readthedocs.io/en/stable/commands.html#redis.commands.core.CoreCommands.eval
+        self.client.eval(
+            SET_VERSION_SCRIPT,
+            1,
+            f"{self.prefix}{key}",
+            version,
+            b"" if value is None else value,
+            max(1, int(self.ttl)),
+        )
+
+    def delete(self, key, version: int):
+        """Invalidate a key, so that no version older than version is cached."""
+        self.set(key, None, version)
+
+    def clear(self):
+        """Remove every entry with the key prefix from the cache."""
+        for name in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(name)
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters."""
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": 0,
+            "size": None,
+        }
+
+
+class NullCache(object):
+    """Cache backend which never stores anything, used to disable caching."""
+
+    name = "none"
+
+    def get(self, key):
+        """Return None, since nothing is ever cached."""
+        return None
+
+    def set(self, key, value, version: int):
+        """Discard the value."""
+
+    def delete(self, key, version: int):
+        """Do nothing, since nothing is ever cached."""
+
+    def clear(self):
+        """Do nothing, since nothing is ever cached."""
+
+    def stats(self) -> dict:
+        """Return empty counters."""
+        return {"backend": self.name, "hits": 0, "misses": 0, "evictions": 0, "size": 0}
+
+
+class Cache(object):
+    """Flask extension giving access to the configured cache backend of the app."""
+
+    def init_app(self, app, backend=None):
+        """Create the cache backend from the app config, unless one is given."""
+        if backend is None:
+            backend = self.create_backend(app.config)
+        app.extensions["datastore_cache"] = backend
+
+    @staticmethod
+    def create_backend(config):
+        """Create the cache backend named by DATASTORE_CACHE_BACKEND."""
+        name = config["DATASTORE_CACHE_BACKEND"]
+        ttl = config["DATASTORE_CACHE_TTL"]
+        if name == "lru":
+            return LRUCache(max_size=config["DATASTORE_CACHE_SIZE"], ttl=ttl)
+        if name == "redis":
+            # https://pypi.org/project/redis/, only required by this backend
+            import redis
+
+            return RedisCache(redis.Redis.from_url(config["CACHE_REDIS_URL"]), ttl=ttl)
+        if name == "none":
+            return NullCache()
+        raise ValueError(f"Invalid DATASTORE_CACHE_BACKEND {name!r}.")
+
+    @property
+    def backend(self):
+        """Return the cache backend of the current app."""
+        return current_app.extensions["datastore_cache"]
+
+    def get(self, key):
+        """Return the cached value for a key, or None."""
+        return self.backend.get(key)
+
+    def set(self, key, value, version: int):
+        """Cache a value read from a version of a row, unless a newer one is cached."""
+        self.backend.set(key, value, version)
+
+    def delete(self, key, version: int):
+        """Invalidate a key after a write, which committed version of the row."""
+        self.backend.delete(key, version)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """Return the counters of the cache backend."""
+        return self.backend.stats()
+
+
+cache = Cache()
@@ -0,0 +1,295 @@
+"""Change log of the Datastore table, for the incremental sync of its mirrors.
+
+When DATASTORE_CHANGES is enabled, every write, by the DatastoreController,
+the bulk endpoints or "cli.py load_db", adds a row per written entry to the
+"datastore_changes" table, in the same transaction. GET /datastore/_changes
+then returns the entries changed since a cursor, the change_id of the last
+change a client received, so a mirror reads O(changes) rather than O(table).
+
+A change_id is allocated when the change is written, but is only visible
+once its transaction commits, so with concurrent writers a lower change_id
+can appear after a higher one was read. On PostgreSQL, a page with a gap in
+its change_ids waits, up to DATASTORE_CHANGES_GAP_WAIT seconds, for every
+transaction in progress when it was read to end, and reads again: the gaps
+below the change_ids of the first read are then rolled back transactions,
+and are skipped, while the page stops before a later gap. A transaction
+writing for longer than the wait holds back the pages after its change_ids.
+On SQLite, the writers are serialized, so a gap is always a rollback.
+"""
+import threading
+import time
+from datetime import datetime as datetime_util
+from datetime import timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import (
+    BigInteger,
+    Text,
+    cast,
+    delete,
+    event,
+    func,
+    insert,
+    literal,
+    select,
+)
+from sqlalchemy.orm import Session, object_session
+
+from datastore.database import db
+from datastore.models.change_model import DatastoreChangeModel
+from datastore.models.datastore_model import DatastoreModel
+from datastore.serializers import DATASTORE_COLUMNS, dump_row
+
+
+# how often a page waiting for the transactions of a gap checks if they ended
+HORIZON_POLL_INTERVAL = 0.01
+
+
+def changes_enabled() -> bool:
+    """Check if the change log is maintained by the current app."""
+    return current_app.config["DATASTORE_CHANGES"]
+
+
+def utcnow() -> datetime_util:
+    """Return the current UTC date and time, without a timezone, like the columns."""
+    return datetime_util.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_changes(session, datastore_ids: list, connection=None):
+    """Log a change of each datastore_id, in the current transaction of a session.
+
+    The session is flagged, to wake up the long-polls once it commits. The
+    mapper events give the connection of their flush.
+    """
+    if not datastore_ids or not changes_enabled():
+        return
+    now = utcnow()
+    (connection or session.connection()).execute(
+        insert(DatastoreChangeModel),
+        [
+            {"datastore_id": datastore_id, "changed_at": now}
+            for datastore_id in datastore_ids
+        ],
+    )
+    session.info["datastore_changes"] = True
+
+
+def record_loaded(session, uuids: list):
+    """Log a change of each loaded entry, by uuid, with one INSERT ... SELECT."""
+    if not uuids or not changes_enabled():
+        return
+    query = select(
+        DatastoreModel.datastore_id,
+        literal(utcnow(), DatastoreChangeModel.changed_at.type),
+    ).where(DatastoreModel.uuid.in_(uuids))
+    session.execute(
+        insert(DatastoreChangeModel).from_select(["datastore_id", "changed_at"], query)
+    )
+    session.info["datastore_changes"] = True
+
+
+def latest_change_id() -> int:
+    """Return the change_id of the latest change, or 0 if there is none."""
+    query = select(func.max(DatastoreChangeModel.change_id))
+    return db.session.execute(query).scalar() or 0
+
+
+def oldest_change_id():
+    """Return the change_id of the oldest change kept, or None if there is none."""
+    query = select(func.min(DatastoreChangeModel.change_id))
+    return db.session.execute(query).scalar()
+
+
+def dump_change(row) -> dict:
+    """Convert a change, joined with its current entry, to a JSON-ready dict."""
+    deleted = row.datastore_id is None
+    return {
+        "change_id": row.change_id,
+        "datastore_id": row.changed_id,
+        "deleted": deleted,
+        "entry": None if deleted else dump_row(row),
+    }
+
+
+def changes_query(since: int, limit: int):
+    """Return a SELECT of at most limit changes after the since change_id.
+
+    Each change is joined with the current values of its entry, oldest first.
+    """
+    change = DatastoreChangeModel
+    return (
+        select(
+            change.change_id,
+            change.datastore_id.label("changed_id"),
+            *DATASTORE_COLUMNS,
+        )
+        .select_from(change)
+        .outerjoin(DatastoreModel, DatastoreModel.datastore_id == change.datastore_id)
+        .where(change.change_id > since)
+        .order_by(change.change_id)
+        .limit(limit)
+    )
+
+
+def settled_count(rows: list, since: int, final: int) -> int:
+    """Count the rows before the first gap in their change_ids after final.
+
+    A gap at or below the final change_id is a rolled back transaction, while
+    a later one may be a change not committed yet.
+    """
+    previous = since
+    for index, row in enumerate(rows):
+        if row.change_id - 1 > max(previous, final):
+            return index
+        previous = row.change_id
+    return len(rows)
+
+
+def transaction_horizon():
+    """Return the xid which every transaction in progress is below, on PostgreSQL.
+
+    Returns None on the other databases, where the writers are serialized.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return None
+    # https://www.postgresql.org/docs/current/functions-info.html#FUNCTIONS-PG-SNAPSHOT
+    xmax = func.pg_snapshot_xmax(func.pg_current_snapshot())
+    return db.session.execute(select(cast(cast(xmax, Text), BigInteger))).scalar()
+
+
+def horizon_passed(horizon: int) -> bool:
+    """Check if every transaction below the horizon xid has ended."""
+    xmin = func.pg_snapshot_xmin(func.pg_current_snapshot())
+    query = select(cast(cast(xmin, Text), BigInteger))
+    return db.session.execute(query).scalar() >= horizon
+
+
+def wait_for_horizon(horizon: int, timeout: float) -> bool:
+    """Wait up to timeout seconds for the transactions below a horizon to end."""
+    deadline = time.monotonic() + timeout
+    while not horizon_passed(horizon):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(HORIZON_POLL_INTERVAL)
+    return True
+
+
+def read_settled(since: int, limit: int, gap_wait: float):
+    """Read at most limit changes after since, and count those before a pending gap.
+
+    Returns the rows read, and the count of their first rows which no change
+    not committed yet can precede.
+    """
+    query = changes_query(since, limit)
+    rows = db.session.execute(query).all()
+    count = settled_count(rows, since, since)
+    if count == len(rows):
+        return rows, count
+    horizon = transaction_horizon()
+    if horizon is None:
+        return rows, len(rows)
+    if not wait_for_horizon(horizon, gap_wait):
+        return rows, count
+    final = rows[-1].change_id
+    rows = db.session.execute(query).all()
+    return rows, settled_count(rows, since, final)
+
+
+def read_changes(since: int, limit: int, gap_wait: float = 0):
+    """Read a page of at most limit changes after the since change_id.
+
+    Only the latest change of an entry is kept. Returns the changes, the
+    change_id to read the next page after, and whether more changes may follow.
+    """
+    # read one extra row to know if there is a next page
+    rows, count = read_settled(since, limit + 1, gap_wait)
+    more = len(rows) > min(count, limit)
+    rows = rows[: min(count, limit)]
+    last = rows[-1].change_id if rows else since
+
+    latest = {row.changed_id: row for row in rows}
+    changes = [
+        dump_change(row)
+        for row in sorted(latest.values(), key=lambda row: row.change_id)
+    ]
+    return changes, last, more
+
+
+def prune_changes(days: float) -> int:
+    """Delete the changes older than days, except the latest one, and commit.
+
+    The latest change is kept, so a client whose cursor is before the oldest
+    change kept can be told that it missed changes. Returns the number deleted.
+    """
+    statement = delete(DatastoreChangeModel).where(
+        DatastoreChangeModel.changed_at < utcnow() - timedelta(days=days),
+        DatastoreChangeModel.change_id < latest_change_id(),
+    )
+    count = db.session.execute(statement).rowcount
+    db.session.commit()
+    return count
+
+
+class ChangeNotifier(object):
+    """Wakes up the long-polls of this process when a change is committed."""
+
+    def __init__(self):
+        """Initialize the count of the commits of changes at 0."""
+        self.count = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        """Count a commit of changes, and wake up every waiting long-poll."""
+        with self.condition:
+            self.count += 1
+            self.condition.notify_all()
+
+    def wait(self, seen: int, timeout: float) -> bool:
+        """Wait up to timeout seconds for a commit after seen, the count read before."""
+        # https://docs.python.org/3/library/threading.html#threading.Condition.wait_for
+        with self.condition:
+            return self.condition.wait_for(lambda: self.count != seen, timeout)
+
+
+notifier = ChangeNotifier()
+
+
+def poll_changes(since: int, limit: int, timeout: float):
+    """Read a page of changes, waiting up to timeout seconds while there is none.
+
+    Returns the changes, the change_id to read the next page after, and
+    whether more changes may follow, like read_changes().
+    """
+    config = current_app.config
+    deadline = time.monotonic() + timeout
+    while True:
+        seen = notifier.count
+        changes, last, more = read_changes(
+            since, limit, config["DATASTORE_CHANGES_GAP_WAIT"]
+        )
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes, last, more
+        # release the database connection while waiting for a commit of this
+        # process, or the poll interval for the commits of other processes
+        db.session.rollback()
+        notifier.wait(seen, min(remaining, config["DATASTORE_CHANGES_POLL_INTERVAL"]))
+
+
+# https://docs.sqlalchemy.org/en/20/orm/events.html#sqlalchemy.orm.SessionEvents.after_commit
+# every Session class, including the sessions of the ASGI app's AsyncSessions
+@event.listens_for(Session, "after_commit")
+def notify_after_commit(session):
+    """Wake up the long-polls after a transaction with changes commits."""
+    if session.info.pop("datastore_changes", False):
+        notifier.notify()
+
+
+# https://docs.sqlalchemy.org/en/20/orm/events.html#mapper-events
+# ORM writes from the DatastoreController log their change in their flush
+@event.listens_for(DatastoreModel, "after_insert")
+@event.listens_for(DatastoreModel, "after_update")
+@event.listens_for(DatastoreModel, "after_delete")
+def change_after_write(mapper, connection, target):
+    """Log the change of a Datastore entry written by the ORM."""
+    record_changes(object_session(target), [target.datastore_id], connection)
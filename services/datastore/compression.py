@@ -0,0 +1,96 @@
+"""gzip and brotli compression of the response bodies.
+
+When DATASTORE_COMPRESSION is enabled, response bodies of at least
+DATASTORE_COMPRESSION_MIN_SIZE bytes are compressed with the best encoding the
+Accept-Encoding header of the client allows, brotli (when the brotli package
+is installed) or gzip. Streamed responses are left alone, the export endpoint
+compresses its own stream. A compressed response has the ETag of its body
+with the content coding as a suffix, e.g. "<etag>-gzip", see coded_etag().
+"""
+import gzip
+
+from flask import current_app, request
+
+
+# https://github.com/google/brotli/tree/master/python
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# a fast brotli quality, and the gzip level of nginx, for bodies built per request
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+# statuses without a body that can be compressed
+UNCOMPRESSED_STATUSES = (204, 206, 304)
+
+
+def compress_gzip(data: bytes) -> bytes:
+    """Compress a body with gzip."""
+    # https://docs.python.org/3/library/gzip.html#gzip.compress
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_brotli(data: bytes) -> bytes:
+    """Compress a body with brotli."""
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+# the content codings, in order of preference
+ENCODERS = {"gzip": compress_gzip}
+if brotli is not None:
+    ENCODERS = {"br": compress_brotli, **ENCODERS}
+
+
+def compress_response(response):
+    """Compress the body of a response, if it is large enough and accepted."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in UNCOMPRESSED_STATUSES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Vary
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < current_app.config["DATASTORE_COMPRESSION_MIN_SIZE"]:
+        return response
+    # https://werkzeug.palletsprojects.com/en/3.0.x/wrappers/#werkzeug.wrappers.Request.accept_encodings
+    encoding = request.accept_encodings.best_match(ENCODERS)
+    if encoding is None:
+        return response
+    response.set_data(ENCODERS[encoding](data))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        # https://datatracker.ietf.org/doc/html/rfc9110#name-etag
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+
+def coded_etag(etag: str, if_none_match) -> str:
+    """Return the ETag, or the one of a content coding of it that If-None-Match has.
+
+    A client which cached a compressed response sends its ETag, which then
+    matches, rather than the one of the identity body.
+    """
+    for encoding in ENCODERS:
+        if if_none_match.contains_weak(f"{etag}-{encoding}"):
+            return f"{etag}-{encoding}"
+    return etag
+
+
+class Compression(object):
+    """Flask extension registering the response compression hook."""
+
+    def init_app(self, app):
+        """Register the hook, if DATASTORE_COMPRESSION is enabled."""
+        if app.config["DATASTORE_COMPRESSION"]:
+            app.after_request(compress_response)
+
+
+compression = Compression()
@@ -1,6 +1,61 @@
 """Utility script to configure the Flask App."""
 import os
 
+from datastore.metrics import InstrumentedQueuePool
+
+
+# https://docs.sqlalchemy.org/en/20/core/pooling.html#setting-pool-options
+# https://docs.sqlalchemy.org/en/20/core/engines.html#sqlalchemy.create_engine
+def engine_options(database_uri: str) -> dict:
+    """Build the SQLAlchemy engine and connection pool options, from environment variables.
+
+    Each gunicorn worker has its own pool, so the database needs to accept
+    workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) connections.
+    """
+    # in-memory SQLite databases share a single connection, rather than a pool
+    if database_uri.startswith("sqlite") and (
+        ":memory:" in database_uri or database_uri.rstrip("/") == "sqlite:"
+    ):
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "10")),
+        # seconds to wait for a connection, before raising a TimeoutError
+        "pool_timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", "30")),
+        # seconds after which a connection is replaced, e.g. behind a proxy
+        "pool_recycle": int(os.getenv("DATABASE_POOL_RECYCLE", "3600")),
+        # test connections with a "SELECT 1" on checkout, to survive restarts
+        "pool_pre_ping": os.getenv("DATABASE_POOL_PRE_PING", "true") == "true",
+    }
+    # https://www.postgresql.org/docs/current/runtime-config-client.html#GUC-STATEMENT-TIMEOUT
+    statement_timeout = os.getenv("DATABASE_STATEMENT_TIMEOUT")
+    if statement_timeout and database_uri.startswith("postgresql"):
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={int(statement_timeout)}"
+        }
+    return options
+
+
+# https://flask-sqlalchemy.palletsprojects.com/en/3.1.x/binds/
+def replica_binds(database_urls: str) -> dict:
+    """Build the SQLALCHEMY_BINDS of comma separated read replica URLs."""
+    urls = [url.strip() for url in database_urls.split(",") if url.strip()]
+    return {
+        f"replica_{index}": {"url": url, **engine_options(url)}
+        for index, url in enumerate(urls)
+    }
+
+
+def parse_costs(value: str) -> dict:
+    """Parse "[METHOD:]endpoint=cost" pairs, separated by commas, into a dict."""
+    costs = {}
+    for pair in value.split(","):
+        if pair.strip():
+            name, _, cost = pair.partition("=")
+            costs[name.strip()] = float(cost)
+    return costs
+
 
 # https://flask.palletsprojects.com/en/2.3.x/config/
 # https://flask.palletsprojects.com/en/2.3.x/api/#flask.Config.from_object
@@ -13,9 +68,131 @@ class Config(object):
     # https://docs.sqlalchemy.org/en/20/core/engines.html#postgresql
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "postgresql://")
 
+    # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/config/#flask_sqlalchemy.config.SQLALCHEMY_ENGINE_OPTIONS
+    # pool size, overflow, timeout, recycle, pre-ping, and a PostgreSQL statement
+    # timeout in milliseconds, from the DATABASE_* environment variables
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # https://flask-sqlalchemy.palletsprojects.com/en/3.1.x/config/#flask_sqlalchemy.config.SQLALCHEMY_BINDS
+    # Read replicas, "replica_<n>", of the comma separated DATABASE_REPLICA_URLS,
+    # which GET requests read from, see datastore/replicas.py
+    SQLALCHEMY_BINDS = replica_binds(os.getenv("DATABASE_REPLICA_URLS", ""))
+
+    # Seconds between the "SELECT 1" health checks of a replica in use, and
+    # before retrying a replica that failed one, or lost its connection
+    DATASTORE_REPLICA_CHECK_INTERVAL = float(
+        os.getenv("DATASTORE_REPLICA_CHECK_INTERVAL", "5")
+    )
+    DATASTORE_REPLICA_RETRY_INTERVAL = float(
+        os.getenv("DATASTORE_REPLICA_RETRY_INTERVAL", "30")
+    )
+
+    # Seconds a client reads from the primary after its own write, longer than
+    # the replication lag, so that it reads its writes. Clients are pinned by a
+    # cookie, and by X-API-Key or address, in "memory" or "redis" (shared by the
+    # workers, at CACHE_REDIS_URL).
+    DATASTORE_READ_YOUR_WRITES = int(os.getenv("DATASTORE_READ_YOUR_WRITES", "5"))
+    DATASTORE_READ_YOUR_WRITES_BACKEND = os.getenv(
+        "DATASTORE_READ_YOUR_WRITES_BACKEND", "memory"
+    )
+
     # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/config/#flask_sqlalchemy.config.SQLALCHEMY_TRACK_MODIFICATIONS
     # If enabled, all insert, update, and delete operations on models are
     # recorded, then sent in models_committed and before_models_committed
     # signals when session.commit() is called. This adds a significant amount
     # of overhead to every session.
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Default and maximum number of rows returned by one page of GET /datastore,
+    # the collection is paginated using a keyset cursor on datastore_id.
+    DATASTORE_PAGE_SIZE = int(os.getenv("DATASTORE_PAGE_SIZE", "100"))
+    DATASTORE_MAX_PAGE_SIZE = int(os.getenv("DATASTORE_MAX_PAGE_SIZE", "1000"))
+
+    # https://docs.sqlalchemy.org/en/20/orm/queryguide/api.html#fetching-large-result-sets-with-yield-per
+    # Number of rows buffered from the server-side cursor per chunk, when
+    # streaming the collection with GET /datastore?stream=ndjson
+    DATASTORE_STREAM_CHUNK_SIZE = int(os.getenv("DATASTORE_STREAM_CHUNK_SIZE", "1000"))
+
+    # Number of rows written by each multi-row INSERT of POST /datastore/_bulk
+    DATASTORE_BULK_CHUNK_SIZE = int(os.getenv("DATASTORE_BULK_CHUNK_SIZE", "500"))
+
+    # Number of rows removed by each DELETE statement, and transaction, of
+    # POST /datastore/_delete
+    DATASTORE_DELETE_BATCH_SIZE = int(os.getenv("DATASTORE_DELETE_BATCH_SIZE", "1000"))
+
+    # Number of rows written by each COPY, or executemany INSERT, of "cli.py load_db"
+    DATASTORE_LOAD_CHUNK_SIZE = int(os.getenv("DATASTORE_LOAD_CHUNK_SIZE", "10000"))
+
+    # Read-through cache of GET /datastore/<id> responses, "lru", "redis" or "none".
+    # The "lru" cache is per process, so with multiple workers an entry updated
+    # by another worker may be served stale for up to DATASTORE_CACHE_TTL seconds.
+    DATASTORE_CACHE_BACKEND = os.getenv("DATASTORE_CACHE_BACKEND", "lru")
+    DATASTORE_CACHE_SIZE = int(os.getenv("DATASTORE_CACHE_SIZE", "1024"))
+    DATASTORE_CACHE_TTL = float(os.getenv("DATASTORE_CACHE_TTL", "60"))
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+    # Maintain the "datastore_summary" table of counts on every write, so that
+    # GET /aggregate?source=summary does not scan the "datastore" table.
+    # After enabling it on an existing database, run "python cli.py rebuild_summary".
+    DATASTORE_AGGREGATE_SUMMARY = (
+        os.getenv("DATASTORE_AGGREGATE_SUMMARY", "false") == "true"
+    )
+
+    # Log every write in the "datastore_changes" table, for the change feed of
+    # GET /datastore/_changes. A long-poll waits at most DATASTORE_CHANGES_MAX_WAIT
+    # seconds, checking for the changes of other processes every
+    # DATASTORE_CHANGES_POLL_INTERVAL seconds, and a page with a gap in its
+    # change_ids waits up to DATASTORE_CHANGES_GAP_WAIT seconds for the
+    # transactions which may not have committed it yet, before stopping there.
+    DATASTORE_CHANGES = os.getenv("DATASTORE_CHANGES", "false") == "true"
+    DATASTORE_CHANGES_MAX_WAIT = float(os.getenv("DATASTORE_CHANGES_MAX_WAIT", "30"))
+    DATASTORE_CHANGES_POLL_INTERVAL = float(
+        os.getenv("DATASTORE_CHANGES_POLL_INTERVAL", "1")
+    )
+    DATASTORE_CHANGES_GAP_WAIT = float(os.getenv("DATASTORE_CHANGES_GAP_WAIT", "1"))
+
+    # Queue the entries of POST /datastore to a background writer, which inserts
+    # them in batches of up to DATASTORE_GROUP_COMMIT_SIZE entries, waiting up to
+    # DATASTORE_GROUP_COMMIT_WAIT seconds to fill a batch, with one commit each.
+    # Requests beyond DATASTORE_GROUP_COMMIT_QUEUE_SIZE queued entries get an HTTP 503.
+    DATASTORE_GROUP_COMMIT = os.getenv("DATASTORE_GROUP_COMMIT", "false") == "true"
+    DATASTORE_GROUP_COMMIT_SIZE = int(os.getenv("DATASTORE_GROUP_COMMIT_SIZE", "100"))
+    DATASTORE_GROUP_COMMIT_WAIT = float(
+        os.getenv("DATASTORE_GROUP_COMMIT_WAIT", "0.002")
+    )
+    DATASTORE_GROUP_COMMIT_QUEUE_SIZE = int(
+        os.getenv("DATASTORE_GROUP_COMMIT_QUEUE_SIZE", "10000")
+    )
+
+    # Record request latency, SQL statement and JSON encoding metrics for /metrics,
+    # and a Server-Timing response header. No hooks are registered when disabled.
+    DATASTORE_INSTRUMENTATION = os.getenv("DATASTORE_INSTRUMENTATION", "true") == "true"
+
+    # Compress response bodies of at least DATASTORE_COMPRESSION_MIN_SIZE bytes,
+    # with brotli or gzip, when the client accepts it. Streams are not compressed.
+    DATASTORE_COMPRESSION = os.getenv("DATASTORE_COMPRESSION", "true") == "true"
+    DATASTORE_COMPRESSION_MIN_SIZE = int(
+        os.getenv("DATASTORE_COMPRESSION_MIN_SIZE", "1024")
+    )
+
+    # Token bucket rate limiting per client, by X-API-Key or address, "memory",
+    # "redis" (shared by the workers, at CACHE_REDIS_URL), or "none". Requests
+    # take the cost of their "[METHOD:]endpoint", or 1, from a bucket of BURST
+    # tokens refilled at RATE tokens per second.
+    DATASTORE_RATE_LIMIT_BACKEND = os.getenv("DATASTORE_RATE_LIMIT_BACKEND", "none")
+    DATASTORE_RATE_LIMIT_RATE = float(os.getenv("DATASTORE_RATE_LIMIT_RATE", "20"))
+    DATASTORE_RATE_LIMIT_BURST = float(os.getenv("DATASTORE_RATE_LIMIT_BURST", "100"))
+    DATASTORE_RATE_LIMIT_COSTS = parse_costs(
+        os.getenv(
+            "DATASTORE_RATE_LIMIT_COSTS",
+            "GET:datastorecontroller=5,datastorebulkcontroller=20,"
+            "datastorebulkdeletecontroller=20,datastoremultigetcontroller=5,"
+            "datastoreexportcontroller=50,aggregate=5",
+        )
+    )
+
+    # Shed load with an HTTP 503 when a process has this many requests in
+    # progress, or when database pool checkouts wait this many seconds on
+    # average, 0 disables each check
+    DATASTORE_SHED_IN_FLIGHT = int(os.getenv("DATASTORE_SHED_IN_FLIGHT", "0"))
+    DATASTORE_SHED_POOL_WAIT = float(os.getenv("DATASTORE_SHED_POOL_WAIT", "0"))
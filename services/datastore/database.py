@@ -1,7 +1,52 @@
-"""SQLAlchemy database connection and Marshmallow Serialization object."""
-from flask_marshmallow import Marshmallow
+"""SQLAlchemy database connection and Marshmallow Serialization object.
+
+flask-marshmallow, and the SQLAlchemy dialect modules, are only imported when
+first used, since no request needs Marshmallow, and only the dialect of the
+configured database is needed.
+"""
+import importlib
+from functools import cache
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+
+# https://flask-sqlalchemy.palletsprojects.com/en/3.1.x/api/#flask_sqlalchemy.session.Session
+class RoutingSession(Session):
+    """Session sending the SELECT statements of a request to its read replica.
+
+    The replica is the bind key chosen for the request in "g.replica", by
+    datastore.replicas, any other statement uses the primary database.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Return the replica engine for a SELECT, or the default engine."""
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get("replica")
+            if replica is not None and getattr(clause, "is_select", False):
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+# https://peps.python.org/pep-0562/
+def __getattr__(name: str):
+    """Create the Marshmallow object "ma" on first use."""
+    if name != "ma":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # https://flask-marshmallow.readthedocs.io/en/latest/
+    from flask_marshmallow import Marshmallow
+
+    globals()["ma"] = Marshmallow()
+    return globals()["ma"]
 
 
-db = SQLAlchemy()
-ma = Marshmallow()
+# https://docs.sqlalchemy.org/en/20/dialects/postgresql.html#insert-on-conflict-upsert
+# https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#insert-on-conflict-upsert
+@cache
+def dialect_insert(dialect_name: str):
+    """Return the INSERT construct supporting ON CONFLICT of a database dialect."""
+    return importlib.import_module(f"sqlalchemy.dialects.{dialect_name}").insert
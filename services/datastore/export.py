@@ -0,0 +1,62 @@
+"""Streaming export of the "datastore" table, as NDJSON or CSV.
+
+Rows are read in datastore_id order from a server-side cursor, and written
+in the input format of POST /datastore/_bulk and "cli.py load_db", plus their
+datastore_id, which "cli.py restore_db" keeps. An interrupted export resumes
+after the datastore_id of the last row it wrote.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from datastore.database import db
+from datastore.models.datastore_model import DatastoreModel
+from datastore.serializers import DATASTORE_COLUMNS
+
+
+# media types of the export formats
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# the fields of an exported row, in CSV column order
+EXPORT_FIELDS = ("datastore_id", "email", "uuid", "bool", "datetime")
+
+
+def export_row(row) -> dict:
+    """Convert a Datastore row to an input row, omitting null values."""
+    values = {
+        "datastore_id": row.datastore_id,
+        "email": row.email,
+        "uuid": str(row.uuid),
+    }
+    if row.bool is not None:
+        values["bool"] = "true" if row.bool else "false"
+    if row.datetime is not None:
+        values["datetime"] = row.datetime.isoformat()
+    return values
+
+
+def csv_header() -> str:
+    """Return the header line of a CSV export."""
+    return ",".join(EXPORT_FIELDS) + "\r\n"
+
+
+def format_rows(rows, export_format: str) -> str:
+    """Format a chunk of Datastore rows as NDJSON or CSV lines."""
+    if export_format == "ndjson":
+        return "".join(json.dumps(export_row(row)) + "\n" for row in rows)
+    buffer = io.StringIO()
+    # https://docs.python.org/3/library/csv.html#csv.DictWriter
+    csv.DictWriter(buffer, EXPORT_FIELDS).writerows(export_row(row) for row in rows)
+    return buffer.getvalue()
+
+
+def export_chunks(after: int = None, chunk_size: int = 1000):
+    """Yield the Datastore rows after a datastore_id, in lists of up to chunk_size rows."""
+    query = select(*DATASTORE_COLUMNS).order_by(DatastoreModel.datastore_id)
+    if after is not None:
+        query = query.where(DatastoreModel.datastore_id > after)
+    # https://docs.sqlalchemy.org/en/20/orm/queryguide/api.html#fetching-large-result-sets-with-yield-per
+    query = query.execution_options(yield_per=chunk_size)
+    yield from db.session.execute(query).partitions()
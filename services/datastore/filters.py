@@ -0,0 +1,259 @@
+"""Query string filters and sort orders for Datastore entry queries."""
+import base64
+import json
+from datetime import datetime as datetime_util
+
+from sqlalchemy import (
+    DateTime,
+    String,
+    TypeDecorator,
+    and_,
+    case,
+    func,
+    literal_column,
+    or_,
+    tuple_,
+    type_coerce,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from datastore.models.datastore_model import DatastoreModel
+from datastore.validation import parse_bool, parse_uuid
+
+
+# columns the collection can be sorted by, ties are ordered by datastore_id
+SORT_COLUMNS = {
+    "datastore_id": DatastoreModel.datastore_id,
+    "email": DatastoreModel.email,
+    "datetime": DatastoreModel.datetime,
+}
+
+
+# https://docs.sqlalchemy.org/en/20/core/compiler.html
+class email_domain(FunctionElement):
+    """SQL expression of the lowercase text after the "@" of an email column.
+
+    It is rendered for the dialect of the statement when it is compiled, so
+    the same query works with both the sync and the async engines.
+    """
+
+    type = String()
+    inherit_cache = True
+
+
+def render_email_domain(element, compiler, position, **kw):
+    """Render email_domain() with the dialect's string position function."""
+    (column,) = element.clauses
+    # constants are rendered inline, rather than as bound parameters, so that
+    # PostgreSQL matches the expression in the SELECT with the GROUP BY
+    at, zero, one = literal_column("'@'"), literal_column("0"), literal_column("1")
+    expression = case(
+        (
+            position(column, at) > zero,
+            func.lower(func.substr(column, position(column, at) + one)),
+        ),
+        else_=literal_column("''"),
+    )
+    return compiler.process(expression, **kw)
+
+
+@compiles(email_domain)
+def compile_email_domain(element, compiler, **kw):
+    """Render email_domain() with instr(), e.g. for SQLite."""
+    return render_email_domain(element, compiler, func.instr, **kw)
+
+
+# https://www.postgresql.org/docs/current/functions-string.html
+@compiles(email_domain, "postgresql")
+def compile_email_domain_postgresql(element, compiler, **kw):
+    """Render email_domain() with strpos() for PostgreSQL."""
+    return render_email_domain(element, compiler, func.strpos, **kw)
+
+
+def parse_filters(args) -> dict:
+    """Read the filters from the query string arguments, or raise a ValueError.
+
+    The filters are "email" (equal), "email_prefix", "domain", "uuid", "bool",
+    and a datetime range of "since" (inclusive) and "until" (exclusive).
+    """
+    filters = {}
+    for name in ("email", "email_prefix"):
+        if args.get(name) is not None:
+            filters[name] = args[name]
+    if args.get("domain") is not None:
+        filters["domain"] = args["domain"].lower()
+    if args.get("uuid") is not None:
+        filters["uuid"] = parse_uuid(args["uuid"])
+    if args.get("bool") is not None:
+        filters["bool"] = parse_bool(args["bool"])
+    for name in ("since", "until"):
+        if args.get(name) is not None:
+            try:
+                filters[name] = datetime_util.fromisoformat(args[name])
+            except ValueError:
+                raise ValueError(f"Invalid {name}, it must be an ISO 8601 datetime.")
+    return filters
+
+
+def apply_filters(query, filters: dict):
+    """Add the WHERE clauses of parsed filters to a query, as bound parameters."""
+    if "email" in filters:
+        query = query.where(DatastoreModel.email == filters["email"])
+    if "email_prefix" in filters:
+        # https://docs.sqlalchemy.org/en/20/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.startswith
+        query = query.where(
+            DatastoreModel.email.startswith(filters["email_prefix"], autoescape=True)
+        )
+    if "domain" in filters:
+        query = query.where(email_domain(DatastoreModel.email) == filters["domain"])
+    if "uuid" in filters:
+        query = query.where(DatastoreModel.uuid == filters["uuid"])
+    if "bool" in filters:
+        query = query.where(DatastoreModel.bool == filters["bool"])
+    if "since" in filters:
+        query = query.where(DatastoreModel.datetime >= filters["since"])
+    if "until" in filters:
+        query = query.where(DatastoreModel.datetime < filters["until"])
+    return query
+
+
+def parse_sort(value: str = None):
+    """Read a sort order, a column name optionally prefixed by "-" for descending.
+
+    Returns the column and whether it is descending, or raises a ValueError.
+    """
+    value = value or "datastore_id"
+    descending = value.startswith("-")
+    column = SORT_COLUMNS.get(value.lstrip("-"))
+    if column is None:
+        raise ValueError(f"Invalid sort, it must be one of {', '.join(SORT_COLUMNS)}.")
+    return column, descending
+
+
+# https://docs.sqlalchemy.org/en/20/core/custom_types.html#augmenting-existing-types
+class StoredDateTime(TypeDecorator):
+    """A DateTime column read and bound as text, in the form it is compared in.
+
+    SQLite compares datetimes as text, and the now() server default stores
+    them without the microseconds of a bound Python datetime, so on SQLite
+    the text is kept as stored. Other databases compare datetime values.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        """Use a String on SQLite, and a DateTime on other databases."""
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime())
+
+    def process_bind_param(self, value, dialect):
+        """Bind the text of a datetime, as a datetime except on SQLite."""
+        if value is None or dialect.name == "sqlite":
+            return value
+        return datetime_util.fromisoformat(value)
+
+    def process_result_value(self, value, dialect):
+        """Return the text of a datetime."""
+        if value is None or dialect.name == "sqlite":
+            return value
+        return value.isoformat()
+
+
+def cursor_column(column):
+    """Return a sort column, as the expression its cursor values are read from."""
+    # https://docs.sqlalchemy.org/en/20/core/sqlelement.html#sqlalchemy.sql.expression.type_coerce
+    if isinstance(column.type, DateTime):
+        return type_coerce(column, StoredDateTime())
+    return column
+
+
+def encode_cursor(row, sort: str = None) -> str:
+    """Return the cursor of the page after a row, for an "?after=" argument.
+
+    For the datastore_id order it is the datastore_id, and for other sort
+    orders an opaque token of the row's (sort_value, datastore_id) pair, so
+    the next page does not depend on the row still existing, or being unchanged.
+    """
+    column, _ = parse_sort(sort)
+    if column is DatastoreModel.datastore_id:
+        return str(row.datastore_id)
+    data = json.dumps([row.sort_value, row.datastore_id], separators=(",", ":"))
+    # https://docs.python.org/3/library/base64.html#base64.urlsafe_b64encode
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def parse_cursor(value: str, column):
+    """Read an "?after=" cursor of a sort column, or raise a ValueError.
+
+    Returns None, or the (sort value, datastore_id) pair to start after.
+    """
+    if value is None:
+        return None
+    if column is DatastoreModel.datastore_id:
+        try:
+            datastore_id = int(value)
+        except ValueError:
+            raise ValueError("Invalid after, it must be an int number.")
+        if datastore_id < 0:
+            raise ValueError("Invalid after, it must be at least 0.")
+        return datastore_id, datastore_id
+    try:
+        return parse_token(value, column)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid after, it must be the cursor of a Link header.")
+
+
+def parse_token(value: str, column):
+    """Decode a token of encode_cursor(), or raise a ValueError."""
+    data = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    cursor, datastore_id = json.loads(data)
+    if type(datastore_id) is not int:
+        raise ValueError("Invalid datastore_id.")
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("Invalid sort value.")
+    if cursor is not None and isinstance(column.type, DateTime):
+        # the text is bound as is, but has to be a datetime
+        datetime_util.fromisoformat(cursor)
+    return cursor, datastore_id
+
+
+def apply_sort(query, column, descending: bool = False, after: tuple = None):
+    """Order a query by a column and datastore_id, starting after a cursor.
+
+    The cursor is the (column, datastore_id) pair of the last entry of the
+    previous page, so the entries after it are a keyset range scan on the
+    matching (column, datastore_id) index. NULLs of a nullable column sort
+    after every value, or before them when descending, on every database.
+    """
+    datastore_id = DatastoreModel.datastore_id
+    if after is not None:
+        query = query.where(keyset_condition(column, descending, *after))
+    if descending:
+        order = column.desc().nulls_first() if column.nullable else column.desc()
+        return query.order_by(order, datastore_id.desc())
+    order = column.asc().nulls_last() if column.nullable else column
+    return query.order_by(order, datastore_id)
+
+
+def keyset_condition(column, descending: bool, value, after: int):
+    """Build the condition of the entries sorted after a (value, datastore_id) cursor."""
+    datastore_id = DatastoreModel.datastore_id
+    if column is datastore_id:
+        return datastore_id < after if descending else datastore_id > after
+    if value is None:
+        # the cursor is in the NULLs, which are last, or first when descending
+        nulls = and_(
+            column.is_(None),
+            datastore_id < after if descending else datastore_id > after,
+        )
+        return or_(nulls, column.is_not(None)) if descending else nulls
+    # the cursor values are bound with the types of the cursor columns
+    key, cursor = tuple_(cursor_column(column), datastore_id), (value, after)
+    if descending:
+        return key < cursor
+    if column.nullable:
+        return or_(key > cursor, column.is_(None))
+    return key > cursor
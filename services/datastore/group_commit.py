@@ -0,0 +1,188 @@
+"""Group commit of the Datastore entries created by POST /datastore.
+
+With DATASTORE_GROUP_COMMIT enabled, POST /datastore queues its validated
+entry to a background writer thread, rather than committing a transaction of
+its own. The writer inserts the queued entries in batches, of up to
+DATASTORE_GROUP_COMMIT_SIZE entries, or of the entries queued within
+DATASTORE_GROUP_COMMIT_WAIT seconds of the first one, each with one multi-row
+INSERT and one commit, so the concurrent requests share a transaction, and
+its fsync. Each request gets back its own created row, or its own conflict.
+
+When more than DATASTORE_GROUP_COMMIT_QUEUE_SIZE entries are queued, the
+request is shed with an HTTP 503, rather than waiting for ever longer.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app, has_app_context
+
+from datastore.bulk import insert_rows
+from datastore.metrics import Gauge, Histogram, registry
+
+
+BATCH_SIZE = registry.register(
+    Histogram(
+        "datastore_group_commit_batch_size",
+        "Entries inserted by each group commit transaction.",
+        buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+    )
+)
+
+QUEUE_LATENCY = registry.register(
+    Histogram(
+        "datastore_group_commit_queue_seconds",
+        "Time an entry waited in the group commit queue, before its batch was written.",
+    )
+)
+
+
+class GroupCommitWriter(object):
+    """Background thread inserting the queued entries of an app, in batches."""
+
+    def __init__(
+        self,
+        app,
+        max_size: int = 100,
+        max_wait: float = 0.002,
+        queue_size: int = 10000,
+    ):
+        """Initialize an empty queue, the thread is started by the first entry."""
+        self.app = app
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def submit(self, values: dict) -> Future:
+        """Queue the column values of an entry, or raise queue.Full.
+
+        The future resolves to the inserted row, or None if it conflicted.
+        """
+        self.start()
+        future = Future()
+        self.queue.put_nowait((values, time.perf_counter(), future))
+        return future
+
+    def start(self):
+        """Start the writer thread, in the process serving the requests."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped = False
+                self.thread = threading.Thread(
+                    target=self.run, name="datastore-group-commit", daemon=True
+                )
+                self.thread.start()
+
+    def close(self):
+        """Write the entries already queued, and stop the writer thread."""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def run(self):
+        """Write batches of the queued entries, until closed."""
+        while not self.stopped:
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+
+    def next_batch(self) -> list:
+        """Wait for an entry, then take the entries queued until the batch is full.
+
+        The batch is closed after max_wait seconds, or as soon as the queue is
+        empty when max_wait is 0.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.max_size:
+            try:
+                if deadline is None:
+                    item = self.queue.get()
+                    deadline = time.perf_counter() + self.max_wait
+                else:
+                    timeout = deadline - time.perf_counter()
+                    if timeout > 0:
+                        item = self.queue.get(timeout=timeout)
+                    else:
+                        item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.stopped = True
+                break
+            batch.append(item)
+        return batch
+
+    def write(self, batch: list):
+        """Insert a batch of entries, and resolve the future of each one.
+
+        Entries sharing a uuid never go into the same transaction, since the
+        inserted rows are matched to their entries by uuid.
+        """
+        now = time.perf_counter()
+        for _, queued, _ in batch:
+            QUEUE_LATENCY.observe(now - queued)
+        chunk, uuids = [], set()
+        for item in batch:
+            if item[0]["uuid"] in uuids:
+                self.write_chunk(chunk)
+                chunk, uuids = [], set()
+            chunk.append(item)
+            uuids.add(item[0]["uuid"])
+        self.write_chunk(chunk)
+
+    def write_chunk(self, chunk: list):
+        """Insert a chunk of entries in one transaction, with insert_rows()."""
+        BATCH_SIZE.observe(len(chunk))
+        try:
+            with self.app.app_context():
+                rows = insert_rows([values for values, _, _ in chunk])
+        except Exception as error:
+            # the requests of the chunk fail, rather than waiting for ever
+            for _, _, future in chunk:
+                future.set_exception(error)
+            return
+        for values, _, future in chunk:
+            future.set_result(rows.get(values["uuid"]))
+
+
+def queued_entries():
+    """Return the number of entries queued by the current app, if it groups commits."""
+    if not has_app_context():
+        return None
+    writer = current_app.extensions.get("datastore_group_commit")
+    return writer.queue.qsize() if writer is not None else None
+
+
+registry.register(
+    Gauge(
+        "datastore_group_commit_queued",
+        "Entries waiting in the group commit queue.",
+        queued_entries,
+    )
+)
+
+
+class GroupCommit(object):
+    """Flask extension creating the group commit writer, when it is enabled."""
+
+    def init_app(self, app):
+        """Create the writer of the app, if DATASTORE_GROUP_COMMIT is enabled."""
+        config = app.config
+        if not config["DATASTORE_GROUP_COMMIT"]:
+            return
+        app.extensions["datastore_group_commit"] = GroupCommitWriter(
+            app,
+            config["DATASTORE_GROUP_COMMIT_SIZE"],
+            config["DATASTORE_GROUP_COMMIT_WAIT"],
+            config["DATASTORE_GROUP_COMMIT_QUEUE_SIZE"],
+        )
+
+
+group_commit = GroupCommit()
@@ -0,0 +1,135 @@
+"""Request latency, database time and serialization time instrumentation.
+
+When DATASTORE_INSTRUMENTATION is enabled, every request records its latency,
+the number and duration of its SQL statements, the time spent encoding JSON,
+and its response size, in the /metrics histograms and a "Server-Timing"
+response header. When disabled, no hooks are registered at all.
+"""
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+from datastore.database import db
+from datastore.metrics import Counter, Histogram, registry
+
+
+# response size bucket upper bounds, in bytes, from 256 B to 16 MB
+SIZE_BUCKETS = tuple(256 * 4**power for power in range(9))
+
+REQUEST_DURATION = registry.register(
+    Histogram(
+        "datastore_http_request_duration_seconds",
+        "Time to handle a request, until the response is returned to the server.",
+    )
+)
+REQUEST_DB_DURATION = registry.register(
+    Histogram(
+        "datastore_http_request_db_seconds",
+        "Time spent executing SQL statements, per request.",
+    )
+)
+REQUEST_SERIALIZE_DURATION = registry.register(
+    Histogram(
+        "datastore_http_request_serialize_seconds",
+        "Time spent encoding JSON responses, per request.",
+    )
+)
+RESPONSE_SIZE = registry.register(
+    Histogram(
+        "datastore_http_response_size_bytes",
+        "Size of the response bodies, excluding streamed responses.",
+        buckets=SIZE_BUCKETS,
+    )
+)
+DB_STATEMENTS = registry.register(
+    Counter("datastore_db_statements_total", "SQL statements executed by requests.")
+)
+
+
+def record_serialization(seconds: float):
+    """Add time spent encoding JSON to the current request."""
+    if has_app_context():
+        g.serialize_time = g.get("serialize_time", 0.0) + seconds
+
+
+# https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.ConnectionEvents.before_cursor_execute
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Remember when a SQL statement started, on its execution context.
+
+    The context is discarded with the statement, so a statement which raises
+    leaves nothing behind on the pooled connection.
+    """
+    context.query_start_time = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Add the duration of a SQL statement to the current request."""
+    record_statement(context)
+
+
+# https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.DialectEvents.handle_error
+def handle_error(exception_context):
+    """Add the duration of a SQL statement which raised to the current request."""
+    if exception_context.execution_context is not None:
+        record_statement(exception_context.execution_context)
+
+
+def record_statement(context):
+    """Add the time since a statement started, if it was not recorded yet."""
+    start = vars(context).pop("query_start_time", None)
+    if start is not None and has_app_context():
+        g.db_time = g.get("db_time", 0.0) + time.perf_counter() - start
+        g.db_statements = g.get("db_statements", 0) + 1
+
+
+def before_request():
+    """Start timing a request."""
+    g.db_time = g.serialize_time = 0.0
+    g.db_statements = 0
+    g.request_start = time.perf_counter()
+
+
+def after_request(response):
+    """Record the metrics of a request, and add its Server-Timing header."""
+    total = time.perf_counter() - g.pop("request_start", time.perf_counter())
+    db_time = g.get("db_time", 0.0)
+    db_statements = g.get("db_statements", 0)
+    serialize_time = g.get("serialize_time", 0.0)
+    labels = {"endpoint": request.endpoint or "none", "method": request.method}
+
+    REQUEST_DURATION.observe(total, status=response.status_code, **labels)
+    REQUEST_DB_DURATION.observe(db_time, **labels)
+    REQUEST_SERIALIZE_DURATION.observe(serialize_time, **labels)
+    DB_STATEMENTS.inc(db_statements, **labels)
+    size = response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.observe(size, **labels)
+
+    # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+    response.headers["Server-Timing"] = (
+        f'db;dur={db_time * 1000:.3f};desc="{db_statements} statements", '
+        f"serialize;dur={serialize_time * 1000:.3f}, "
+        f"total;dur={total * 1000:.3f}"
+    )
+    return response
+
+
+class Instrumentation(object):
+    """Flask extension registering the request and SQL instrumentation hooks."""
+
+    def init_app(self, app):
+        """Register the hooks, if DATASTORE_INSTRUMENTATION is enabled."""
+        if not app.config["DATASTORE_INSTRUMENTATION"]:
+            return
+        app.before_request(before_request)
+        app.after_request(after_request)
+        app.json.instrumented = True
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", after_cursor_execute)
+                event.listen(engine, "handle_error", handle_error)
+
+
+instrumentation = Instrumentation()
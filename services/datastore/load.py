@@ -0,0 +1,150 @@
+"""High-throughput load of Datastore entries, from CSV or NDJSON files, or generated.
+
+PostgreSQL is loaded with "COPY ... FROM STDIN", other databases with a
+batched executemany INSERT. The input is read, validated and written one
+chunk at a time, so memory use is constant whatever the number of rows.
+"""
+import csv
+import io
+import json
+import uuid as uuid_util
+from datetime import datetime as datetime_util
+from datetime import timedelta, timezone
+
+from sqlalchemy import func, select
+
+from datastore.aggregate import rebuild_summary, summary_enabled
+from datastore.bulk import row_values
+from datastore.changes import record_loaded
+from datastore.database import db
+from datastore.models.datastore_model import DatastoreModel
+
+
+def read_csv(file):
+    """Read input rows from a CSV file with a header row, ignoring empty values."""
+    # https://docs.python.org/3/library/csv.html#csv.DictReader
+    for row in csv.DictReader(file):
+        yield {name: value for name, value in row.items() if value}
+
+
+def read_ndjson(file):
+    """Read input rows from a newline delimited JSON file, ignoring blank lines."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def synthetic_rows(count: int):
+    """Generate count input rows, with unique emails and UUIDs, one second apart."""
+    start = datetime_util(2023, 1, 1)
+    for index in range(count):
+        uuid = uuid_util.uuid4()
+        yield {
+            "email": f"load.{uuid.hex}@example.com",
+            "uuid": str(uuid),
+            "bool": "true" if index % 2 else "false",
+            "datetime": (start + timedelta(seconds=index)).isoformat(
+                timespec="microseconds"
+            ),
+        }
+
+
+def copy_chunk(chunk: list):
+    """Write a chunk of column values with PostgreSQL "COPY ... FROM STDIN"."""
+    columns = list(chunk[0])
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [values[column] for column in columns] for values in chunk
+    )
+    buffer.seek(0)
+    # https://www.postgresql.org/docs/current/sql-copy.html
+    # https://www.psycopg.org/docs/cursor.html#cursor.copy_expert
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {DatastoreModel.__tablename__} ({', '.join(columns)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def insert_chunk(chunk: list):
+    """Write a chunk of column values with one executemany INSERT."""
+    # https://docs.sqlalchemy.org/en/20/core/connections.html#engine-insertmanyvalues
+    db.session.execute(db.insert(DatastoreModel.__table__), chunk)
+
+
+def restore_sequence():
+    """Move the PostgreSQL datastore_id sequence past the restored datastore_ids."""
+    # https://www.postgresql.org/docs/current/functions-sequence.html
+    table = DatastoreModel.__tablename__
+    db.session.execute(
+        select(
+            func.setval(
+                func.pg_get_serial_sequence(table, "datastore_id"),
+                select(func.max(DatastoreModel.datastore_id)).scalar_subquery(),
+            )
+        )
+    )
+    db.session.commit()
+
+
+def load_values(row, started: datetime_util, keep_ids: bool = False) -> dict:
+    """Validate an input row, and convert it to the column values to load.
+
+    A row without a datetime gets started, and with keep_ids, a row keeps its
+    datastore_id. Raises a KeyError, TypeError or ValueError if it is invalid.
+    """
+    values = row_values(row)
+    if keep_ids:
+        values["datastore_id"] = int(row["datastore_id"])
+    if not isinstance(values["datetime"], datetime_util):
+        values["datetime"] = started
+    return values
+
+
+def commit_chunk(chunk: list):
+    """Write a chunk of column values, log their changes, and commit."""
+    if db.engine.dialect.name == "postgresql":
+        copy_chunk(chunk)
+    else:
+        insert_chunk(chunk)
+    record_loaded(db.session, [values["uuid"] for values in chunk])
+    db.session.commit()
+
+
+def finish_load(keep_ids: bool = False):
+    """Restore the datastore_id sequence after keep_ids, and rebuild the summary."""
+    if keep_ids and db.engine.dialect.name == "postgresql":
+        restore_sequence()
+    # COPY and executemany bypass the ORM events that maintain the summary
+    if summary_enabled():
+        rebuild_summary()
+
+
+def load_rows(rows, chunk_size: int = 10000, keep_ids: bool = False):
+    """Validate and load an iterable of input rows, committing each chunk.
+
+    Yields the number of rows loaded, and of invalid rows skipped, per chunk.
+    Rows without a datetime get the (UTC) time the load started. With
+    keep_ids, the rows of an export are restored with their datastore_id.
+    Raises an IntegrityError if a chunk has an email, UUID or datastore_id
+    that already exists, after the previous chunks have been committed.
+    The change log is written per chunk, with an INSERT ... SELECT by uuid.
+    """
+    started = datetime_util.now(timezone.utc).replace(tzinfo=None)
+    chunk, invalid = [], 0
+    for row in rows:
+        try:
+            chunk.append(load_values(row, started, keep_ids))
+        except (KeyError, TypeError, ValueError):
+            invalid += 1
+            continue
+        if len(chunk) >= chunk_size:
+            commit_chunk(chunk)
+            yield len(chunk), invalid
+            chunk, invalid = [], 0
+    if chunk:
+        commit_chunk(chunk)
+    if chunk or invalid:
+        yield len(chunk), invalid
+    finish_load(keep_ids)
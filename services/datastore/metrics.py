@@ -0,0 +1,246 @@
+"""Process metrics, rendered in the Prometheus text exposition format.
+
+https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+"""
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+# histogram bucket upper bounds, in seconds, from 0.5 ms to 10 s
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def format_labels(labels: tuple) -> str:
+    """Format (name, value) label pairs as a Prometheus label set."""
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Counter(object):
+    """Monotonically increasing count, optionally per set of labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        """Initialize the counter at zero."""
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """Increment the counter of a set of labels."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """Yield the (name, labels, value) samples of the counter."""
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            yield self.name, labels, value
+
+
+class Gauge(object):
+    """Current value, read from a callback when the metrics are rendered.
+
+    The callback returns a number, or a dict of label tuples to numbers, or
+    None when there is nothing to report.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback):
+        """Initialize the gauge with its callback."""
+        self.name = name
+        self.help = help
+        self.callback = callback
+
+    def samples(self):
+        """Yield the (name, labels, value) samples of the gauge."""
+        value = self.callback()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in value.items():
+            yield self.name, labels, number
+
+
+class Histogram(object):
+    """Distribution of observed values in cumulative buckets, per set of labels."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        """Initialize the histogram with its bucket upper bounds."""
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Record an observed value for a set of labels."""
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # one count per bucket, plus +Inf, then the sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """Yield the cumulative bucket, sum and count samples of the histogram."""
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in self.values.items()]
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                yield f"{self.name}_bucket", labels + (("le", bound),), total
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, total
+
+
+class Registry(object):
+    """Collection of metrics, rendered together."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.metrics = []
+
+    def register(self, metric):
+        """Add a metric to the registry, and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+POOL_CHECKOUT_WAIT = registry.register(
+    Histogram(
+        "datastore_db_pool_checkout_wait_seconds",
+        "Time waiting for a free, or new, database connection from the pool.",
+    )
+)
+POOL_CHECKOUT = registry.register(
+    Histogram(
+        "datastore_db_pool_checkout_seconds",
+        "Time to check out a database connection, including the pre-ping.",
+    )
+)
+POOL_CONNECTION_HELD = registry.register(
+    Histogram(
+        "datastore_db_pool_connection_held_seconds",
+        "Time a database connection was checked out, before being returned.",
+    )
+)
+POOL_TIMEOUTS = registry.register(
+    Counter(
+        "datastore_db_pool_timeouts_total",
+        "Checkouts that failed after waiting pool_timeout seconds.",
+    )
+)
+
+
+# https://docs.sqlalchemy.org/en/20/core/pooling.html#sqlalchemy.pool.QueuePool
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool which records the checkout wait and latency histograms.
+
+    It also keeps a moving average of the checkout waits, read by the load
+    shedding of datastore.ratelimit.
+    """
+
+    local = threading.local()
+
+    # weight of the latest checkout wait in wait_average
+    WAIT_SMOOTHING = 0.2
+    wait_average = 0.0
+    wait_updated = float("-inf")
+
+    def recent_wait(self, max_age: float = 1.0) -> float:
+        """Return the average checkout wait, or 0 if no checkout was that recent."""
+        if time.perf_counter() - self.wait_updated > max_age:
+            return 0.0
+        return self.wait_average
+
+    def connect(self):
+        """Check out a connection, recording the latency, and any timeout."""
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT.observe(time.perf_counter() - start)
+
+    def _do_get(self):
+        """Get a connection from the queue, recording the time it took."""
+        # QueuePool._do_get() retries by calling itself, only time the outer call
+        if getattr(self.local, "waiting", False):
+            return super()._do_get()
+        self.local.waiting = True
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.local.waiting = False
+            self.wait_updated = time.perf_counter()
+            wait = self.wait_updated - start
+            POOL_CHECKOUT_WAIT.observe(wait)
+            self.wait_average += self.WAIT_SMOOTHING * (wait - self.wait_average)
+
+
+# https://docs.sqlalchemy.org/en/20/core/events.html#connection-pool-events
+@event.listens_for(InstrumentedQueuePool, "checkout")
+def pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    """Remember when a connection was checked out."""
+    connection_record.info["checkout_time"] = time.perf_counter()
+
+
+@event.listens_for(InstrumentedQueuePool, "checkin")
+def pool_checkin(dbapi_connection, connection_record):
+    """Record how long a connection was checked out."""
+    start = connection_record.info.pop("checkout_time", None)
+    if start is not None:
+        POOL_CONNECTION_HELD.observe(time.perf_counter() - start)
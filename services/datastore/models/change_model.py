@@ -0,0 +1,31 @@
+"""Datastore Change Model class, for the /datastore/_changes endpoint."""
+from datastore.database import db
+
+
+# https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/models/
+class DatastoreChangeModel(db.Model):
+    """Datastore Change, SQLAlchemy Database Model class.
+
+    Log of the writes to the "datastore" table, one row per created, updated
+    or deleted entry, in commit order of its change_id. The row of a deleted
+    entry is its tombstone, since the entry itself is gone.
+
+    Attributes
+    ----------
+    change_id : int
+        increasing ID of the change, the cursor of the change feed
+    datastore_id : int
+        datastore_id of the changed entry
+    changed_at : DateTime
+        UTC date and time of the change
+    """
+
+    __tablename__ = "datastore_changes"
+
+    # https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#sqlite-autoincrement-behavior
+    # change_ids are never reused, even once the latest changes are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    change_id = db.Column(db.Integer, primary_key=True)
+    datastore_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime(), nullable=False)
@@ -1,9 +1,13 @@
-"""Datastore Model and Schema classes."""
+"""Datastore Model class."""
 import uuid as uuid_util
-from datetime import datetime as datetime_util
 
-from datastore.database import db, ma
-from datastore.utility import strtobool
+from datastore.database import db
+from datastore.validation import (
+    EMAIL_MAX_LENGTH,
+    parse_bool,
+    parse_datetime,
+    parse_uuid,
+)
 
 
 # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/models/
@@ -23,23 +27,49 @@ class DatastoreModel(db.Model):
         classic Boolean
     datetime : DateTime
         date and time of the entries creation
+    version : int
+        incremented on every update, for optimistic concurrency control
 
     Methods
     -------
     __init__(self, email="test@gmail.com")
+    update(self, **fields)
     """
 
     # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/api/#flask_sqlalchemy.model.Model.__tablename__
     __tablename__ = "datastore"
 
+    # https://docs.sqlalchemy.org/en/20/core/constraints.html#indexes
+    # indexes for the filters and sort orders of GET /datastore, each ending in
+    # datastore_id, so that keyset pagination is an index range scan
+    # https://www.postgresql.org/docs/current/indexes-opclass.html
+    # the pattern ops index lets PostgreSQL use an index for "LIKE 'prefix%'"
+    __table_args__ = (
+        db.Index("ix_datastore_datetime_datastore_id", "datetime", "datastore_id"),
+        db.Index("ix_datastore_bool_datastore_id", "bool", "datastore_id"),
+        db.Index(
+            "ix_datastore_email_pattern",
+            "email",
+            postgresql_ops={"email": "varchar_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
     # https://docs.sqlalchemy.org/en/20/core/metadata.html#sqlalchemy.schema.Column
     # https://docs.sqlalchemy.org/en/20/core/type_basics.html#generic-camelcase-types
     # https://stackoverflow.com/questions/13370317/sqlalchemy-default-datetime
     datastore_id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(128), unique=True, nullable=False)
+    email = db.Column(db.String(EMAIL_MAX_LENGTH), unique=True, nullable=False)
     uuid = db.Column(db.Uuid(), unique=True, nullable=False)
     bool = db.Column(db.Boolean(), default=True, nullable=True)
     datetime = db.Column(db.DateTime(), nullable=True, server_default=db.func.now())
+    version = db.Column(db.Integer(), nullable=False, default=1, server_default="1")
+
+    # https://docs.sqlalchemy.org/en/20/orm/versioning.html
+    # every ORM UPDATE and DELETE checks, and increments, the version of the row,
+    # raising a StaleDataError if it was changed by another transaction
+    # https://docs.sqlalchemy.org/en/20/orm/mapping_api.html#sqlalchemy.orm.Mapper.params.eager_defaults
+    # the server default datetime is read back with RETURNING during the INSERT
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
 
     def __init__(
         self,
@@ -48,32 +78,22 @@ class DatastoreModel(db.Model):
         bool: str = "false",
         datetime: str = "",
     ):
-        """Initialize the Datastore Model."""
+        """Initialize the Datastore Model, from Strings or parse_entry() values."""
         self.email = email
 
         # create a new random UUID if one is not given
         if not uuid:
             self.uuid = uuid_util.uuid4()
         else:
-            self.uuid = uuid_util.UUID(uuid)
+            self.uuid = parse_uuid(uuid)
 
         # type cast the String to a Boolean
-        self.bool = strtobool(bool)
+        self.bool = parse_bool(bool)
 
         if datetime:
-            self.datetime = datetime_util.strptime(datetime, "%Y-%m-%dT%H:%M:%S.%f")
-
-
-# https://marshmallow.readthedocs.io/en/stable/marshmallow.schema.html
-class DatastoreSchema(ma.Schema):
-    """Datastore, Flask-Marshmallow Schema class, which wraps the SQLAlchemy Model."""
-
-    class Meta:
-        """Flask-Marshmallow Meta Schema class to configure the DatastoreSchema class."""
-
-        model = DatastoreModel
-        fields = ("datastore_id", "email", "uuid", "bool", "datetime", "_links")
-
+            self.datetime = parse_datetime(datetime)
 
-datastore_schema = DatastoreSchema()
-datastore_schemas = DatastoreSchema(many=True)  # note the plural variable name
+    def update(self, **fields):
+        """Overwrite the given fields of the Datastore Model, with parse_entry() values."""
+        for name, value in fields.items():
+            setattr(self, name, value)
@@ -0,0 +1,30 @@
+"""Datastore Summary Model class, for the /aggregate endpoint."""
+from datastore.database import db
+
+
+# https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/models/
+class DatastoreSummaryModel(db.Model):
+    """Datastore Summary, SQLAlchemy Database Model class.
+
+    Incrementally maintained count of the Datastore entries, per day, bool and
+    email domain, which /aggregate?source=summary reads instead of scanning the
+    "datastore" table.
+
+    Attributes
+    ----------
+    day : Date
+        day of the entries datetime
+    bool : bool
+        bool of the entries
+    domain : string
+        lowercase email address domain of the entries
+    count : int
+        number of entries
+    """
+
+    __tablename__ = "datastore_summary"
+
+    day = db.Column(db.Date(), primary_key=True)
+    bool = db.Column(db.Boolean(), primary_key=True)
+    domain = db.Column(db.String(128), primary_key=True)
+    count = db.Column(db.Integer(), nullable=False, default=0)
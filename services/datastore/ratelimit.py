@@ -0,0 +1,272 @@
+"""Per-client rate limiting, and load shedding, of the requests.
+
+Rate limiting gives each client, identified by its X-API-Key header, or else
+its address, a token bucket of DATASTORE_RATE_LIMIT_BURST tokens, refilled at
+DATASTORE_RATE_LIMIT_RATE tokens per second. Each request takes the cost of
+its endpoint, from DATASTORE_RATE_LIMIT_COSTS, or 1, and is rejected with an
+HTTP 429 when the bucket is short. The buckets are kept in process ("memory"),
+or in a Redis compatible server shared by every worker ("redis").
+
+Load shedding rejects requests with an HTTP 503 while the process already has
+DATASTORE_SHED_IN_FLIGHT requests in progress, or while the recent database
+pool checkouts waited over DATASTORE_SHED_POOL_WAIT seconds on average, so
+that the admitted requests finish rather than all of them timing out. Both
+responses have a Retry-After header. /metrics is never limited.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, make_response, request
+
+from datastore.database import db
+from datastore.metrics import Counter, Gauge, registry
+
+
+# endpoints which are never limited, or shed
+EXEMPT_ENDPOINTS = ("metrics",)
+
+REJECTED = registry.register(
+    Counter(
+        "datastore_http_rejected_total",
+        "Requests rejected by rate limiting, or shed under load, by reason.",
+    )
+)
+
+
+def take_tokens(tokens: float, updated: float, now: float, rate, burst, cost):
+    """Refill a token bucket for the time since it was updated, and take cost tokens.
+
+    Returns the tokens left, and whether the cost was taken.
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, True
+    return tokens, False
+
+
+class MemoryRateLimiter(object):
+    """In-process token buckets, for up to max_clients of the latest clients."""
+
+    name = "memory"
+
+    def __init__(
+        self, rate: float, burst: float, max_clients: int = 10000, clock=time.monotonic
+    ):
+        """Initialize empty buckets, refilled at rate tokens per second."""
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key: str, cost: float) -> float:
+        """Take cost tokens from a client's bucket, or return the seconds to wait."""
+        with self.lock:
+            now = self.clock()
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens, taken = take_tokens(
+                tokens, updated, now, self.rate, self.burst, cost
+            )
+            # a forgotten client starts again with a full bucket
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return 0.0 if taken else (cost - tokens) / self.rate
+
+
+# https://redis.io/docs/interact/programmability/eval-intro/
+# the token bucket of take_tokens(), updated atomically by the server
+TAKE_TOKENS_SCRIPT = """
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local taken = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    taken = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return {taken, tostring(tokens)}
+"""
+
+
+class RedisRateLimiter(object):
+    """Token buckets shared between processes, in a Redis compatible server.
+
+    The client only needs the eval() method of redis.Redis, so a local fake
+    can stand in for it. A bucket expires once it would be full again.
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        client,
+        rate: float,
+        burst: float,
+        prefix: str = "ratelimit:",
+        clock=time.time,
+    ):
+        """Initialize the rate limiter with a Redis client, and a key prefix."""
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self.clock = clock
+
+    def take(self, key: str, cost: float) -> float:
+        """Take cost tokens from a client's bucket, or return the seconds to wait."""
+        # https://redis-py.readthedocs.io/en/stable/commands.html#redis.commands.core.CoreCommands.eval
+        taken, tokens = self.client.eval(
+            TAKE_TOKENS_SCRIPT,
+            1,
+            f"{self.prefix}{key}",
+            self.rate,
+            self.burst,
+            cost,
+            self.clock(),
+        )
+        return 0.0 if taken else (cost - float(tokens)) / self.rate
+
+
+def client_key() -> str:
+    """Return the rate limiting key of the client, its API key, or its address."""
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return f"key:{api_key}"
+    return f"addr:{request.remote_addr}"
+
+
+def request_cost(costs: dict) -> float:
+    """Return the cost of the request, by method and endpoint, or endpoint."""
+    endpoint = request.endpoint or "none"
+    cost = costs.get(f"{request.method}:{endpoint}")
+    return cost if cost is not None else costs.get(endpoint, 1.0)
+
+
+def reject(message: str, code: int, retry_after: float, reason: str):
+    """Return a rejection response, with a Retry-After header in whole seconds."""
+    REJECTED.inc(reason=reason)
+    response = make_response(jsonify(message=message), code)
+    # https://datatracker.ietf.org/doc/html/rfc9110#name-retry-after
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class InFlight(object):
+    """Count of the requests in progress in this process."""
+
+    def __init__(self):
+        """Initialize the count at 0."""
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def enter(self, limit: int) -> bool:
+        """Count one more request, unless limit requests are already in progress."""
+        with self.lock:
+            if limit and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def exit(self):
+        """Count one less request."""
+        with self.lock:
+            self.count -= 1
+
+
+in_flight = InFlight()
+
+registry.register(
+    Gauge(
+        "datastore_http_requests_in_flight",
+        "Requests in progress in this process.",
+        lambda: in_flight.count,
+    )
+)
+
+
+def shed_load():
+    """Reject the request with an HTTP 503, when the process is overloaded."""
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    config = current_app.config
+    max_wait = config["DATASTORE_SHED_POOL_WAIT"]
+    # https://docs.sqlalchemy.org/en/20/core/pooling.html#sqlalchemy.pool.QueuePool
+    recent_wait = getattr(db.engine.pool, "recent_wait", None)
+    if max_wait and recent_wait is not None and recent_wait() > max_wait:
+        return reject("The service is overloaded, retry later.", 503, 1, "pool_wait")
+    if not in_flight.enter(config["DATASTORE_SHED_IN_FLIGHT"]):
+        return reject("The service is overloaded, retry later.", 503, 1, "in_flight")
+    g.in_flight = True
+    return None
+
+
+def leave(exception=None):
+    """Count the end of an admitted request."""
+    if g.pop("in_flight", False):
+        in_flight.exit()
+
+
+def limit_rate():
+    """Reject the request with an HTTP 429, when its client is out of tokens."""
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    limiter = current_app.extensions["datastore_rate_limit"]
+    cost = min(
+        request_cost(current_app.config["DATASTORE_RATE_LIMIT_COSTS"]), limiter.burst
+    )
+    retry_after = limiter.take(client_key(), cost)
+    if retry_after:
+        return reject(
+            f"Too many requests, retry after {math.ceil(retry_after)} seconds.",
+            429,
+            retry_after,
+            "rate_limit",
+        )
+    return None
+
+
+class RateLimit(object):
+    """Flask extension registering the load shedding, and rate limiting, hooks."""
+
+    def init_app(self, app, backend=None):
+        """Register the hooks which are enabled, creating the rate limiter backend."""
+        config = app.config
+        if config["DATASTORE_SHED_IN_FLIGHT"] or config["DATASTORE_SHED_POOL_WAIT"]:
+            app.before_request(shed_load)
+            app.teardown_request(leave)
+        if backend is None:
+            backend = self.create_backend(config)
+        if backend is not None:
+            app.extensions["datastore_rate_limit"] = backend
+            app.before_request(limit_rate)
+
+    @staticmethod
+    def create_backend(config):
+        """Create the rate limiter named by DATASTORE_RATE_LIMIT_BACKEND."""
+        name = config["DATASTORE_RATE_LIMIT_BACKEND"]
+        rate = config["DATASTORE_RATE_LIMIT_RATE"]
+        burst = config["DATASTORE_RATE_LIMIT_BURST"]
+        if name == "memory":
+            return MemoryRateLimiter(rate, burst)
+        if name == "redis":
+            # https://pypi.org/project/redis/, only required by this backend
+            import redis
+
+            return RedisRateLimiter(
+                redis.Redis.from_url(config["CACHE_REDIS_URL"]), rate, burst
+            )
+        if name == "none":
+            return None
+        raise ValueError(f"Invalid DATASTORE_RATE_LIMIT_BACKEND {name!r}.")
+
+
+rate_limit = RateLimit()
@@ -0,0 +1,262 @@
+"""Routing of the reads of GET requests to the read replicas, round-robin.
+
+The replicas are the "replica_<n>" SQLALCHEMY_BINDS, of DATABASE_REPLICA_URLS.
+Each GET or HEAD request is given the next healthy replica, which the
+RoutingSession sends its SELECT statements to, while other requests, and the
+CLI, use the primary. A replica in use is checked with a "SELECT 1" every
+DATASTORE_REPLICA_CHECK_INTERVAL seconds, and one failing a check, or losing
+its connection, is skipped for DATASTORE_REPLICA_RETRY_INTERVAL seconds. When
+no replica is healthy, the primary is read.
+
+A successful write pins the reads of the client to the primary for
+DATASTORE_READ_YOUR_WRITES seconds, so that it reads its own writes despite
+the replication lag. The client is pinned by a cookie, and by its identity,
+its X-API-Key header, or else its address, for clients which do not keep
+cookies. The pins are kept in process ("memory"), or in a Redis compatible
+server shared by every worker ("redis"). Other clients may read, and cache,
+an entry from a lagging replica, for up to DATASTORE_CACHE_TTL seconds.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from datastore.database import db
+from datastore.metrics import Counter, Gauge, registry
+from datastore.ratelimit import client_key
+
+
+# the cookie pinning the reads of a client to the primary, after a write
+PIN_COOKIE = "datastore_primary"
+
+# methods which do not write, so are read from a replica
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+DB_QUERIES = registry.register(
+    Counter(
+        "datastore_db_queries_total",
+        "SQL statements executed, per database, the primary or a replica.",
+    )
+)
+
+
+class ReplicaSet(object):
+    """The read replica engines of an app, and their health."""
+
+    def __init__(
+        self,
+        engines: dict,
+        check_interval: float = 5,
+        retry_interval: float = 30,
+        clock=time.monotonic,
+    ):
+        """Initialize the replicas, by bind key, as healthy but unchecked."""
+        self.engines = engines
+        self.keys = list(engines)
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.checked = {}
+        self.down_until = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def check(self, key: str) -> bool:
+        """Check a replica with a "SELECT 1", marking it down if it fails."""
+        try:
+            with self.engines[key].connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except SQLAlchemyError:
+            self.mark_down(key)
+            return False
+        with self.lock:
+            self.checked[key] = self.clock()
+        return True
+
+    def mark_down(self, key: str):
+        """Skip a replica for retry_interval seconds."""
+        with self.lock:
+            self.down_until[key] = self.clock() + self.retry_interval
+            self.checked.pop(key, None)
+
+    def healthy(self, key: str) -> bool:
+        """Check if a replica is up, checking it again if its last check is too old."""
+        now = self.clock()
+        if self.down_until.get(key, now) > now:
+            return False
+        checked = self.checked.get(key)
+        if checked is not None and now - checked < self.check_interval:
+            return True
+        return self.check(key)
+
+    def choose(self):
+        """Return the bind key of the next healthy replica, or None for the primary."""
+        start = next(self.counter)
+        for offset in range(len(self.keys)):
+            key = self.keys[(start + offset) % len(self.keys)]
+            if self.healthy(key):
+                return key
+        return None
+
+    def status(self) -> dict:
+        """Return 1 for each replica which is up, and 0 for each one skipped."""
+        now = self.clock()
+        return {
+            (("database", key),): int(self.down_until.get(key, now) <= now)
+            for key in self.keys
+        }
+
+
+class MemoryPins(object):
+    """In-process pins of clients to the primary, for up to max_clients of them."""
+
+    name = "memory"
+
+    def __init__(self, max_clients: int = 10000, clock=time.monotonic):
+        """Initialize no pins."""
+        self.max_clients = max_clients
+        self.clock = clock
+        self.expires = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pin(self, key: str, seconds: float):
+        """Pin a client to the primary for seconds."""
+        with self.lock:
+            self.expires.pop(key, None)
+            self.expires[key] = self.clock() + seconds
+            while len(self.expires) > self.max_clients:
+                self.expires.popitem(last=False)
+
+    def pinned(self, key: str) -> bool:
+        """Check if a client is pinned to the primary."""
+        with self.lock:
+            return self.expires.get(key, 0) > self.clock()
+
+
+class RedisPins(object):
+    """Pins of clients to the primary, shared between processes, in a Redis server.
+
+    The client only needs the set() and exists() methods of redis.Redis, so a
+    local fake can stand in for it. A pin is a key, expiring with the pin.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "primary:"):
+        """Initialize the pins with a Redis client, and a key prefix."""
+        self.client = client
+        self.prefix = prefix
+
+    def pin(self, key: str, seconds: float):
+        """Pin a client to the primary for seconds."""
+        # https://redis.io/commands/set/
+        self.client.set(f"{self.prefix}{key}", b"1", px=max(1, int(seconds * 1000)))
+
+    def pinned(self, key: str) -> bool:
+        """Check if a client is pinned to the primary."""
+        return bool(self.client.exists(f"{self.prefix}{key}"))
+
+
+def replica_status():
+    """Return the health of the replicas of the current app, if it has any."""
+    if not has_app_context():
+        return None
+    replicas = current_app.extensions.get("datastore_replicas")
+    return replicas.status() if replicas is not None else None
+
+
+registry.register(
+    Gauge(
+        "datastore_db_replica_up",
+        "1 if a read replica is used, 0 if it is skipped after a failure.",
+        replica_status,
+    )
+)
+
+
+def route_request():
+    """Give a request which only reads a replica, unless its client is pinned."""
+    if request.method not in READ_METHODS or PIN_COOKIE in request.cookies:
+        return
+    if not current_app.extensions["datastore_pins"].pinned(client_key()):
+        g.replica = current_app.extensions["datastore_replicas"].choose()
+
+
+def pin_writer(response):
+    """Pin the reads of a client to the primary, after a successful write."""
+    if request.method not in READ_METHODS and response.status_code < 400:
+        seconds = current_app.config["DATASTORE_READ_YOUR_WRITES"]
+        current_app.extensions["datastore_pins"].pin(client_key(), seconds)
+        # https://flask.palletsprojects.com/en/2.3.x/api/#flask.Response.set_cookie
+        response.set_cookie(
+            PIN_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax"
+        )
+    return response
+
+
+def count_statements(database: str):
+    """Return an event listener counting the SQL statements of a database."""
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        # https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.ConnectionEvents.before_cursor_execute
+        DB_QUERIES.inc(database=database)
+
+    return before_cursor_execute
+
+
+def mark_down_on_error(replicas: ReplicaSet, key: str):
+    """Return an event listener marking a replica down when its connection fails."""
+
+    def handle_error(context):
+        # https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.DialectEvents.handle_error
+        if context.is_disconnect or context.connection is None:
+            replicas.mark_down(key)
+
+    return handle_error
+
+
+class Replicas(object):
+    """Flask extension routing the reads of GET requests to the read replicas."""
+
+    def init_app(self, app, pins=None):
+        """Register the routing hooks, if there are "replica_<n>" binds."""
+        binds = app.config.get("SQLALCHEMY_BINDS") or {}
+        keys = [key for key in binds if key.startswith("replica_")]
+        if not keys:
+            return
+        with app.app_context():
+            replicas = ReplicaSet(
+                {key: db.engines[key] for key in keys},
+                app.config["DATASTORE_REPLICA_CHECK_INTERVAL"],
+                app.config["DATASTORE_REPLICA_RETRY_INTERVAL"],
+            )
+            for key, engine in db.engines.items():
+                listener = count_statements(key or "primary")
+                event.listen(engine, "before_cursor_execute", listener)
+            for key in keys:
+                listener = mark_down_on_error(replicas, key)
+                event.listen(db.engines[key], "handle_error", listener)
+        app.extensions["datastore_replicas"] = replicas
+        app.extensions["datastore_pins"] = pins or self.create_pins(app.config)
+        app.before_request(route_request)
+        app.after_request(pin_writer)
+
+    @staticmethod
+    def create_pins(config):
+        """Create the pins named by DATASTORE_READ_YOUR_WRITES_BACKEND."""
+        name = config["DATASTORE_READ_YOUR_WRITES_BACKEND"]
+        if name == "memory":
+            return MemoryPins()
+        if name == "redis":
+            # https://pypi.org/project/redis/, only required by this backend
+            import redis
+
+            return RedisPins(redis.Redis.from_url(config["CACHE_REDIS_URL"]))
+        raise ValueError(f"Invalid DATASTORE_READ_YOUR_WRITES_BACKEND {name!r}.")
+
+
+replicas = Replicas()
@@ -0,0 +1,113 @@
+"""Response representations of Datastore data, selected by the Accept header.
+
+JSON is the default, and NDJSON, CSV and MessagePack (when msgpack is
+installed) are registered on the flask-restful Api, which uses them for the
+data resources return, including error messages. The Datastore entry
+responses, which need an ETag, are negotiated with represent().
+
+The ETag of a Datastore entry is the one of its JSON body, and the other
+representations, and content codings, have it with a suffix, e.g.
+"<etag>-csv", or "<etag>-csv-gzip", so that each has its own strong ETag.
+"""
+import csv
+import io
+from functools import partial
+
+from flask import current_app, make_response, request
+
+
+# https://github.com/msgpack/msgpack-python
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def csv_value(value):
+    """Format a JSON-ready value for CSV, with JSON Booleans and empty nulls."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def output_ndjson(data, code: int, headers=None):
+    """Encode a list as one JSON document per line, or anything else as one line."""
+    dumps = partial(current_app.json.dumps, separators=(",", ":"))
+    rows = data if isinstance(data, list) else [data]
+    response = make_response("".join(dumps(row) + "\n" for row in rows), code)
+    response.mimetype = "application/x-ndjson"
+    response.headers.extend(headers or {})
+    return response
+
+
+def output_csv(data, code: int, headers=None):
+    """Encode a list of objects, or one object, as CSV with a header line.
+
+    The columns are the keys of every object, and missing values are empty.
+    """
+    rows = data if isinstance(data, list) else [data]
+    buffer = io.StringIO()
+    if rows:
+        fieldnames = dict.fromkeys(name for row in rows for name in row)
+        # https://docs.python.org/3/library/csv.html#csv.DictWriter
+        writer = csv.DictWriter(buffer, list(fieldnames))
+        writer.writeheader()
+        writer.writerows(
+            {name: csv_value(value) for name, value in row.items()} for row in rows
+        )
+    response = make_response(buffer.getvalue(), code)
+    response.mimetype = "text/csv"
+    response.headers.extend(headers or {})
+    return response
+
+
+def output_msgpack(data, code: int, headers=None):
+    """Encode data as MessagePack."""
+    # https://msgpack-python.readthedocs.io/en/latest/api.html#msgpack.packb
+    response = make_response(msgpack.packb(data), code)
+    response.mimetype = "application/msgpack"
+    response.headers.extend(headers or {})
+    return response
+
+
+# the representations registered on the Api, besides its default JSON one
+REPRESENTATIONS = {
+    "application/x-ndjson": output_ndjson,
+    "text/csv": output_csv,
+}
+if msgpack is not None:
+    REPRESENTATIONS["application/msgpack"] = output_msgpack
+
+# the media types that can be negotiated, in order of preference
+MEDIATYPES = ["application/json", *REPRESENTATIONS]
+
+
+def negotiate() -> str:
+    """Return the media type the Accept header prefers, JSON if it accepts none."""
+    # https://werkzeug.palletsprojects.com/en/3.0.x/datastructures/#werkzeug.datastructures.MIMEAccept
+    return request.accept_mimetypes.best_match(MEDIATYPES, default="application/json")
+
+
+def represent(data, mediatype: str, code: int = 200):
+    """Return a response of JSON-ready data, in one of the MEDIATYPES."""
+    if mediatype == "application/json":
+        response = current_app.json.response(data)
+        response.status_code = code
+        return response
+    return REPRESENTATIONS[mediatype](data, code)
+
+
+def variant_etag(etag: str, mediatype: str) -> str:
+    """Return the ETag of a representation of a JSON body's ETag."""
+    if mediatype == "application/json":
+        return etag
+    # e.g. "csv", "ndjson" or "msgpack"
+    return f"{etag}-{mediatype.rpartition('/')[2].removeprefix('x-')}"
+
+
+def if_match_contains(if_match, etag: str) -> bool:
+    """Check if an If-Match header has the ETag, of any representation, of an entry."""
+    # https://werkzeug.palletsprojects.com/en/3.0.x/datastructures/#werkzeug.datastructures.ETags
+    return if_match.star_tag or any(tag.partition("-")[0] == etag for tag in if_match)
@@ -0,0 +1,22 @@
+"""Datastore Marshmallow Schema, the reference of the fast-path serializers.
+
+Requests are serialized by datastore.serializers, so this module, and
+Marshmallow, are only imported by the tests and benchmarks comparing them.
+"""
+from datastore.database import ma
+from datastore.models.datastore_model import DatastoreModel
+
+
+# https://marshmallow.readthedocs.io/en/stable/marshmallow.schema.html
+class DatastoreSchema(ma.Schema):
+    """Datastore, Flask-Marshmallow Schema class, which wraps the SQLAlchemy Model."""
+
+    class Meta:
+        """Flask-Marshmallow Meta Schema class to configure the DatastoreSchema class."""
+
+        model = DatastoreModel
+        fields = ("datastore_id", "email", "uuid", "bool", "datetime", "_links")
+
+
+datastore_schema = DatastoreSchema()
+datastore_schemas = DatastoreSchema(many=True)  # note the plural variable name
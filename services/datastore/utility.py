@@ -1,6 +1,23 @@
 """Utility functions."""
 
 
+# the string representations of truth, and their values, of distutils.util.strtobool
+TRUTH_VALUES = {
+    "y": 1,
+    "yes": 1,
+    "t": 1,
+    "true": 1,
+    "on": 1,
+    "1": 1,
+    "n": 0,
+    "no": 0,
+    "f": 0,
+    "false": 0,
+    "off": 0,
+    "0": 0,
+}
+
+
 # Python 3.12 deprecated the distutils library to convert Strings to Booleans
 # https://stackoverflow.com/a/18472142
 def strtobool(val):
@@ -10,10 +27,7 @@ def strtobool(val):
     are 'n', 'no', 'f', 'false', 'off', and '0'.  Raises ValueError if
     'val' is anything else.
     """
-    val = val.lower()
-    if val in ("y", "yes", "t", "true", "on", "1"):
-        return 1
-    elif val in ("n", "no", "f", "false", "off", "0"):
-        return 0
-    else:
+    try:
+        return TRUTH_VALUES[val.lower()]
+    except KeyError:
         raise ValueError("invalid truth value %r" % (val,))
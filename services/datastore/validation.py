@@ -0,0 +1,94 @@
+"""Parsing and validation of Datastore entry input, shared by every write path.
+
+parse_entry() converts and type checks the fields of a JSON object in a
+single pass over FIELD_PARSERS, and raises a ValidationError, which the API
+returns as an HTTP 400, before the database session is used.
+"""
+import uuid as uuid_util
+from datetime import datetime as datetime_util
+from datetime import timezone
+
+from datastore.utility import TRUTH_VALUES
+
+
+# the length of the "datastore.email" column
+EMAIL_MAX_LENGTH = 128
+
+# the Booleans of the strings accepted by strtobool()
+BOOLEANS = {name: bool(value) for name, value in TRUTH_VALUES.items()}
+
+
+class ValidationError(ValueError):
+    """Invalid Datastore entry input, with a message for the client."""
+
+
+def parse_email(value) -> str:
+    """Check that an email is a non-empty String, that fits in the column."""
+    if isinstance(value, str) and 0 < len(value) <= EMAIL_MAX_LENGTH:
+        return value
+    raise ValidationError(
+        "Invalid email, it must be a non-empty string of at most "
+        f"{EMAIL_MAX_LENGTH} characters."
+    )
+
+
+def parse_uuid(value) -> uuid_util.UUID:
+    """Convert a String to a UUID."""
+    if isinstance(value, uuid_util.UUID):
+        return value
+    try:
+        return uuid_util.UUID(value)
+    except (AttributeError, TypeError, ValueError):
+        raise ValidationError("Invalid uuid, it must be a UUID.")
+
+
+def parse_bool(value) -> bool:
+    """Convert a JSON Boolean, or a String like "true" or "off", to a Boolean."""
+    if isinstance(value, bool):
+        return value
+    try:
+        return BOOLEANS[value.lower()]
+    except (AttributeError, KeyError):
+        raise ValidationError("Invalid bool, it must be true or false.")
+
+
+def parse_datetime(value) -> datetime_util:
+    """Convert an ISO 8601 String to a naive UTC datetime."""
+    if isinstance(value, datetime_util):
+        return value
+    try:
+        # https://docs.python.org/3/library/datetime.html#datetime.datetime.fromisoformat
+        result = datetime_util.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError("Invalid datetime, it must be an ISO 8601 datetime.")
+    if result.tzinfo is not None:
+        result = result.astimezone(timezone.utc).replace(tzinfo=None)
+    return result
+
+
+# the parser of each Datastore entry field, in the order they are read
+FIELD_PARSERS = {
+    "email": parse_email,
+    "uuid": parse_uuid,
+    "bool": parse_bool,
+    "datetime": parse_datetime,
+}
+
+
+def parse_entry(data, required=("email",)) -> dict:
+    """Parse the fields of a Datastore entry JSON object, or raise a ValidationError.
+
+    Only the fields given are returned, as null and empty values are treated as
+    missing, and the fields named in required must be given.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Invalid data, it must be a JSON object.")
+    fields = {}
+    for name, parse in FIELD_PARSERS.items():
+        value = data.get(name)
+        if value is None or value == "":
+            if name in required:
+                raise ValidationError(f"Invalid {name}, it is required.")
+            continue
+        fields[name] = parse(value)
+    return fields
@@ -15,8 +15,8 @@ def app():
 # https://docs.pytest.org/en/6.2.x/fixture.html
 @pytest.fixture(scope='module')
 def test_client(app):
-    flask_app = create_app()
-    flask_app.config.update({"TESTING": True})
+    # share the app of the module, rather than creating a second one
+    flask_app = app
 
     # Create a test client using the Flask application configured for testing
     with flask_app.test_client() as testing_client:
@@ -0,0 +1,82 @@
+"""Aggregate endpoint Tests"""
+from datastore.aggregate import rebuild_summary
+
+
+def test_aggregate_count(test_client, init_database):
+    response = test_client.get("/aggregate")
+    assert response.status_code == 200
+    assert response.json["count"] == 4
+    assert response.json["min_datastore_id"] == 1
+    assert response.json["max_datastore_id"] == 4
+
+def test_aggregate_filter(test_client):
+    response = test_client.get("/aggregate?bool=true&since=2023-07-25T16:57:00")
+    assert response.json["count"] == 1
+    assert response.json["max_datetime"] == "2023-07-25T16:58:36.908339"
+
+def test_aggregate_group_by_bool(test_client):
+    response = test_client.get("/aggregate?group_by=bool")
+    groups = {group["key"]: group["count"] for group in response.json["groups"]}
+    assert groups == {False: 3, True: 1}
+
+def test_aggregate_group_by_domain(test_client):
+    response = test_client.get("/aggregate?group_by=domain&domain=GMAIL.com")
+    assert [group["key"] for group in response.json["groups"]] == ["gmail.com"]
+    assert response.json["groups"][0]["count"] == 4
+
+def test_aggregate_group_by_hour(test_client):
+    response = test_client.get("/aggregate?group_by=hour&until=2023-07-26T00:00:00")
+    assert response.json["groups"] == [{
+        "count": 2,
+        "key": "2023-07-25T16:00:00",
+        "max_datastore_id": 4,
+        "max_datetime": "2023-07-25T16:58:36.908339",
+        "min_datastore_id": 3,
+        "min_datetime": "2023-07-25T16:57:36.908339",
+    }]
+
+def test_aggregate_invalid_arguments(test_client):
+    assert test_client.get("/aggregate?group_by=email").status_code == 400
+    assert test_client.get("/aggregate?since=yesterday").status_code == 400
+    assert test_client.get("/aggregate?bool=maybe").status_code == 400
+    assert test_client.get("/aggregate?source=summary").status_code == 400
+
+def test_aggregate_summary(test_client):
+    test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = True
+    rebuild_summary()
+    response = test_client.get("/aggregate?source=summary&group_by=bool")
+    groups = {group["key"]: group["count"] for group in response.json["groups"]}
+    assert groups == {False: 3, True: 1}
+
+def test_aggregate_summary_maintained_by_writes(test_client):
+    test_client.post("/datastore", json={
+        "email": "alex.murphy@ocp.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a303",
+        "bool": "false",
+        "datetime": "2023-07-25T16:57:36.908339",
+    })
+    test_client.put("/datastore/1", json={
+        "email": "apolloclark@ocp.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a999",
+        "bool": "false",
+        "datetime": "2023-07-26T16:57:36.999999",
+    })
+    test_client.delete("/datastore/2")
+    test_client.post("/datastore/_bulk?mode=upsert", json=[
+        {"email": "anne.lewis@ocp.com", "datetime": "2023-07-26T10:00:00.000000"},
+        {"email": "rick.deckard@lapd.gov", "uuid": "752346e1-df66-485e-8f49-eb749d9ab806"},
+    ])
+    for group_by in ("bool", "domain", "day"):
+        table = test_client.get(f"/aggregate?group_by={group_by}").json["groups"]
+        summary = test_client.get(
+            f"/aggregate?group_by={group_by}&source=summary"
+        ).json["groups"]
+        # the day buckets of the table are datetimes, the summary days are dates
+        if group_by == "day":
+            table = [dict(group, key=group["key"][:10]) for group in table]
+        assert [(group["key"], group["count"]) for group in table] == [
+            (group["key"], group["count"]) for group in summary
+        ]
+    response = test_client.get("/aggregate?source=summary&domain=ocp.com")
+    assert response.json == {"count": 3, "source": "summary"}
+    test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = False
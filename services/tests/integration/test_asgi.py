@@ -0,0 +1,202 @@
+"""Datastore ASGI app Tests, comparing its responses with the Flask app"""
+import asyncio
+import json
+
+import pytest
+
+from datastore.app import create_app
+from datastore.asgi import DatastoreASGI, async_database_uri, async_engine_options
+from datastore.changes import notifier
+
+
+pytest.importorskip("aiosqlite")
+
+
+post_data = {
+    "email": "asgi@gmail.com",
+    "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a777",
+    "bool": "true",
+    "datetime": "2023-07-25T16:57:36.777777",
+}
+
+
+def asgi_client(app, loop):
+    """Return a function sending a request to an ASGI app, on the given event loop."""
+
+    def request(method, path, body=None, headers=None):
+        path, _, query_string = path.partition("?")
+        headers = dict(headers or {}, host="localhost")
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["content-type"] = "application/json"
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query_string.encode(),
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        }
+        messages = [{"type": "http.request", "body": body or b""}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop.run_until_complete(app(scope, receive, send))
+        return (
+            sent[0]["status"],
+            {k.decode(): v.decode() for k, v in sent[0]["headers"]},
+            b"".join(message.get("body", b"") for message in sent[1:]),
+        )
+
+    return request
+
+
+@pytest.fixture(scope="module")
+def asgi(test_client, init_database):
+    app = DatastoreASGI()
+    loop = asyncio.new_event_loop()
+    yield asgi_client(app, loop)
+    loop.run_until_complete(app.engine.dispose())
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def changes_app(test_client, init_database):
+    return create_app({"TESTING": True, "DATASTORE_CHANGES": True})
+
+
+@pytest.fixture(scope="module")
+def asgi_changes(changes_app):
+    app = DatastoreASGI(changes_app)
+    loop = asyncio.new_event_loop()
+    yield asgi_client(app, loop)
+    loop.run_until_complete(app.engine.dispose())
+    loop.close()
+
+
+def test_async_database_uri():
+    assert async_database_uri("sqlite:////tmp/t.db") == "sqlite+aiosqlite:////tmp/t.db"
+    assert (
+        async_database_uri("postgresql://user:pass@db/datastore")
+        == "postgresql+asyncpg://user:pass@db/datastore"
+    )
+
+def test_async_engine_options():
+    options = async_engine_options(
+        {"poolclass": object, "pool_size": 5,
+         "connect_args": {"options": "-c statement_timeout=500"}}
+    )
+    assert options == {
+        "pool_size": 5,
+        "connect_args": {"server_settings": {"statement_timeout": "500"}},
+    }
+
+@pytest.mark.parametrize("path", [
+    "/",
+    "/datastore/1",
+    "/datastore?limit=2",
+    "/datastore?sort=-email&limit=3",
+    "/datastore?stream=ndjson",
+    "/datastore?stream=json&limit=2",
+    "/datastore?ids=1,999,3",
+    "/datastore?ids=1,a",
+    "/datastore/_changes",
+    "/datastore/_export",
+    "/aggregate",
+    "/aggregate?group_by=bool",
+    "/datastore/999",
+    "/datastore?limit=x",
+    "/missing",
+])
+def test_asgi_get_matches_flask(test_client, asgi, path):
+    status, headers, body = asgi("GET", path)
+    response = test_client.get(path)
+    assert status == response.status_code
+    assert body == response.data
+    assert headers.get("link") == response.headers.get("Link")
+    assert headers.get("etag") == response.headers.get("ETag")
+
+def test_asgi_representation_matches_flask(test_client, asgi):
+    headers = {"accept": "text/csv"}
+    status, asgi_headers, body = asgi("GET", "/datastore?limit=2", headers=headers)
+    response = test_client.get("/datastore?limit=2", headers=headers)
+    assert status == response.status_code
+    assert body == response.data
+    assert asgi_headers["content-type"] == response.headers["Content-Type"]
+    assert asgi_headers["etag"] == response.headers["ETag"]
+
+def test_asgi_served_by_flask(test_client, asgi):
+    # the routes without an ASGI handler are served by the Flask app
+    status, headers, body = asgi("POST", "/datastore/_mget", {"ids": [3, 999]})
+    response = test_client.post("/datastore/_mget", json={"ids": [3, 999]})
+    assert status == response.status_code == 200
+    assert body == response.data
+    assert headers["content-type"] == response.headers["Content-Type"]
+
+def test_asgi_get_if_none_match(asgi):
+    _, headers, _ = asgi("GET", "/datastore/1")
+    status, _, body = asgi("GET", "/datastore/1", headers={"if-none-match": headers["etag"]})
+    assert status == 304
+    assert body == b""
+
+def test_asgi_post_put_delete(test_client, asgi):
+    status, _, body = asgi("POST", "/datastore", post_data)
+    assert status == 201
+    created = json.loads(body)
+    assert created["email"] == post_data["email"]
+    assert test_client.get(f"/datastore/{created['datastore_id']}").json == created
+
+    status, _, body = asgi("POST", "/datastore", post_data)
+    assert status == 404
+    assert json.loads(body)["message"] == "The email and UUID need to be unique."
+
+    path = f"/datastore/{created['datastore_id']}"
+    status, _, _ = asgi("PUT", path, post_data, headers={"if-match": '"stale"'})
+    assert status == 412
+    status, headers, body = asgi("PUT", path, dict(post_data, email="asgi2@gmail.com"))
+    assert status == 200
+    assert "etag" in headers
+    assert json.loads(body)["email"] == "asgi2@gmail.com"
+
+    status, _, body = asgi("DELETE", path)
+    assert status == 200
+    assert json.loads(body) == {}
+    assert asgi("GET", path)[0] == 404
+
+def test_asgi_put_without_id(asgi):
+    status, _, body = asgi("PUT", "/datastore", post_data)
+    assert status == 404
+    assert json.loads(body)["message"] == "Invalid datastore_id, it must be an int number."
+
+def test_asgi_method_not_allowed(asgi):
+    status, headers, _ = asgi("POST", "/aggregate", post_data)
+    assert status == 405
+    assert headers["allow"] == "GET"
+
+def test_asgi_patch(test_client, asgi):
+    status, headers, body = asgi("PATCH", "/datastore/2", {"bool": "true"})
+    assert status == 200
+    assert json.loads(body) == test_client.get("/datastore/2").json
+    assert headers["etag"] == test_client.get("/datastore/2").headers["ETag"]
+    assert asgi("PATCH", "/datastore/999", {"bool": "true"})[0] == 404
+    assert asgi("PATCH", "/datastore/2", {})[0] == 400
+def test_asgi_changes(changes_app, asgi_changes):
+    client = changes_app.test_client()
+    last = client.get("/datastore/_changes?since=now").json["last"]
+    seen = notifier.count
+    status, _, body = asgi_changes("POST", "/datastore", dict(
+        post_data, email="asgi3@gmail.com", uuid="5d1b2a3c-36c4-42d3-b006-247fcaa8a777"
+    ))
+    created = json.loads(body)["datastore_id"]
+    assert asgi_changes("PATCH", "/datastore/1", {"bool": "true"})[0] == 200
+    assert asgi_changes("DELETE", f"/datastore/{created}")[0] == 200
+    feed = client.get(f"/datastore/_changes?since={last}").json
+    assert [(change["datastore_id"], change["deleted"]) for change in feed["changes"]] == [
+        (1, False), (created, True)
+    ]
+    assert feed["last"] == last + 3
+    assert notifier.count == seen + 3
@@ -179,7 +179,8 @@ def test_aggregate(test_client):
     response = test_client.get("/aggregate")
     print(response.data)
     assert response.status_code == 200
-    assert b'"message": "[(4,)]"' in response.data
+    assert response.json["count"] == 4
+    assert response.json["source"] == "table"
 
 def test_strtobool_error():
     with pytest.raises(ValueError):
@@ -0,0 +1,63 @@
+"""Datastore bulk create and upsert Tests"""
+
+
+def test_datastore_bulk_create(test_client, init_database):
+    response = test_client.post("/datastore/_bulk", json=[
+        {"email": "roy.batty@gmail.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a001"},
+        {"email": "apolloclark@gmail.com"},
+        {"email": "pris.stratton@gmail.com", "bool": "maybe"},
+        {"email": "leon.kowalski@gmail.com", "bool": "true", "datetime": "2023-07-25T16:57:36.908339"},
+    ])
+    assert response.status_code == 200
+    assert response.json["counts"] == {"created": 2, "upserted": 0, "conflict": 1, "invalid": 1}
+    statuses = [result["status"] for result in response.json["results"]]
+    assert statuses == ["created", "conflict", "invalid", "created"]
+    assert response.json["results"][0]["datastore_id"] == 5
+
+def test_datastore_bulk_create_read(test_client):
+    response = test_client.get("/datastore/6")
+    assert response.status_code == 200
+    assert response.json["email"] == "leon.kowalski@gmail.com"
+    assert response.json["bool"] is True
+
+def test_datastore_bulk_duplicate_uuid_in_batch(test_client):
+    response = test_client.post("/datastore/_bulk", json=[
+        {"email": "zhora@gmail.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a002"},
+        {"email": "zhora2@gmail.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a002"},
+    ])
+    statuses = [result["status"] for result in response.json["results"]]
+    assert statuses == ["created", "conflict"]
+
+def test_datastore_bulk_ndjson(test_client):
+    body = (
+        b'{"email": "gaff@gmail.com"}\n'
+        b'\n'
+        b'not json\n'
+        b'{"email": "bryant@gmail.com"}\n'
+    )
+    response = test_client.post(
+        "/datastore/_bulk", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 200
+    assert response.json["counts"]["created"] == 2
+    assert response.json["counts"]["invalid"] == 1
+
+def test_datastore_bulk_upsert(test_client):
+    response = test_client.post("/datastore/_bulk?mode=upsert", json=[
+        {"email": "roy.batty@nexus6.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a001"},
+        {"email": "tom.jones@gmail.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a001"},
+        {"email": "hannibal.chew@gmail.com"},
+    ])
+    statuses = [result["status"] for result in response.json["results"]]
+    assert statuses == ["upserted", "conflict", "upserted"]
+    response = test_client.get("/datastore/5")
+    assert response.json["email"] == "roy.batty@nexus6.com"
+
+def test_datastore_bulk_invalid_body(test_client):
+    response = test_client.post("/datastore/_bulk", json={"email": "a@gmail.com"})
+    assert response.status_code == 400
+    assert b"Invalid data, it must be a JSON array." in response.data
+
+def test_datastore_bulk_invalid_mode(test_client):
+    response = test_client.post("/datastore/_bulk?mode=replace", json=[])
+    assert response.status_code == 400
@@ -0,0 +1,58 @@
+"""Datastore entry cache Tests"""
+from sqlalchemy import select
+
+from datastore.api.datastore_api import entry_body
+from datastore.database import db
+from datastore.models.datastore_model import DatastoreModel
+from datastore.serializers import DATASTORE_COLUMNS
+
+
+def test_datastore_get_cached(test_client, init_database):
+    first = test_client.get("/datastore/1")
+    second = test_client.get("/datastore/1")
+    assert second.status_code == 200
+    assert second.data == first.data
+    stats = test_client.get("/cache").json
+    assert stats["backend"] == "lru"
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_datastore_put_invalidates_cache(test_client):
+    response = test_client.put("/datastore/1", json={
+        "email": "apolloclark999@gmail.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a999",
+        "bool": "false",
+        "datetime": "2023-07-25T16:57:36.999999",
+    })
+    assert response.status_code == 200
+    response = test_client.get("/datastore/1")
+    assert response.json["email"] == "apolloclark999@gmail.com"
+
+def test_datastore_bulk_upsert_invalidates_cache(test_client):
+    test_client.post("/datastore/_bulk?mode=upsert", json=[
+        {"email": "apolloclark@gmail.com", "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a999"},
+    ])
+    response = test_client.get("/datastore/1")
+    assert response.json["email"] == "apolloclark@gmail.com"
+
+def test_datastore_stale_read_not_cached(test_client):
+    # a reader reads the entry, then a writer updates it before it is cached
+    query = select(*DATASTORE_COLUMNS, DatastoreModel.version).where(
+        DatastoreModel.datastore_id == 2
+    )
+    with test_client.application.app_context():
+        stale = db.session.execute(query).one()
+    response = test_client.patch("/datastore/2", json={"email": "tom.jones3@gmail.com"})
+    assert response.status_code == 200
+    with test_client.application.app_context():
+        entry_body(stale)
+    assert test_client.get("/datastore/2").json["email"] == "tom.jones3@gmail.com"
+
+def test_datastore_delete_invalidates_cache(test_client):
+    assert test_client.delete("/datastore/1").status_code == 200
+    assert test_client.get("/datastore/1").status_code == 404
+
+def test_datastore_missing_entity_not_cached(test_client):
+    size = test_client.get("/cache").json["size"]
+    test_client.get("/datastore/999")
+    assert test_client.get("/cache").json["size"] == size
@@ -0,0 +1,154 @@
+"""Datastore change feed Tests"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import insert
+
+from datastore import changes
+from datastore.app import create_app
+from datastore.changes import prune_changes, utcnow
+from datastore.database import db
+from datastore.load import load_rows, synthetic_rows
+from datastore.models.change_model import DatastoreChangeModel
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app({
+        "TESTING": True,
+        "DATASTORE_CHANGES": True,
+        "DATASTORE_CHANGES_GAP_WAIT": 0,
+        "DATASTORE_CHANGES_POLL_INTERVAL": 0.05,
+    })
+    yield app
+
+def changes_since(test_client, since, **args):
+    response = test_client.get("/datastore/_changes", query_string={"since": since, **args})
+    assert response.status_code == 200
+    return response.json
+
+def test_changes_disabled():
+    response = create_app({"TESTING": True}).test_client().get("/datastore/_changes")
+    assert response.status_code == 404
+
+def test_changes_of_seed(test_client, init_database):
+    feed = changes_since(test_client, 0)
+    ids = [change["datastore_id"] for change in feed["changes"]]
+    assert ids == [1, 2, 3, 4]
+    assert feed["more"] is False
+    assert feed["last"] == feed["changes"][-1]["change_id"]
+    assert feed["changes"][2]["deleted"] is False
+    assert feed["changes"][2]["entry"] == test_client.get("/datastore/3").json
+
+def test_changes_since_now(test_client):
+    feed = changes_since(test_client, "now")
+    assert feed["changes"] == []
+    assert feed["last"] == changes_since(test_client, 0)["last"]
+
+def test_changes_of_writes(test_client):
+    last = changes_since(test_client, "now")["last"]
+    response = test_client.post("/datastore", json={"email": "joe.bloggs@gmail.com"})
+    created = response.json["datastore_id"]
+    test_client.patch("/datastore/2", json={"bool": "true"})
+    test_client.patch("/datastore/2", json={"email": "tom.jones2@gmail.com"})
+    test_client.delete("/datastore/4")
+    response = test_client.post("/datastore/_bulk", json=[{"email": "jane.bloggs@gmail.com"}])
+    bulk_created = response.json["results"][0]["datastore_id"]
+    test_client.post("/datastore/_delete", json={"ids": [created]})
+
+    feed = changes_since(test_client, last)
+    # the latest change of each entry, in change order
+    assert [(change["datastore_id"], change["deleted"]) for change in feed["changes"]] == [
+        (2, False), (4, True), (bulk_created, False), (created, True)
+    ]
+    assert feed["changes"][0]["entry"]["email"] == "tom.jones2@gmail.com"
+    assert feed["changes"][1]["entry"] is None
+    assert feed["last"] == last + 6
+
+def test_changes_pages(test_client):
+    response = test_client.get("/datastore/_changes?since=0&limit=2")
+    assert response.json["more"] is True
+    assert len(response.json["changes"]) == 2
+    assert f"since={response.json['last']}" in response.headers["Link"]
+
+def test_changes_invalid(test_client):
+    for query in ("since=-1", "since=a", "limit=0", "wait=x"):
+        assert test_client.get(f"/datastore/_changes?{query}").status_code == 400
+
+def test_changes_long_poll_timeout(test_client):
+    last = changes_since(test_client, "now")["last"]
+    start = time.monotonic()
+    feed = changes_since(test_client, last, wait=1)
+    assert time.monotonic() - start >= 1
+    assert feed == {"changes": [], "last": last, "more": False}
+
+def test_changes_long_poll_wakes_up(test_client):
+    last = changes_since(test_client, "now")["last"]
+    writer = threading.Timer(0.2, lambda: test_client.application.test_client().put(
+        "/datastore/1", json={
+            "email": "apolloclark@gmail.com",
+            "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a999",
+            "bool": "false",
+            "datetime": "2023-07-25T16:57:36.999999",
+        }))
+    writer.start()
+    start = time.monotonic()
+    feed = changes_since(test_client, last, wait=10)
+    writer.join()
+    assert time.monotonic() - start < 5
+    assert [change["datastore_id"] for change in feed["changes"]] == [1]
+
+def insert_change(change_id):
+    with db.engine.begin() as connection:
+        connection.execute(insert(DatastoreChangeModel).values(
+            change_id=change_id, datastore_id=1, changed_at=utcnow()
+        ))
+
+def test_changes_stop_before_gap_in_progress(test_client, monkeypatch):
+    last = changes_since(test_client, "now")["last"]
+    # a change after a change_id which may not be committed yet
+    insert_change(last + 2)
+    monkeypatch.setattr(changes, "transaction_horizon", lambda: 100)
+    monkeypatch.setattr(changes, "horizon_passed", lambda horizon: False)
+    assert changes_since(test_client, last) == {"changes": [], "last": last, "more": True}
+    # once the transactions in progress ended, the gap is a rolled back transaction
+    monkeypatch.setattr(changes, "horizon_passed", lambda horizon: True)
+    assert changes_since(test_client, last)["last"] == last + 2
+
+def test_changes_stop_before_gap_after_wait(test_client, monkeypatch):
+    last = changes_since(test_client, "now")["last"]
+    insert_change(last + 2)
+
+    def commit_while_waiting(horizon):
+        # a later gap, of a transaction which began after the first read
+        insert_change(last + 5)
+        return True
+
+    monkeypatch.setattr(changes, "transaction_horizon", lambda: 100)
+    monkeypatch.setattr(changes, "horizon_passed", commit_while_waiting)
+    feed = changes_since(test_client, last)
+    assert feed["last"] == last + 2
+    assert feed["more"] is True
+
+def test_changes_skip_gap_of_serialized_writers(test_client):
+    last = changes_since(test_client, "now")["last"]
+    insert_change(last + 2)
+    # SQLite has no transaction horizon, and on PostgreSQL no transaction is in progress
+    assert changes_since(test_client, last)["last"] == last + 2
+
+def test_changes_of_load(test_client):
+    last = changes_since(test_client, "now")["last"]
+    for _ in load_rows(synthetic_rows(3)):
+        pass
+    feed = changes_since(test_client, last)
+    assert len(feed["changes"]) == 3
+    assert all(change["entry"] for change in feed["changes"])
+
+def test_changes_pruned(test_client):
+    last = changes_since(test_client, "now")["last"]
+    assert prune_changes(0) > 0
+    response = test_client.get("/datastore/_changes?since=0")
+    assert response.status_code == 410
+    # the latest change is kept, so a client up to date is not affected
+    assert changes_since(test_client, last - 1)["last"] == last
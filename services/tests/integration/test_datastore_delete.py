@@ -0,0 +1,70 @@
+"""Datastore single statement DELETE, and bulk delete Tests"""
+from datastore.load import load_rows, synthetic_rows
+
+
+def count(test_client):
+    return len(test_client.get("/datastore?limit=1000").json)
+
+
+def test_datastore_delete_single_statement(test_client, init_database):
+    response = test_client.delete("/datastore/4")
+    assert response.status_code == 200
+    assert response.json == {}
+    assert 'desc="1 statements"' in response.headers["Server-Timing"]
+    assert test_client.get("/datastore/4").status_code == 404
+    assert test_client.delete("/datastore/4").status_code == 404
+
+def test_datastore_delete_summary(test_client):
+    test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = True
+    try:
+        from datastore.aggregate import rebuild_summary
+
+        rebuild_summary()
+        before = test_client.get("/aggregate?source=summary").json["count"]
+        assert test_client.delete("/datastore/3").status_code == 200
+        assert test_client.get("/aggregate?source=summary").json["count"] == before - 1
+    finally:
+        test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = False
+
+def test_datastore_bulk_delete_ids(test_client):
+    test_client.application.config["DATASTORE_DELETE_BATCH_SIZE"] = 2
+    try:
+        response = test_client.post("/datastore/_delete", json={"ids": [1, 2, 999]})
+    finally:
+        test_client.application.config["DATASTORE_DELETE_BATCH_SIZE"] = 1000
+    assert response.status_code == 200
+    assert response.json == {"deleted": 2, "batches": 2}
+    assert test_client.get("/datastore/1").status_code == 404
+
+def test_datastore_bulk_delete_filters(test_client):
+    list(load_rows(synthetic_rows(25)))
+    before = count(test_client)
+    test_client.application.config["DATASTORE_DELETE_BATCH_SIZE"] = 10
+    try:
+        # the synthetic rows are one second apart, starting on 2023-01-01
+        response = test_client.post(
+            "/datastore/_delete",
+            json={"filters": {"until": "2023-01-01T00:00:12", "bool": "true"}},
+        )
+    finally:
+        test_client.application.config["DATASTORE_DELETE_BATCH_SIZE"] = 1000
+    assert response.json == {"deleted": 6, "batches": 1}
+    assert count(test_client) == before - 6
+    response = test_client.post(
+        "/datastore/_delete", json={"filters": {"domain": "example.com"}}
+    )
+    assert response.json["deleted"] == 19
+
+def test_datastore_bulk_delete_invalid(test_client):
+    for data, message in [
+        ([], "Invalid data, it must be a JSON object of ids or filters."),
+        ({"ids": [1], "filters": {}}, "Invalid data, it must be a JSON object of ids or filters."),
+        ({"ids": ["1"]}, "Invalid ids, it must be an array of int numbers."),
+        ({"filters": {"bool": True}}, "Invalid filters, it must be an object of strings."),
+        ({"filters": {}}, "Invalid filters, at least one is required."),
+        ({"filters": {"sort": "email"}}, "Invalid filters, at least one is required."),
+        ({"filters": {"uuid": "x"}}, "Invalid uuid, it must be a UUID."),
+    ]:
+        response = test_client.post("/datastore/_delete", json=data)
+        assert response.status_code == 400
+        assert response.json["message"] == message
@@ -0,0 +1,54 @@
+"""Datastore ETag and conditional request Tests"""
+
+put_data = {
+    "email": "apolloclark999@gmail.com",
+    "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a999",
+    "bool": "false",
+    "datetime": "2023-07-25T16:57:36.999999",
+}
+
+
+def test_datastore_get_etag(test_client, init_database):
+    response = test_client.get("/datastore/1")
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"')
+    cached = test_client.get("/datastore/1")
+    assert cached.headers["ETag"] == response.headers["ETag"]
+
+def test_datastore_get_if_none_match(test_client):
+    etag = test_client.get("/datastore/1").headers["ETag"]
+    response = test_client.get("/datastore/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_datastore_get_collection_if_none_match(test_client):
+    etag = test_client.get("/datastore").headers["ETag"]
+    response = test_client.get("/datastore", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_datastore_put_if_match_failed(test_client):
+    response = test_client.put(
+        "/datastore/1", json=put_data, headers={"If-Match": '"stale"'}
+    )
+    assert response.status_code == 412
+    assert test_client.get("/datastore/1").json["email"] == "apolloclark@gmail.com"
+
+def test_datastore_put_if_match(test_client):
+    etag = test_client.get("/datastore/1").headers["ETag"]
+    response = test_client.put("/datastore/1", json=put_data, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.headers["ETag"] == test_client.get("/datastore/1").headers["ETag"]
+
+def test_datastore_get_if_none_match_after_put(test_client):
+    response = test_client.get("/datastore/1", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json["email"] == "apolloclark999@gmail.com"
+
+def test_datastore_delete_if_match_failed(test_client):
+    response = test_client.delete("/datastore/1", headers={"If-Match": '"stale"'})
+    assert response.status_code == 412
+
+def test_datastore_delete_if_match_any(test_client):
+    response = test_client.delete("/datastore/1", headers={"If-Match": "*"})
+    assert response.status_code == 200
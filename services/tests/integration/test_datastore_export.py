@@ -0,0 +1,85 @@
+"""Datastore export, dump_db and restore_db Tests"""
+import csv
+import gzip
+import io
+import json
+
+from cli import dump_db, restore_db
+from datastore.load import load_rows
+
+
+def test_export_ndjson(test_client, init_database):
+    response = test_client.get("/datastore/_export")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert [row["datastore_id"] for row in rows] == [1, 2, 3, 4]
+    assert rows[2] == {
+        "datastore_id": 3,
+        "email": "wayland.yutani@gmail.com",
+        "uuid": "752346e1-df66-485e-8f49-eb749d9ab666",
+        "bool": "true",
+        "datetime": "2023-07-25T16:58:36.908339",
+    }
+
+def test_export_csv(test_client):
+    response = test_client.get("/datastore/_export?format=csv")
+    assert response.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert len(rows) == 4
+    assert rows[3]["email"] == "rick.deckard@gmail.com"
+    assert rows[3]["bool"] == "false"
+
+def test_export_after(test_client):
+    response = test_client.get("/datastore/_export?format=csv&after=2")
+    lines = response.data.decode().splitlines()
+    # a resumed CSV export has no header line
+    assert [line.split(",")[0] for line in lines] == ["3", "4"]
+
+def test_export_gzip(test_client):
+    response = test_client.get(
+        "/datastore/_export", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == test_client.get("/datastore/_export").data
+
+def test_export_invalid(test_client):
+    assert test_client.get("/datastore/_export?format=xml").status_code == 400
+    assert test_client.get("/datastore/_export?after=x").status_code == 400
+
+def test_restore_keeps_datastore_id(test_client):
+    row = json.loads(test_client.get("/datastore/_export?after=3").data)
+    assert test_client.delete("/datastore/4").status_code == 200
+    assert list(load_rows([row], keep_ids=True)) == [(1, 0)]
+    assert test_client.get("/datastore/4").json["email"] == "rick.deckard@gmail.com"
+    # rows without a datastore_id are invalid
+    assert list(load_rows([{"email": "x@gmail.com"}], keep_ids=True)) == [(0, 1)]
+
+def test_dump_db_checkpoint(app, test_client, tmp_path):
+    output = tmp_path / "datastore.ndjson.gz"
+    checkpoint = tmp_path / "checkpoint"
+    runner = app.test_cli_runner()
+    arguments = [str(output), "--checkpoint", str(checkpoint)]
+    result = runner.invoke(dump_db, arguments)
+    assert result.exit_code == 0, result.output
+    assert checkpoint.read_text().split()[0] == "4"
+
+    test_client.post("/datastore", json={
+        "email": "export@gmail.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a333",
+        "bool": "true",
+        "datetime": "2023-07-25T16:57:36.333333",
+    })
+    result = runner.invoke(dump_db, arguments)
+    assert "Resuming after datastore_id 4." in result.output
+    assert "Exported 1 rows." in result.output
+    rows = [json.loads(line) for line in gzip.decompress(output.read_bytes()).splitlines()]
+    assert [row["datastore_id"] for row in rows] == [1, 2, 3, 4, 5]
+
+def test_restore_db_conflict(app, tmp_path):
+    output = tmp_path / "datastore.csv"
+    runner = app.test_cli_runner()
+    assert runner.invoke(dump_db, [str(output)]).exit_code == 0
+    result = runner.invoke(restore_db, [str(output)])
+    assert result.exit_code == 1
+    assert "need to be unique, 0 rows were loaded" in result.output
@@ -0,0 +1,105 @@
+"""Datastore Controller collection filtering and sorting Tests"""
+import re
+import uuid
+
+from sqlalchemy import insert, update
+
+from datastore.database import db
+from datastore.models.datastore_model import DatastoreModel
+
+
+def emails(response):
+    return [row["email"] for row in response.json]
+
+
+def next_page(test_client, response):
+    return test_client.get(re.search("<(.*)>", response.headers["Link"]).group(1))
+
+
+def all_pages(test_client, path, max_pages=10):
+    response = test_client.get(path)
+    ids = [row["datastore_id"] for row in response.json]
+    for _ in range(max_pages):
+        if "Link" not in response.headers:
+            return ids
+        response = next_page(test_client, response)
+        ids.extend(row["datastore_id"] for row in response.json)
+    raise AssertionError(f"More than {max_pages} pages of {path}.")
+
+
+def test_datastore_filter_email(test_client, init_database):
+    response = test_client.get("/datastore?email=tom.jones@gmail.com")
+    assert response.status_code == 200
+    assert emails(response) == ["tom.jones@gmail.com"]
+
+def test_datastore_filter_email_prefix(test_client):
+    response = test_client.get("/datastore?email_prefix=r")
+    assert emails(response) == ["rick.deckard@gmail.com"]
+    response = test_client.get("/datastore?email_prefix=%25")
+    assert emails(response) == []
+
+def test_datastore_filter_uuid(test_client):
+    response = test_client.get("/datastore?uuid=752346e1-df66-485e-8f49-eb749d9ab666")
+    assert emails(response) == ["wayland.yutani@gmail.com"]
+
+def test_datastore_filter_bool_and_datetime_range(test_client):
+    response = test_client.get(
+        "/datastore?bool=false&since=2023-07-25T00:00:00&until=2023-07-26T00:00:00"
+    )
+    assert emails(response) == ["rick.deckard@gmail.com"]
+
+def test_datastore_filter_no_match(test_client):
+    response = test_client.get("/datastore?domain=yahoo.com")
+    assert response.status_code == 200
+    assert response.json == []
+
+def test_datastore_sort_descending(test_client):
+    response = test_client.get("/datastore?sort=-email")
+    assert emails(response) == sorted(emails(response), reverse=True)
+
+def test_datastore_sort_keyset_pages(test_client):
+    response = test_client.get("/datastore?sort=datetime&limit=2")
+    assert emails(response) == ["rick.deckard@gmail.com", "wayland.yutani@gmail.com"]
+    assert "sort=datetime" in response.headers["Link"]
+    response = next_page(test_client, response)
+    assert emails(response) == ["apolloclark@gmail.com", "tom.jones@gmail.com"]
+
+def test_datastore_sort_cursor_entry_deleted(test_client):
+    response = test_client.get("/datastore?sort=-email&limit=2")
+    assert emails(response) == ["wayland.yutani@gmail.com", "tom.jones@gmail.com"]
+    # the cursor has the sort value, so the next page does not need its entry
+    assert test_client.delete(f"/datastore/{response.json[-1]['datastore_id']}").status_code == 200
+    response = next_page(test_client, response)
+    assert emails(response) == ["rick.deckard@gmail.com", "apolloclark@gmail.com"]
+
+def test_datastore_sort_nulls(test_client):
+    with test_client.application.app_context():
+        db.session.execute(insert(DatastoreModel), [
+            {"email": f"null{index}@gmail.com", "uuid": uuid.uuid4()} for index in range(3)
+        ])
+        # the inserted rows have the now() server default, so it is cleared
+        db.session.execute(
+            update(DatastoreModel)
+            .where(DatastoreModel.email.startswith("null"))
+            .values(datetime=None)
+        )
+        db.session.commit()
+    ascending = all_pages(test_client, "/datastore?sort=datetime&limit=2")
+    descending = all_pages(test_client, "/datastore?sort=-datetime&limit=2")
+    assert len(ascending) == len(set(ascending)) == 6
+    assert descending == ascending[::-1]
+    # the entries without a datetime are last
+    nulls = test_client.get("/datastore?email_prefix=null").json
+    assert ascending[3:] == [row["datastore_id"] for row in nulls]
+    test_client.post("/datastore/_delete", json={"ids": ascending[3:]})
+
+def test_datastore_filter_stream(test_client):
+    response = test_client.get("/datastore?stream=ndjson&bool=true")
+    assert len(response.data.splitlines()) == 1
+
+def test_datastore_filter_invalid(test_client):
+    assert test_client.get("/datastore?uuid=abc").status_code == 400
+    assert test_client.get("/datastore?sort=uuid").status_code == 400
+    assert test_client.get("/datastore?until=tomorrow").status_code == 400
+    assert test_client.get("/datastore?sort=email&after=3").status_code == 400
+    assert test_client.get("/datastore?sort=email&after=WzEsMl0").status_code == 400
@@ -0,0 +1,79 @@
+"""Datastore multi-get Tests"""
+import csv
+import io
+
+from sqlalchemy import event
+
+from datastore.database import db
+
+
+def count_selects(test_client, path, **kwargs):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = test_client.open(path, **kwargs)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return response, [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+def test_datastore_mget_ids_in_order(test_client, init_database):
+    response, selects = count_selects(test_client, "/datastore?ids=3,999,1,3")
+    assert response.status_code == 200
+    assert [entry.get("email") for entry in response.json] == [
+        "wayland.yutani@gmail.com", None, "apolloclark@gmail.com", "wayland.yutani@gmail.com"
+    ]
+    assert response.json[1] == {"datastore_id": 999, "found": False}
+    assert len(selects) == 1
+    assert "ETag" in response.headers
+
+def test_datastore_mget_matches_single_get(test_client):
+    response = test_client.get("/datastore?ids=2")
+    assert response.json == [test_client.get("/datastore/2").json]
+
+def test_datastore_mget_body_matches_single_gets(test_client):
+    # the same separators for the cached bodies and the markers, without newlines
+    marker = test_client.application.json.response({"datastore_id": 999, "found": False})
+    entry = test_client.get("/datastore/2").data
+    response = test_client.get("/datastore?ids=2,999")
+    assert response.data == b"[" + entry.rstrip(b"\n") + b"," + marker.get_data().rstrip(b"\n") + b"]"
+    assert b"\n," not in response.data
+
+def test_datastore_mget_cached(test_client):
+    # every entry was cached by the previous multi-get, so nothing is read
+    response, selects = count_selects(test_client, "/datastore?ids=1,3")
+    assert [entry["datastore_id"] for entry in response.json] == [1, 3]
+    assert selects == []
+
+def test_datastore_mget_post_uuids(test_client):
+    uuid = test_client.get("/datastore/2").json["uuid"]
+    missing = "00000000-0000-0000-0000-000000000000"
+    response, selects = count_selects(
+        test_client, "/datastore/_mget", method="POST", json={"uuids": [missing, uuid]}
+    )
+    assert response.status_code == 200
+    assert response.json[0] == {"uuid": missing, "found": False}
+    assert response.json[1]["datastore_id"] == 2
+    assert len(selects) == 1
+
+def test_datastore_mget_post_ids(test_client):
+    response = test_client.post("/datastore/_mget", json={"ids": [4, 2]})
+    assert [entry["datastore_id"] for entry in response.json] == [4, 2]
+
+def test_datastore_mget_csv(test_client):
+    response = test_client.get("/datastore?ids=999,1", headers={"Accept": "text/csv"})
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert rows[0]["datastore_id"] == "999"
+    assert rows[0]["found"] == "false"
+    assert rows[1]["email"] == "apolloclark@gmail.com"
+
+def test_datastore_mget_invalid(test_client):
+    for path in ("/datastore?ids=1,a", "/datastore?ids=1&uuids=x", "/datastore?uuids=x"):
+        assert test_client.get(path).status_code == 400
+    for data in ({}, {"ids": []}, {"ids": [1, True]}, {"ids": "1,2"}, [1, 2]):
+        assert test_client.post("/datastore/_mget", json=data).status_code == 400
+    response = test_client.post("/datastore/_mget", json={"ids": list(range(1001))})
+    assert response.status_code == 400
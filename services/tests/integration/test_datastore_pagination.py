@@ -0,0 +1,51 @@
+"""Datastore Controller collection pagination and streaming Tests"""
+import json
+
+
+def test_datastore_get_page(test_client, init_database):
+    response = test_client.get("/datastore?limit=2")
+    assert response.status_code == 200
+    assert [row["datastore_id"] for row in response.json] == [1, 2]
+    assert 'rel="next"' in response.headers["Link"]
+    assert "after=2" in response.headers["Link"]
+
+def test_datastore_get_next_page(test_client):
+    response = test_client.get("/datastore?limit=2&after=2")
+    assert response.status_code == 200
+    assert [row["datastore_id"] for row in response.json] == [3, 4]
+    assert "Link" not in response.headers
+
+def test_datastore_get_page_past_the_end(test_client):
+    response = test_client.get("/datastore?after=4")
+    assert response.status_code == 200
+    assert response.json == []
+
+def test_datastore_get_page_invalid_limit(test_client):
+    response = test_client.get("/datastore?limit=0")
+    assert response.status_code == 400
+    assert b"Invalid limit, it must be at least 1." in response.data
+
+def test_datastore_get_page_invalid_after(test_client):
+    response = test_client.get("/datastore?after=abc")
+    assert response.status_code == 400
+    assert b"Invalid after, it must be an int number." in response.data
+
+def test_datastore_stream_ndjson(test_client):
+    response = test_client.get("/datastore?stream=ndjson&after=1")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert [row["datastore_id"] for row in rows] == [2, 3, 4]
+
+def test_datastore_stream_json(test_client):
+    response = test_client.get("/datastore?stream=json")
+    assert response.status_code == 200
+    assert [row["email"] for row in json.loads(response.data)][0] == "apolloclark@gmail.com"
+
+def test_datastore_stream_json_empty(test_client):
+    response = test_client.get("/datastore?stream=json&after=999")
+    assert json.loads(response.data) == []
+
+def test_datastore_stream_invalid_format(test_client):
+    response = test_client.get("/datastore?stream=xml")
+    assert response.status_code == 400
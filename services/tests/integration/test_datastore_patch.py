@@ -0,0 +1,69 @@
+"""Datastore PATCH Tests"""
+
+
+def test_datastore_patch(test_client, init_database):
+    before = test_client.get("/datastore/3").json
+    response = test_client.patch("/datastore/3", json={"bool": "false"})
+    assert response.status_code == 200
+    assert response.json == dict(before, bool=False)
+    assert response.headers["ETag"] == test_client.get("/datastore/3").headers["ETag"]
+
+def test_datastore_patch_single_statement(test_client):
+    response = test_client.patch("/datastore/3", json={"email": "patched@gmail.com"})
+    assert response.status_code == 200
+    assert 'desc="1 statements"' in response.headers["Server-Timing"]
+    assert test_client.get("/datastore/3").json["email"] == "patched@gmail.com"
+
+def test_datastore_patch_increments_version(test_client):
+    etag = test_client.get("/datastore/3").headers["ETag"]
+    test_client.patch("/datastore/3", json={"bool": "true"})
+    # the stale ETag no longer matches
+    response = test_client.put("/datastore/3", json={
+        "email": "patched@gmail.com",
+        "uuid": "752346e1-df66-485e-8f49-eb749d9ab666",
+        "bool": "true",
+        "datetime": "2023-07-25T16:58:36.908339",
+    }, headers={"If-Match": etag})
+    assert response.status_code == 412
+
+def test_datastore_patch_if_match(test_client):
+    etag = test_client.get("/datastore/3").headers["ETag"]
+    response = test_client.patch(
+        "/datastore/3", json={"bool": "false"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 200
+    response = test_client.patch(
+        "/datastore/3", json={"bool": "true"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+
+def test_datastore_patch_missing(test_client):
+    response = test_client.patch("/datastore/999", json={"bool": "false"})
+    assert response.status_code == 404
+    assert b"The requested URL was not found on the server." in response.data
+
+def test_datastore_patch_invalid(test_client):
+    assert test_client.patch("/datastore/3", json={}).status_code == 400
+    response = test_client.patch("/datastore/3", json={"uuid": "x"})
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid uuid, it must be a UUID."
+    response = test_client.patch("/datastore", json={"bool": "false"})
+    assert response.status_code == 404
+
+def test_datastore_patch_conflict(test_client):
+    response = test_client.patch("/datastore/3", json={"email": "tom.jones@gmail.com"})
+    assert response.status_code == 404
+    assert response.json["message"] == "The email and UUID need to be unique."
+
+def test_datastore_patch_summary(test_client):
+    test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = True
+    try:
+        from datastore.aggregate import rebuild_summary
+
+        rebuild_summary()
+        test_client.patch("/datastore/3", json={"email": "patched@example.com"})
+        response = test_client.get("/aggregate?group_by=domain&source=summary")
+        domains = {group["key"]: group["count"] for group in response.json["groups"]}
+        assert domains["example.com"] == 1
+    finally:
+        test_client.application.config["DATASTORE_AGGREGATE_SUMMARY"] = False
@@ -0,0 +1,119 @@
+"""Datastore content negotiation and response compression Tests"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+
+def test_datastore_default_json(test_client, init_database):
+    response = test_client.get("/datastore/3", headers={"Accept": "*/*"})
+    assert response.mimetype == "application/json"
+    assert response.json["email"] == "wayland.yutani@gmail.com"
+    assert "Accept" in response.headers["Vary"]
+
+def test_datastore_unsupported_accept_is_json(test_client):
+    response = test_client.get("/datastore/3", headers={"Accept": "text/html"})
+    assert response.mimetype == "application/json"
+
+def test_datastore_ndjson(test_client):
+    response = test_client.get(
+        "/datastore?limit=2", headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert rows == test_client.get("/datastore?limit=2").json
+    assert 'rel="next"' in response.headers["Link"]
+
+def test_datastore_csv(test_client):
+    response = test_client.get("/datastore", headers={"Accept": "text/csv"})
+    assert response.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert len(rows) == 4
+    assert rows[3]["email"] == "rick.deckard@gmail.com"
+    assert rows[3]["bool"] == "false"
+
+def test_datastore_msgpack(test_client):
+    msgpack = pytest.importorskip("msgpack")
+    response = test_client.get("/datastore/3", headers={"Accept": "application/msgpack"})
+    assert response.mimetype == "application/msgpack"
+    assert msgpack.unpackb(response.data) == test_client.get("/datastore/3").json
+
+def test_datastore_representation_etag(test_client):
+    # every representation has its own ETag, derived from the JSON entry's
+    etag = test_client.get("/datastore/3").headers["ETag"]
+    response = test_client.get("/datastore/3", headers={"Accept": "text/csv"})
+    csv_etag = response.headers["ETag"]
+    assert csv_etag == etag[:-1] + '-csv"'
+    response = test_client.get(
+        "/datastore/3", headers={"Accept": "text/csv", "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    response = test_client.get(
+        "/datastore/3", headers={"Accept": "text/csv", "If-None-Match": csv_etag}
+    )
+    assert response.status_code == 304
+    # which If-Match accepts, whatever representation was read
+    response = test_client.patch(
+        "/datastore/3", json={"bool": "true"}, headers={"If-Match": csv_etag}
+    )
+    assert response.status_code == 200
+
+def test_datastore_error_representation(test_client):
+    response = test_client.get("/datastore/999", headers={"Accept": "text/csv"})
+    assert response.status_code == 404
+    assert response.mimetype == "text/csv"
+    assert response.data.decode().startswith("message\r\n")
+
+def test_compression_gzip(test_client):
+    test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 100
+    try:
+        response = test_client.get("/datastore", headers={"Accept-Encoding": "gzip"})
+    finally:
+        test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 1024
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == test_client.get("/datastore").json
+
+def test_compression_etag(test_client):
+    test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 100
+    try:
+        identity = test_client.get("/datastore").headers["ETag"]
+        headers = {"Accept-Encoding": "gzip"}
+        response = test_client.get("/datastore", headers=headers)
+        etag = response.headers["ETag"]
+        # the compressed body has its own strong ETag
+        assert etag == identity[:-1] + '-gzip"'
+        response = test_client.get("/datastore", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        response = test_client.get("/datastore", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+    finally:
+        test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 1024
+
+def test_compression_brotli(test_client):
+    brotli = pytest.importorskip("brotli")
+    test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 100
+    try:
+        response = test_client.get(
+            "/datastore", headers={"Accept-Encoding": "gzip, br"}
+        )
+    finally:
+        test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 1024
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data)) == test_client.get("/datastore").json
+
+def test_compression_min_size(test_client):
+    response = test_client.get("/datastore/3", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json["datastore_id"] == 3
+
+def test_compression_not_accepted(test_client):
+    test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 0
+    try:
+        response = test_client.get("/datastore")
+    finally:
+        test_client.application.config["DATASTORE_COMPRESSION_MIN_SIZE"] = 1024
+    assert "Content-Encoding" not in response.headers
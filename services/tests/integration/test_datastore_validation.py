@@ -0,0 +1,52 @@
+"""Datastore POST and PUT input validation Tests"""
+
+put_data = {
+    "email": "validation@gmail.com",
+    "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a111",
+    "bool": "true",
+    "datetime": "2023-07-25T16:57:36.111111",
+}
+
+
+def count(test_client):
+    return len(test_client.get("/datastore?limit=1000").json)
+
+
+def test_datastore_post_defaults(test_client, init_database):
+    response = test_client.post("/datastore", json={"email": "defaults@gmail.com"})
+    assert response.status_code == 201
+    assert response.json["bool"] is False
+    assert response.json["uuid"]
+    assert response.json["datetime"]
+
+def test_datastore_post_invalid(test_client):
+    before = count(test_client)
+    response = test_client.post(
+        "/datastore", json={"email": "invalid@gmail.com", "uuid": "not-a-uuid"}
+    )
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid uuid, it must be a UUID."
+    assert count(test_client) == before
+
+def test_datastore_post_not_json(test_client):
+    response = test_client.post("/datastore", data="email=a@gmail.com")
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid data, it must be a JSON object."
+
+def test_datastore_put_missing_field(test_client):
+    data = dict(put_data)
+    del data["datetime"]
+    response = test_client.put("/datastore/1", json=data)
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid datetime, it is required."
+    assert test_client.get("/datastore/1").json["email"] == "apolloclark@gmail.com"
+
+def test_datastore_put_invalid_before_lookup(test_client):
+    response = test_client.put("/datastore/999", json={"email": ""})
+    assert response.status_code == 400
+
+def test_datastore_put(test_client):
+    response = test_client.put("/datastore/1", json=put_data)
+    assert response.status_code == 200
+    assert response.json["bool"] is True
+    assert response.json["datetime"] == "2023-07-25T16:57:36.111111"
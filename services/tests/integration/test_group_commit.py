@@ -0,0 +1,100 @@
+"""Datastore group commit Tests"""
+import threading
+import uuid
+
+import pytest
+
+from datastore.app import create_app
+from datastore.group_commit import BATCH_SIZE, GroupCommitWriter
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app({
+        "TESTING": True,
+        "DATASTORE_GROUP_COMMIT": True,
+        "DATASTORE_GROUP_COMMIT_WAIT": 0.05,
+    })
+    yield app
+    app.extensions["datastore_group_commit"].close()
+
+def batches():
+    # the number of group commit transactions, and of the entries they inserted
+    counts = BATCH_SIZE.values.get((), [0])
+    return sum(counts[:-1]), counts[-1]
+
+def post_concurrently(app, entries):
+    responses = [None] * len(entries)
+
+    def post(index):
+        responses[index] = app.test_client().post("/datastore", json=entries[index])
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(entries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+def test_group_commit_post(test_client, init_database):
+    response = test_client.post("/datastore", json={"email": "joe.bloggs@gmail.com"})
+    assert response.status_code == 201
+    assert response.json == test_client.get(f"/datastore/{response.json['datastore_id']}").json
+    assert response.json["bool"] is False
+    assert response.json["datetime"] is not None
+
+def test_group_commit_conflict(test_client):
+    response = test_client.post("/datastore", json={"email": "joe.bloggs@gmail.com"})
+    assert response.status_code == 404
+    assert response.json["message"] == "The email and UUID need to be unique."
+
+def test_group_commit_invalid(test_client):
+    response = test_client.post("/datastore", json={"email": ""})
+    assert response.status_code == 400
+    assert response.json["message"] == "Invalid email, it is required."
+
+def test_group_commit_batches(app, test_client):
+    before = batches()
+    entries = [{"email": f"group.{index}@example.com"} for index in range(20)]
+    responses = post_concurrently(app, entries)
+    assert [response.status_code for response in responses] == [201] * 20
+    ids = {response.json["datastore_id"] for response in responses}
+    assert len(ids) == 20
+    for response, entry in zip(responses, entries):
+        assert response.json["email"] == entry["email"]
+    count, inserted = batches()
+    assert inserted - before[1] == 20
+    assert count - before[0] < 20
+
+def test_group_commit_own_conflicts(app, test_client):
+    # each request gets its own result, when others of its batch conflict
+    shared = str(uuid.uuid4())
+    entries = [
+        {"email": "shared.1@example.com", "uuid": shared},
+        {"email": "shared.2@example.com", "uuid": shared},
+        {"email": "apolloclark@gmail.com"},
+        {"email": "unique@example.com"},
+    ]
+    responses = post_concurrently(app, entries)
+    statuses = [response.status_code for response in responses]
+    assert sorted(statuses[:2]) == [201, 404]
+    assert statuses[2:] == [404, 201]
+
+def test_group_commit_queue_full(app, test_client):
+    writer = GroupCommitWriter(app, queue_size=1)
+    writer.start = lambda: None
+    writer.submit({"uuid": uuid.uuid4()})
+    previous = app.extensions["datastore_group_commit"]
+    app.extensions["datastore_group_commit"] = writer
+    try:
+        response = test_client.post("/datastore", json={"email": "shed@example.com"})
+    finally:
+        app.extensions["datastore_group_commit"] = previous
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_group_commit_metrics(test_client):
+    text = test_client.get("/metrics").data.decode()
+    assert "datastore_group_commit_batch_size_count" in text
+    assert "datastore_group_commit_queue_seconds_bucket" in text
+    assert "datastore_group_commit_queued 0" in text
@@ -0,0 +1,53 @@
+"""Request instrumentation Tests"""
+import re
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from datastore.database import db
+
+
+def test_server_timing_header(test_client, init_database):
+    response = test_client.get("/datastore?limit=2")
+    timing = response.headers["Server-Timing"]
+    assert re.match(
+        r'db;dur=[0-9.]+;desc="1 statements", serialize;dur=[0-9.]+, total;dur=[0-9.]+',
+        timing,
+    )
+
+def test_request_metrics(test_client):
+    test_client.get("/datastore/2")
+    response = test_client.get("/metrics")
+    assert re.search(
+        rb'datastore_http_request_duration_seconds_count'
+        rb'{endpoint="datastore",method="GET",status="200"} [1-9]',
+        response.data,
+    )
+    assert b'datastore_db_statements_total{endpoint="datastore",method="GET"}' in response.data
+    assert b'datastore_http_response_size_bytes_bucket{endpoint="datastore"' in response.data
+    assert b"datastore_http_request_serialize_seconds_sum" in response.data
+
+def test_failing_statement(test_client):
+    # the INSERT fails on the unique email, and is still counted
+    response = test_client.post("/datastore", json={"email": "apolloclark@gmail.com"})
+    assert response.status_code == 404
+    assert re.match(r'db;dur=[0-9.]+;desc="1 statements"', response.headers["Server-Timing"])
+    with test_client.application.app_context():
+        # the info of the pooled connection, which outlives the Connection
+        info = db.session.connection().info
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM missing_table"))
+        db.session.rollback()
+        assert db.session.execute(text("SELECT 1")).scalar() == 1
+        assert "query_start_time" not in info
+
+def test_instrumentation_disabled(monkeypatch):
+    from datastore.app import create_app
+    from datastore.config import Config
+
+    monkeypatch.setattr(Config, "DATASTORE_INSTRUMENTATION", False)
+    app = create_app()
+    response = app.test_client().get("/")
+    assert "Server-Timing" not in response.headers
+    assert app.json.instrumented is False
@@ -0,0 +1,71 @@
+"""Datastore load_db Tests"""
+import io
+
+from cli import load_db
+from datastore.load import load_rows, read_csv, read_ndjson, synthetic_rows
+from datastore.models.datastore_model import DatastoreModel
+
+
+csv_data = """email,uuid,bool,datetime
+load.csv1@gmail.com,,true,
+load.csv2@gmail.com,0446d5c1-36c4-42d3-b006-247fcaa8a555,false,2023-07-25T16:57:36.555555
+invalid,,maybe,
+"""
+
+ndjson_data = """{"email": "load.ndjson1@gmail.com", "bool": "true"}
+
+{"email": "load.ndjson2@gmail.com", "datetime": "2023-07-25T16:57:36.444444"}
+"""
+
+
+def count():
+    return DatastoreModel.query.count()
+
+
+def test_read_csv():
+    rows = list(read_csv(io.StringIO(csv_data)))
+    assert len(rows) == 3
+    assert rows[0] == {"email": "load.csv1@gmail.com", "bool": "true"}
+
+def test_read_ndjson():
+    rows = list(read_ndjson(io.StringIO(ndjson_data)))
+    assert [row["email"] for row in rows] == [
+        "load.ndjson1@gmail.com",
+        "load.ndjson2@gmail.com",
+    ]
+
+def test_load_rows_csv(test_client, init_database):
+    before = count()
+    chunks = list(load_rows(read_csv(io.StringIO(csv_data)), chunk_size=1))
+    assert chunks == [(1, 0), (1, 0), (0, 1)]
+    assert count() == before + 2
+    entry = DatastoreModel.query.filter_by(email="load.csv2@gmail.com").one()
+    assert str(entry.uuid) == "0446d5c1-36c4-42d3-b006-247fcaa8a555"
+    assert entry.bool is False
+    assert entry.datetime.isoformat() == "2023-07-25T16:57:36.555555"
+    assert entry.version == 1
+    assert DatastoreModel.query.filter_by(email="load.csv1@gmail.com").one().datetime
+
+def test_load_rows_synthetic(test_client):
+    before = count()
+    chunks = list(load_rows(synthetic_rows(25), chunk_size=10))
+    assert chunks == [(10, 0), (10, 0), (5, 0)]
+    assert count() == before + 25
+    response = test_client.get(f"/datastore?after={before}&limit=100")
+    assert response.status_code == 200
+
+def test_load_db_command(app, tmp_path):
+    path = tmp_path / "rows.ndjson"
+    path.write_text(ndjson_data)
+    runner = app.test_cli_runner()
+    result = runner.invoke(load_db, [str(path), "--rows", "3"])
+    assert result.exit_code == 0, result.output
+    assert "Loaded 5 rows" in result.output
+
+def test_load_db_command_conflict(app, tmp_path):
+    path = tmp_path / "rows.ndjson"
+    path.write_text(ndjson_data)
+    runner = app.test_cli_runner()
+    result = runner.invoke(load_db, [str(path)])
+    assert result.exit_code == 1
+    assert "The email and UUID need to be unique, 0 rows were loaded." in result.output
@@ -0,0 +1,17 @@
+"""Metrics endpoint Tests"""
+
+
+def test_metrics_pool(test_client, init_database):
+    test_client.get("/datastore/1")
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"# TYPE datastore_db_pool_checkout_wait_seconds histogram" in response.data
+    assert b"datastore_db_pool_size 5" in response.data
+    assert b"datastore_db_pool_checkedout " in response.data
+    assert b'datastore_db_pool_checkout_seconds_bucket{le="+Inf"}' in response.data
+
+def test_metrics_cache(test_client):
+    test_client.get("/datastore/1")
+    response = test_client.get("/metrics")
+    assert b'datastore_cache_hits{backend="lru"} 1' in response.data
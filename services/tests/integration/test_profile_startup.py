@@ -0,0 +1,27 @@
+"""profile_startup command Tests"""
+from cli import import_times, profile_startup
+
+
+def test_import_times():
+    imports = import_times("datastore.validation")
+    names = [name for _, _, name in imports]
+    assert names[-1] == "datastore.validation"
+    assert all(own <= cumulative for own, cumulative, _ in imports)
+
+def test_lazy_imports():
+    names = [name for _, _, name in import_times("datastore.app")]
+    assert "marshmallow" not in names
+    assert "datastore.schemas" not in names
+
+def test_profile_startup(app):
+    runner = app.test_cli_runner()
+    # the target is generous, so a slow test machine does not fail the test
+    result = runner.invoke(
+        profile_startup, ["--runs", "1", "--top", "3", "--target", "60000"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "[INFO] Importing datastore.app took" in result.output
+    assert "Cold start to a first response, median of 1" in result.output
+    result = runner.invoke(profile_startup, ["--runs", "1", "--target", "0"])
+    assert result.exit_code == 1
+    assert "The cold start is over the target." in result.output
@@ -0,0 +1,66 @@
+"""Datastore rate limiting and load shedding Tests"""
+import time
+
+import pytest
+
+from datastore.app import create_app
+from datastore.database import db
+from datastore.ratelimit import in_flight
+
+
+@pytest.fixture()
+def limited_app(init_database):
+    return create_app({
+        "TESTING": True,
+        "DATASTORE_RATE_LIMIT_BACKEND": "memory",
+        "DATASTORE_RATE_LIMIT_RATE": 0.001,
+        "DATASTORE_RATE_LIMIT_BURST": 5,
+        "DATASTORE_SHED_IN_FLIGHT": 2,
+        "DATASTORE_SHED_POOL_WAIT": 0.5,
+    })
+
+def test_rate_limit(limited_app):
+    client = limited_app.test_client()
+    for _ in range(5):
+        assert client.get("/datastore/1").status_code == 200
+    response = client.get("/datastore/1")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1000
+    assert response.json["message"].startswith("Too many requests, retry after")
+    # another API key has its own bucket, and /metrics is never limited
+    assert client.get("/datastore/1", headers={"X-API-Key": "k"}).status_code == 200
+    body = client.get("/metrics").data.decode()
+    assert 'datastore_http_rejected_total{reason="rate_limit"}' in body
+
+def test_rate_limit_cost(limited_app):
+    client = limited_app.test_client()
+    # a page of the collection costs 5 tokens, a POST to it only 1
+    assert client.get("/datastore").status_code == 200
+    assert client.get("/datastore").status_code == 429
+    assert client.post("/datastore", json={}).status_code == 429
+
+def test_shed_in_flight(limited_app):
+    client = limited_app.test_client()
+    assert in_flight.enter(0)
+    assert in_flight.enter(0)
+    try:
+        response = client.get("/", headers={"X-API-Key": "shed"})
+    finally:
+        in_flight.exit()
+        in_flight.exit()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/", headers={"X-API-Key": "shed"}).status_code == 200
+    assert in_flight.count == 0
+
+def test_shed_pool_wait(limited_app):
+    client = limited_app.test_client()
+    with limited_app.app_context():
+        pool = db.engine.pool
+    pool.wait_average = 1.0
+    pool.wait_updated = time.perf_counter()
+    response = client.get("/", headers={"X-API-Key": "pool"})
+    assert response.status_code == 503
+    # the average is only recent for 1 second after a checkout
+    pool.wait_updated -= 2
+    assert client.get("/", headers={"X-API-Key": "pool"}).status_code == 200
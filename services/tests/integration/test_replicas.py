@@ -0,0 +1,90 @@
+"""Datastore read replica routing Tests"""
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from datastore.app import create_app
+from datastore.database import db
+from datastore.models.datastore_model import DatastoreModel
+from datastore.replicas import PIN_COOKIE
+
+
+@pytest.fixture(scope="module")
+def replica_client(init_database, tmp_path_factory):
+    replica = tmp_path_factory.mktemp("replica") / "replica.db"
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_BINDS": {
+            "replica_0": f"sqlite:///{replica}",
+            # a replica which cannot be connected to
+            "replica_1": f"sqlite:///{replica.parent}/missing/replica.db",
+        },
+        "DATASTORE_CACHE_BACKEND": "none",
+        "DATASTORE_REPLICA_CHECK_INTERVAL": 0,
+    })
+    with app.app_context():
+        engine = db.engines["replica_0"]
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                insert(DatastoreModel.__table__),
+                {"datastore_id": 1, "email": "replica@gmail.com",
+                 "uuid": uuid.UUID("0446d5c1-36c4-42d3-b006-247fcaa8a111"), "version": 1},
+            )
+    with app.test_client() as client:
+        yield client
+
+def test_replica_get(replica_client):
+    # the broken replica is skipped, every read goes to the healthy one
+    for _ in range(3):
+        response = replica_client.get("/datastore/1")
+        assert response.status_code == 200
+        assert response.json["email"] == "replica@gmail.com"
+
+def test_replica_aggregate(replica_client):
+    assert replica_client.get("/aggregate").json["count"] == 1
+
+def test_replica_status_metrics(replica_client):
+    body = replica_client.get("/metrics").data.decode()
+    assert 'datastore_db_replica_up{database="replica_0"} 1' in body
+    assert 'datastore_db_replica_up{database="replica_1"} 0' in body
+    assert 'datastore_db_queries_total{database="replica_0"}' in body
+
+def test_replica_read_your_writes(replica_client):
+    writer = {"X-API-Key": "writer"}
+    response = replica_client.post("/datastore", headers=writer, json={
+        "email": "primary@gmail.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a222",
+        "bool": "true",
+        "datetime": "2023-07-25T16:57:36.222222",
+    })
+    assert response.status_code == 201
+    assert PIN_COOKIE in response.headers["Set-Cookie"]
+    # the pinned client reads its write, and every other entry, from the primary
+    path = f"/datastore/{response.json['datastore_id']}"
+    assert replica_client.get(path).json["email"] == "primary@gmail.com"
+    assert replica_client.get("/datastore/1").json["email"] == "apolloclark@gmail.com"
+
+    # another client, without the cookie, reads the replica
+    replica_client.delete_cookie(PIN_COOKIE)
+    reader = {"X-API-Key": "reader"}
+    assert replica_client.get(path, headers=reader).status_code == 404
+    assert replica_client.get("/datastore/1", headers=reader).json["email"] == "replica@gmail.com"
+    assert replica_client.delete(path, headers=writer).status_code == 200
+
+def test_replica_read_your_writes_without_cookies(replica_client):
+    client = replica_client.application.test_client(use_cookies=False)
+    writer = {"X-API-Key": "cookieless"}
+    response = client.post("/datastore", headers=writer, json={
+        "email": "cookieless@gmail.com",
+        "uuid": "0446d5c1-36c4-42d3-b006-247fcaa8a333",
+        "bool": "true",
+        "datetime": "2023-07-25T16:57:36.333333",
+    })
+    assert response.status_code == 201
+    # the client is pinned by its API key, as it does not send the cookie back
+    path = f"/datastore/{response.json['datastore_id']}"
+    assert client.get(path, headers=writer).json["email"] == "cookieless@gmail.com"
+    assert client.get(path, headers={"X-API-Key": "other"}).status_code == 404
+    assert client.delete(path, headers=writer).status_code == 200
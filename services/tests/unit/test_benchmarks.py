@@ -0,0 +1,35 @@
+"""Benchmark suite regression comparison Tests"""
+from benchmarks.suite import compare, latency_stats
+
+
+baseline = {
+    "endpoint.get_one.rows=1000": {"throughput": 500.0, "p50_ms": 2.0, "p99_ms": 4.0},
+    "micro.strtobool": {"ns_per_op": 100.0},
+}
+
+
+def test_latency_stats():
+    stats = latency_stats([0.002, 0.001, 0.004, 0.003])
+    assert stats["requests"] == 4
+    assert stats["throughput"] == 400.0
+    assert stats["p50_ms"] == 2.5
+    assert stats["p99_ms"] == 3.0
+
+def test_compare_within_threshold():
+    current = {
+        "endpoint.get_one.rows=1000": {"throughput": 450.0, "p50_ms": 9.0, "p99_ms": 4.5},
+        "micro.strtobool": {"ns_per_op": 110.0},
+    }
+    assert compare(baseline, current, 0.2) == []
+
+def test_compare_regressions():
+    current = {
+        "endpoint.get_one.rows=1000": {"throughput": 350.0, "p50_ms": 2.0, "p99_ms": 6.0},
+        "micro.strtobool": {"ns_per_op": 130.0},
+        "micro.new": {"ns_per_op": 1.0},
+    }
+    assert compare(baseline, current, 0.2) == [
+        ("endpoint.get_one.rows=1000", "throughput", 500.0, 350.0),
+        ("endpoint.get_one.rows=1000", "p99_ms", 4.0, 6.0),
+        ("micro.strtobool", "ns_per_op", 100.0, 130.0),
+    ]
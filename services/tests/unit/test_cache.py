@@ -0,0 +1,104 @@
+"""Datastore entry cache backend Tests"""
+from datastore.cache import LRUCache, RedisCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Dict based stand-in for the subset of redis.Redis used by RedisCache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def hget(self, name, key):
+        return self.data.get(name, {}).get(key)
+
+    def eval(self, script, numkeys, name, version, value, ex):
+        current = self.data.get(name)
+        if current is not None and current["version"] > version:
+            return 0
+        self.data[name] = {"version": version, "value": value}
+        return 1
+
+    def set(self, name, value):
+        self.data[name] = value
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+    def scan_iter(self, match):
+        return [name for name in list(self.data) if name.startswith(match[:-1])]
+
+
+def test_lru_cache_hit_and_miss():
+    cache = LRUCache(max_size=2)
+    assert cache.get(1) is None
+    cache.set(1, b"one", 1)
+    assert cache.get(1) == b"one"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set(1, b"one", 1)
+    cache.set(2, b"two", 1)
+    cache.get(1)
+    cache.set(3, b"three", 1)
+    assert cache.get(2) is None
+    assert cache.get(1) == b"one"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+def test_lru_cache_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(ttl=10, clock=clock)
+    cache.set(1, b"one", 1)
+    clock.now = 9.9
+    assert cache.get(1) == b"one"
+    clock.now = 10
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 0
+
+def test_lru_cache_keeps_newer_version():
+    cache = LRUCache()
+    cache.set(1, b"one", 1)
+    # a writer committed version 2, so a reader of version 1 cannot cache it
+    cache.delete(1, 2)
+    assert cache.get(1) is None
+    cache.set(1, b"stale", 1)
+    assert cache.get(1) is None
+    cache.set(1, b"two", 2)
+    assert cache.get(1) == b"two"
+    cache.set(1, b"stale", 1)
+    assert cache.get(1) == b"two"
+
+def test_lru_cache_tombstone_expires():
+    clock = FakeClock()
+    cache = LRUCache(ttl=10, clock=clock)
+    cache.delete(1, 2)
+    clock.now = 10
+    cache.set(1, b"one", 1)
+    assert cache.get(1) == b"one"
+
+def test_redis_cache():
+    client = FakeRedis()
+    cache = RedisCache(client)
+    cache.set(1, b"one", 1)
+    assert client.data == {"datastore:1": {"version": 1, "value": b"one"}}
+    assert cache.get(1) == b"one"
+    cache.delete(1, 2)
+    assert cache.get(1) is None
+    cache.set(1, b"stale", 1)
+    assert cache.get(1) is None
+    cache.set(2, b"two", 1)
+    client.set("other", b"value")
+    cache.clear()
+    assert client.data == {"other": b"value"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
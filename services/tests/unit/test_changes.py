@@ -0,0 +1,31 @@
+"""Change feed notifier Tests"""
+import threading
+
+from datastore.changes import ChangeNotifier
+
+
+def test_notifier_wait_timeout():
+    notifier = ChangeNotifier()
+    assert notifier.wait(notifier.count, 0.01) is False
+
+def test_notifier_missed_notify():
+    # a commit between reading the count and waiting is not missed
+    notifier = ChangeNotifier()
+    seen = notifier.count
+    notifier.notify()
+    assert notifier.wait(seen, 0) is True
+
+def test_notifier_wakes_up_waiters():
+    notifier = ChangeNotifier()
+    seen = notifier.count
+    results = []
+    waiters = [
+        threading.Thread(target=lambda: results.append(notifier.wait(seen, 10)))
+        for _ in range(3)
+    ]
+    for waiter in waiters:
+        waiter.start()
+    notifier.notify()
+    for waiter in waiters:
+        waiter.join()
+    assert results == [True, True, True]
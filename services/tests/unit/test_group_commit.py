@@ -0,0 +1,44 @@
+"""Group commit writer batching Tests"""
+import queue
+
+import pytest
+
+from datastore.group_commit import GroupCommitWriter
+
+
+def writer_with_queue(*uuids, **kwargs):
+    writer = GroupCommitWriter(None, **kwargs)
+    writer.start = lambda: None
+    futures = [writer.submit({"uuid": uuid}) for uuid in uuids]
+    return writer, futures
+
+def test_next_batch_max_size():
+    writer, _ = writer_with_queue(1, 2, 3, max_size=2, max_wait=0)
+    assert [values["uuid"] for values, _, _ in writer.next_batch()] == [1, 2]
+    assert [values["uuid"] for values, _, _ in writer.next_batch()] == [3]
+
+def test_next_batch_close():
+    writer, _ = writer_with_queue(1)
+    writer.queue.put(None)
+    assert len(writer.next_batch()) == 1
+    assert writer.stopped
+
+def test_queue_full():
+    writer, _ = writer_with_queue(1, queue_size=1)
+    with pytest.raises(queue.Full):
+        writer.submit({"uuid": 2})
+
+def test_write_splits_shared_uuids():
+    writer, _ = writer_with_queue(1, 2, 1, 3)
+    chunks = []
+    writer.write_chunk = lambda chunk: chunks.append([item[0]["uuid"] for item in chunk])
+    writer.write(writer.next_batch())
+    assert chunks == [[1, 2], [1, 3]]
+
+def test_write_chunk_error():
+    # an app which cannot be used fails the requests of the chunk
+    writer, futures = writer_with_queue(1, 2)
+    writer.write_chunk(writer.next_batch())
+    for future in futures:
+        with pytest.raises(AttributeError):
+            future.result(0)
@@ -0,0 +1,33 @@
+"""Prometheus metrics Tests"""
+from datastore.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05, method="GET")
+    histogram.observe(0.5, method="GET")
+    histogram.observe(5, method="GET")
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    labels = (("method", "GET"),)
+    assert samples[("latency_seconds_bucket", labels + (("le", 0.1),))] == 1
+    assert samples[("latency_seconds_bucket", labels + (("le", 1.0),))] == 2
+    assert samples[("latency_seconds_bucket", labels + (("le", "+Inf"),))] == 3
+    assert samples[("latency_seconds_count", labels)] == 3
+    assert samples[("latency_seconds_sum", labels)] == 5.55
+
+def test_registry_render():
+    registry = Registry()
+    counter = registry.register(Counter("requests_total", "Requests."))
+    registry.register(Gauge("size", "Size.", lambda: 3))
+    registry.register(Gauge("missing", "Missing.", lambda: None))
+    counter.inc(path='/a"b')
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/a\\"b"} 1\n'
+        "# HELP size Size.\n"
+        "# TYPE size gauge\n"
+        "size 3\n"
+        "# HELP missing Missing.\n"
+        "# TYPE missing gauge\n"
+    )
@@ -0,0 +1,60 @@
+"""Token bucket rate limiter backend Tests"""
+from datastore.ratelimit import MemoryRateLimiter, RedisRateLimiter, take_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Dict based stand-in for the eval() of the token bucket script."""
+
+    def __init__(self):
+        self.data = {}
+
+    def eval(self, script, numkeys, key, rate, burst, cost, now):
+        tokens, updated = self.data.get(key, (burst, now))
+        tokens, taken = take_tokens(tokens, updated, now, rate, burst, cost)
+        self.data[key] = (tokens, now)
+        return [int(taken), str(tokens)]
+
+
+def test_take_tokens():
+    assert take_tokens(5, 0, 0, 1, 10, 2) == (3, True)
+    assert take_tokens(1, 0, 0, 1, 10, 2) == (1, False)
+    # refilled for 3 seconds, up to the burst
+    assert take_tokens(1, 0, 3, 1, 10, 2) == (2, True)
+    assert take_tokens(1, 0, 60, 1, 10, 2) == (8, True)
+
+def test_memory_rate_limiter():
+    clock = FakeClock()
+    limiter = MemoryRateLimiter(rate=2, burst=4, clock=clock)
+    assert [limiter.take("a", 1) for _ in range(4)] == [0.0] * 4
+    assert limiter.take("a", 1) == 0.5
+    # another client has its own bucket
+    assert limiter.take("b", 4) == 0.0
+    clock.now = 1.0
+    assert limiter.take("a", 2) == 0.0
+    assert limiter.take("a", 2) == 1.0
+
+def test_memory_rate_limiter_max_clients():
+    limiter = MemoryRateLimiter(rate=1, burst=1, max_clients=2, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        assert limiter.take(key, 1) == 0.0
+    assert list(limiter.buckets) == ["b", "c"]
+    # the forgotten client starts again with a full bucket
+    assert limiter.take("a", 1) == 0.0
+
+def test_redis_rate_limiter():
+    clock = FakeClock()
+    client = FakeRedis()
+    limiter = RedisRateLimiter(client, rate=1, burst=2, clock=clock)
+    assert limiter.take("a", 2) == 0.0
+    assert limiter.take("a", 1) == 1.0
+    assert list(client.data) == ["ratelimit:a"]
+    clock.now = 1.0
+    assert limiter.take("a", 1) == 0.0
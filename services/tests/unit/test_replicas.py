@@ -0,0 +1,94 @@
+"""Read replica health and round-robin Tests"""
+from contextlib import contextmanager
+
+from sqlalchemy.exc import OperationalError
+
+from datastore.replicas import MemoryPins, RedisPins, ReplicaSet
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEngine:
+    """Stand-in for an Engine, whose connections fail while it is down."""
+
+    def __init__(self):
+        self.up = True
+        self.checks = 0
+
+    @contextmanager
+    def connect(self):
+        self.checks += 1
+        if not self.up:
+            raise OperationalError("SELECT 1", {}, Exception("down"))
+        yield self
+
+    def execute(self, statement):
+        pass
+
+
+class FakeRedis:
+    """Dict based stand-in for the set() and exists() of the pins."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, px=None):
+        self.data[key] = (value, px)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+
+def test_replicas_round_robin():
+    engines = {"replica_0": FakeEngine(), "replica_1": FakeEngine()}
+    replicas = ReplicaSet(engines, clock=FakeClock())
+    assert [replicas.choose() for _ in range(4)] == ["replica_0", "replica_1"] * 2
+    # each replica is only checked once per check_interval
+    assert [engine.checks for engine in engines.values()] == [1, 1]
+
+def test_replicas_failover_and_retry():
+    clock = FakeClock()
+    engines = {"replica_0": FakeEngine(), "replica_1": FakeEngine()}
+    replicas = ReplicaSet(engines, check_interval=5, retry_interval=30, clock=clock)
+    engines["replica_1"].up = False
+    assert [replicas.choose() for _ in range(4)] == ["replica_0"] * 4
+    assert replicas.status() == {
+        (("database", "replica_0"),): 1,
+        (("database", "replica_1"),): 0,
+    }
+    engines["replica_1"].up = True
+    clock.now = 31
+    assert {replicas.choose() for _ in range(2)} == {"replica_0", "replica_1"}
+
+def test_replicas_all_down():
+    engines = {"replica_0": FakeEngine()}
+    replicas = ReplicaSet(engines, clock=FakeClock())
+    replicas.mark_down("replica_0")
+    assert replicas.choose() is None
+    assert engines["replica_0"].checks == 0
+def test_memory_pins():
+    clock = FakeClock()
+    pins = MemoryPins(max_clients=2, clock=clock)
+    pins.pin("addr:1", 5)
+    assert pins.pinned("addr:1")
+    assert not pins.pinned("addr:2")
+    clock.now = 5
+    assert not pins.pinned("addr:1")
+    # the latest clients are kept
+    for key in ("a", "b", "c"):
+        pins.pin(key, 5)
+    assert list(pins.expires) == ["b", "c"]
+
+def test_redis_pins():
+    client = FakeRedis()
+    pins = RedisPins(client)
+    pins.pin("key:abc", 5)
+    assert client.data == {"primary:key:abc": (b"1", 5000)}
+    assert pins.pinned("key:abc")
+    assert not pins.pinned("key:other")
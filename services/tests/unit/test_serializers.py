@@ -0,0 +1,34 @@
+"""Fast-path serializer Tests"""
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from datastore.models.datastore_model import DatastoreModel
+from datastore.schemas import datastore_schema
+from datastore.serializers import FastJSONProvider, dump_row
+
+
+def make_entry(email="apolloclark@gmail.com", datetime=datetime(2023, 7, 25, 16, 57)):
+    entry = DatastoreModel(
+        email=email, uuid="752346e1-df66-485e-8f49-eb749d9ab666", bool="true"
+    )
+    entry.datastore_id = 1
+    entry.datetime = datetime
+    return entry
+
+def test_dump_row_matches_schema():
+    for entry in (make_entry(), make_entry(datetime=None)):
+        assert dump_row(entry) == datastore_schema.dump(entry)
+
+def test_fast_json_provider_matches_default(app):
+    entries = [
+        dump_row(make_entry()),
+        dump_row(make_entry(email="jörg.müller@gmail.com")),
+        {"datetime": datetime(2023, 7, 25), "id": 2**70},
+    ]
+    with app.app_context():
+        for debug in (False, True):
+            app.debug = debug
+            for entry in entries:
+                expected = DefaultJSONProvider(app).response(entry).get_data()
+                assert FastJSONProvider(app).response(entry).get_data() == expected
@@ -0,0 +1,56 @@
+"""Datastore entry input validation Tests"""
+import uuid
+from datetime import datetime
+
+import pytest
+
+from datastore.validation import FIELD_PARSERS, ValidationError, parse_entry
+
+
+def test_parse_entry():
+    fields = parse_entry({
+        "email": "apolloclark@gmail.com",
+        "uuid": "752346e1-df66-485e-8f49-eb749d9ab666",
+        "bool": "TRUE",
+        "datetime": "2023-07-25T16:58:36.908339",
+        "ignored": "value",
+    })
+    assert fields == {
+        "email": "apolloclark@gmail.com",
+        "uuid": uuid.UUID("752346e1-df66-485e-8f49-eb749d9ab666"),
+        "bool": True,
+        "datetime": datetime(2023, 7, 25, 16, 58, 36, 908339),
+    }
+
+def test_parse_entry_missing_and_empty_fields():
+    assert parse_entry({"email": "a@gmail.com", "uuid": "", "bool": None}) == {
+        "email": "a@gmail.com"
+    }
+
+def test_parse_entry_json_types():
+    fields = parse_entry({"email": "a@gmail.com", "bool": False})
+    assert fields["bool"] is False
+
+def test_parse_entry_utc_datetime():
+    fields = parse_entry({"email": "a@gmail.com", "datetime": "2023-07-25T18:58:36+02:00"})
+    assert fields["datetime"] == datetime(2023, 7, 25, 16, 58, 36)
+
+def test_parse_entry_required():
+    with pytest.raises(ValidationError, match="Invalid email, it is required."):
+        parse_entry({})
+    with pytest.raises(ValidationError, match="Invalid uuid, it is required."):
+        parse_entry({"email": "a@gmail.com"}, required=FIELD_PARSERS)
+
+@pytest.mark.parametrize("data, message", [
+    ([], "Invalid data, it must be a JSON object."),
+    ({"email": 1}, "Invalid email, it must be a non-empty string"),
+    ({"email": "a" * 129}, "Invalid email, it must be a non-empty string"),
+    ({"email": "a@gmail.com", "uuid": "x"}, "Invalid uuid, it must be a UUID."),
+    ({"email": "a@gmail.com", "uuid": 1}, "Invalid uuid, it must be a UUID."),
+    ({"email": "a@gmail.com", "bool": "maybe"}, "Invalid bool, it must be true or false."),
+    ({"email": "a@gmail.com", "bool": 1}, "Invalid bool, it must be true or false."),
+    ({"email": "a@gmail.com", "datetime": "x"}, "Invalid datetime, it must be an ISO"),
+])
+def test_parse_entry_invalid(data, message):
+    with pytest.raises(ValidationError, match=message):
+        parse_entry(data)